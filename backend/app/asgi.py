@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# Route the API to the async views (see ASYNC_API in settings)
+os.environ.setdefault('ASYNC_API', 'True')
 
 application = get_asgi_application()
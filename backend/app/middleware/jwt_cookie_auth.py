@@ -1,28 +1,54 @@
-from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.models import AnonymousUser, User
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from auth_app.authentication import CookieJWTAuthentication
+from auth_app.metrics import timed
 
 class JWTAuthenticationMiddleware:
     """
     Middleware to authenticate users based on JWT stored in cookies.
     This middleware checks for a JWT in the request cookies and sets the user
-    in the request object if the token is valid. It also injects the token into
-    the request headers so that Django Rest Framework's JWT authentication
-    can process it.
+    in the request object if the token is valid. The token is verified only once:
+    the resulting `(user, validated_token)` pair is stored on the request as
+    `jwt_auth`, where `CookieJWTAuthentication` picks it up for Django Rest
+    Framework views instead of decoding the token again.
+    The middleware runs natively in both sync (WSGI) and async (ASGI) stacks, so
+    it never forces a thread hop onto async views. Without `AuthenticationMiddleware`
+    (API-only profile), requests without a valid token get an `AnonymousUser`.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.authenticator = CookieJWTAuthentication()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         token = request.COOKIES.get('access')
         if token:
             try:
-                validated_token = AccessToken(token)
-                user_id = validated_token['user_id']
-                request.user = User.objects.get(id=user_id)
-
-                # Inject the Authorization header so DRF's JWT auth sees it
-                request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
-                
-            except Exception:
+                with timed('auth'):
+                    request.jwt_auth = self.authenticator.authenticate_token(token)
+                request.user = request.jwt_auth[0]
+            except (InvalidToken, AuthenticationFailed):
                 request.user = AnonymousUser()
+        elif not hasattr(request, 'user'):
+            request.user = AnonymousUser()
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = request.COOKIES.get('access')
+        if token:
+            try:
+                with timed('auth'):
+                    request.jwt_auth = await self.authenticator.aauthenticate_token(token)
+                request.user = request.jwt_auth[0]
+            except (InvalidToken, AuthenticationFailed):
+                request.user = AnonymousUser()
+        elif not hasattr(request, 'user'):
+            request.user = AnonymousUser()
+        return await self.get_response(request)
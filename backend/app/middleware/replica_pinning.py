@@ -0,0 +1,67 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from auth_app.replicas import ReadState, current_read_state
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPinningMiddleware:
+    """
+    Middleware giving clients read-your-writes consistency with read replicas.
+
+    Each request gets a fresh `ReadState` for `auth_app.replicas.ReplicaRouter`.
+    Requests other than GET / HEAD / OPTIONS read from the primary, and so do
+    requests carrying the `REPLICA_PIN_COOKIE`: a response to a request that
+    wrote to users or to-dos sets it for `REPLICA_PIN_SECONDS`, which should
+    exceed the replication lag. A create followed by an immediate list thus
+    sees the new to-do, whichever worker serves the list.
+    The middleware removes itself from the stack when no replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.cookie = settings.REPLICA_PIN_COOKIE
+        self.max_age = settings.REPLICA_PIN_SECONDS
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.read_state(request)
+        token = current_read_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_read_state.reset(token)
+        return self.pin(response, state)
+
+    async def __acall__(self, request):
+        state = self.read_state(request)
+        token = current_read_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_read_state.reset(token)
+        return self.pin(response, state)
+
+    def read_state(self, request):
+        return ReadState(pinned=request.method not in SAFE_METHODS or self.cookie in request.COOKIES)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                self.cookie,
+                '1',
+                max_age=self.max_age,
+                httponly=True,
+                secure=settings.SESSION_COOKIE_SECURE,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,117 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from auth_app.metrics import (
+    RequestTimings, current_timings, install_db_instrumentation, registry, server_timing_header,
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware recording per-request timings, query counts and cache hits.
+
+    It must come first in `MIDDLEWARE`, so that its timing covers the whole
+    stack, with `ViewTimingMiddleware` last. Each request is aggregated per route
+    into the in-process registry exposed at `/metrics`; with `SERVER_TIMING`
+    the phase timings are also sent back in a `Server-Timing` header.
+    Both middlewares remove themselves from the stack when `REQUEST_METRICS`
+    is off, so disabled instrumentation costs nothing per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.server_timing = settings.SERVER_TIMING
+        install_db_instrumentation()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.record(request, response, timings)
+
+    def record(self, request, response, timings):
+        phases = timings.finish()
+        match = request.resolver_match
+        # Label by route pattern, not path, to keep the number of series bounded
+        route = '/' + match.route if match else '<unmatched>'
+        registry.observe(request.method, route, response.status_code, phases, timings)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing_header(phases, timings)
+        return response
+
+
+class ViewTimingMiddleware:
+    """
+    Marks where the view and the rendering start and end for
+    `RequestMetricsMiddleware`. Must be the last entry of `MIDDLEWARE`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Hooks must match the handler's mode, or Django adapts them with a thread hop
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.stop_view()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.stop_view()
+        return response
+
+    def stop_view(self):
+        # Views returning a plain HttpResponse end here; template responses at render
+        timings = current_timings.get()
+        if timings is not None:
+            timings.stop_view()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.start_view()
+        return None
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.start_render()
+            response.add_post_render_callback(timings.stop_render)
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return ViewTimingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+    async def aprocess_template_response(self, request, response):
+        return ViewTimingMiddleware.process_template_response(self, request, response)
@@ -1,9 +1,21 @@
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+SECURITY_HEADERS = {
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'X-Content-Type-Options': 'nosniff',
+    'Referrer-Policy': 'no-referrer',
+    'Content-Security-Policy': "default-src 'self'",
+    'Permissions-Policy': 'camera=(), microphone=(), geolocation=()',
+    'Cross-Origin-Opener-Policy': 'same-origin',
+    'Cross-Origin-Embedder-Policy': 'require-corp',
+    'Cross-Origin-Resource-Policy': 'same-origin',
+}
 
 # This middleware adds security headers to all responses
-class SecurityHeadersMiddleware(MiddlewareMixin):
+class SecurityHeadersMiddleware:
     """
-    SecurityHeadersMiddleware is a Django middleware class that adds various security-related HTTP headers 
+    SecurityHeadersMiddleware is a Django middleware class that adds various security-related HTTP headers
     to the response to enhance the security of the application.
 
     Headers added:
@@ -15,17 +27,36 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
     - Cross-Origin-Opener-Policy: Ensures the document is isolated from cross-origin resources to prevent cross-origin attacks.
     - Cross-Origin-Embedder-Policy: Requires all resources to be CORS-compatible or same-origin.
     - Cross-Origin-Resource-Policy: Restricts which origins can access the resources to prevent data leaks.
+    - X-Frame-Options: Forbids framing the responses, when `XFrameOptionsMiddleware` is not in use (API-only profile).
 
-    This middleware is designed to improve the security posture of the application by setting these headers 
+    This middleware is designed to improve the security posture of the application by setting these headers
     on every HTTP response.
+
+    The header block is built once, at startup, and set on each response
+    through the public header API. The middleware runs natively in both sync
+    (WSGI) and async (ASGI) stacks.
     """
-    def process_response(self, request, response):
-        response["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains" 
-        response["X-Content-Type-Options"] = "nosniff"
-        response["Referrer-Policy"] = "no-referrer"
-        response["Content-Security-Policy"] = "default-src 'self'"
-        response["Permissions-Policy"] = "camera=(), microphone=(), geolocation=()"
-        response["Cross-Origin-Opener-Policy"] = "same-origin"
-        response["Cross-Origin-Embedder-Policy"] = "require-corp"
-        response["Cross-Origin-Resource-Policy"] = "same-origin"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        headers = dict(SECURITY_HEADERS)
+        if 'django.middleware.clickjacking.XFrameOptionsMiddleware' not in settings.MIDDLEWARE:
+            headers['X-Frame-Options'] = getattr(settings, 'X_FRAME_OPTIONS', 'DENY').upper()
+        self.headers = headers
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(await self.get_response(request))
+
+    def add_headers(self, response):
+        for name, value in self.headers.items():
+            response[name] = value
         return response
@@ -54,9 +54,11 @@ INSTALLED_APPS += ['auth_app', 'ratelimit']
 
 # Middleware to handle CORS and security headers
 MIDDLEWARE = [
+    'app.middleware.request_metrics.RequestMetricsMiddleware', # Request timings and /metrics (must stay first)
     'corsheaders.middleware.CorsMiddleware', # CORS middleware
     'django.middleware.security.SecurityMiddleware', # Security middleware
     'app.middleware.security_headers.SecurityHeadersMiddleware', # Custom security headers middleware
+    'app.middleware.replica_pinning.ReplicaPinningMiddleware', # Read-your-writes with read replicas
     'django.contrib.sessions.middleware.SessionMiddleware', # Session middleware
     'django.middleware.common.CommonMiddleware', # Common middleware
     'django.middleware.csrf.CsrfViewMiddleware', # CSRF middleware
@@ -64,8 +66,32 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware', # Messages middleware
     'django.middleware.clickjacking.XFrameOptionsMiddleware', # Clickjacking protection
     'app.middleware.jwt_cookie_auth.JWTAuthenticationMiddleware', # Custom JWT authentication middleware
+    'app.middleware.request_metrics.ViewTimingMiddleware', # View / render timings for RequestMetricsMiddleware (must stay last)
 ]
 
+# API-only profile: serve nothing but the JSON API, authenticated by the JWT cookies. It
+# leaves out the admin and the apps and middleware only the admin needs (sessions,
+# messages, static files, session authentication, clickjacking protection): workers start
+# faster and every request runs a shorter middleware chain. CORS, CSRF and the security
+# headers stay, X-Frame-Options included (sent by SecurityHeadersMiddleware then). Run the
+# admin from a separate deployment with the profile off; both share the database.
+API_ONLY = os.getenv('API_ONLY', 'False').lower() in ('true', '1', 'yes')
+API_ONLY_EXCLUDED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+API_ONLY_EXCLUDED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+if API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_ONLY_EXCLUDED_APPS]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in API_ONLY_EXCLUDED_MIDDLEWARE]
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -83,6 +109,8 @@ TEMPLATES = [
         },
     },
 ]
+if API_ONLY:
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove('django.contrib.messages.context_processors.messages')
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
@@ -90,28 +118,150 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Serve the async versions of the API views; app.asgi turns this on by default
+ASYNC_API = os.getenv("ASYNC_API", "False").lower() in ("true", "1", "yes")
+
+# Connection reuse. Persistent connections are kept DB_CONN_MAX_AGE seconds and checked
+# before reuse. Under ASGI each request runs its queries in a thread of its own, which a
+# persistent connection cannot outlive, so the default is 0 there: use the pool instead.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 0 if ASYNC_API else 60))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() in ('true', '1', 'yes')
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))  # PostgreSQL: seconds to establish a connection
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))  # PostgreSQL: cancel longer queries, 0 = never
+# PostgreSQL connection pool (psycopg 3), shared by all threads of a process, for WSGI and
+# ASGI alike. DB_POOL_MAX_SIZE > 0 turns it on, in place of persistent connections.
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0))
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))  # Connections kept open when idle
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))  # Seconds a request waits for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))  # Seconds before an unused connection above min is closed
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 3600))  # Seconds before a connection is replaced
+
+
+def database_config(url=None):
+    """
+    Builds a `DATABASES` entry from a database URL (db.sqlite3 without one), with the
+    connection settings above. SQLite only uses the max age and health checks.
+    """
+    config = dj_database_url.parse(url) if url else {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
+    config['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    # With a pool, this makes psycopg_pool check connections as they are handed out
+    config['CONN_HEALTH_CHECKS'] = DB_CONN_HEALTH_CHECKS
+    if config['ENGINE'] == 'django.db.backends.postgresql':
+        options = config.setdefault('OPTIONS', {})
+        options.setdefault('connect_timeout', DB_CONNECT_TIMEOUT)
+        if DB_STATEMENT_TIMEOUT_MS:
+            options['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+        if DB_POOL_MAX_SIZE:
+            options['pool'] = {
+                'min_size': min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+                'max_idle': DB_POOL_MAX_IDLE,
+                'max_lifetime': DB_POOL_MAX_LIFETIME,
+            }
+            # Connections go back to the pool at the end of each request
+            config['CONN_MAX_AGE'] = 0
+    return config
+
+
+# Overwrite the default setting for deploying to production with DATABASE_URL
+DATABASE_URL = os.getenv('DATABASE_URL')
+DATABASES = {
+    'default': database_config(DATABASE_URL),
 }
 
-# Overwrite the default setting for deploying to production
-DATABASE_URL = os.getenv('DATABASE_URL')
-if DATABASE_URL:
-    DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
+# Read replicas, comma separated database URLs: reads of users and to-dos go to them
+# (see auth_app.replicas). Locally, SQLite files kept up to date by the
+# sync_sqlite_replicas command can stand in for them. In tests the replicas mirror the
+# test database of the primary.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DATABASE_REPLICAS = []
+for number, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{number}'] = {**database_config(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+# After a write, the client reads from the primary this long: keep it above the replication lag
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_COOKIE = 'db_pin'
+
+# Shards for the to-dos, comma separated database URLs (see auth_app.shards). Users,
+# sessions and tokens stay in `default`, which is a shard too. Every shard needs the
+# migrations: python manage.py migrate_shards. Only ever append URLs: the aliases
+# (shard1, shard2, ...) follow their order.
+DATABASE_SHARD_URLS = [url.strip() for url in os.getenv('DATABASE_SHARD_URLS', '').split(',') if url.strip()]
+TODO_SHARDS = ['default'] if DATABASE_SHARD_URLS else []
+for number, url in enumerate(DATABASE_SHARD_URLS, start=1):
+    DATABASES[f'shard{number}'] = database_config(url)
+    TODO_SHARDS.append(f'shard{number}')
+# Shards taking no new users, e.g. before removing one: rebalance_todo_shards empties them
+TODO_DRAINING_SHARDS = [alias.strip() for alias in os.getenv('TODO_DRAINING_SHARDS', '').split(',') if alias.strip()]
+# Cache of the user -> shard directory; share it between workers, like TODO_LIST_CACHE_ALIAS
+TODO_SHARD_CACHE_ALIAS = os.getenv('TODO_SHARD_CACHE_ALIAS', 'default')
+TODO_SHARD_CACHE_TIMEOUT = int(os.getenv('TODO_SHARD_CACHE_TIMEOUT', 300))
+
+DATABASE_ROUTERS = []
+if TODO_SHARDS:
+    DATABASE_ROUTERS.append('auth_app.shards.ShardRouter')
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS.append('auth_app.replicas.ReplicaRouter')
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered to-do list pages keyed by list version, and the current version of each list.
+    # locmem is per process, so each worker renders its own copy and only sees its own
+    # writes before TODO_LIST_VERSION_TIMEOUT: a shared backend (memcached, redis) lets
+    # several workers share both.
+    'todo_lists': {
+        'BACKEND': os.getenv('TODO_LIST_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('TODO_LIST_CACHE_LOCATION', 'todo-lists'),
+        'TIMEOUT': int(os.getenv('TODO_LIST_CACHE_TIMEOUT', 300)),  # Seconds before a page is evicted
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TODO_LIST_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 4,  # Evict 1/4 of the entries when MAX_ENTRIES is reached
+        },
+    },
+}
+TODO_LIST_CACHE_ALIAS = 'todo_lists'
+# Seconds a list version stays cached next to the pages. A write updates it in the cache of
+# its own worker only when that cache is per process (locmem): the others may serve the
+# previous version of the list for this long.
+TODO_LIST_VERSION_TIMEOUT = int(os.getenv('TODO_LIST_VERSION_TIMEOUT', 10))
+
+# Rate limiting counters shared by all worker processes, used by django_ratelimit
+# (login / register) and by the DRF throttles below for requests that write
+CACHES['ratelimit'] = {
+    'BACKEND': os.getenv('RATELIMIT_CACHE_BACKEND', 'auth_app.cache_backends.DatabaseCounterCache'),
+    'LOCATION': os.getenv('RATELIMIT_CACHE_LOCATION', ''),
+}
+RATELIMIT_USE_CACHE = 'ratelimit'
+# DRF throttle counters of reads, kept out of the database so that reads never write to the
+# primary. locmem counts per process; e.g. django.core.cache.backends.redis.RedisCache with
+# THROTTLE_CACHE_LOCATION=redis://... shares them between workers.
+CACHES['throttle'] = {
+    'BACKEND': os.getenv('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+    'LOCATION': os.getenv('THROTTLE_CACHE_LOCATION', 'throttle'),
+}
+THROTTLE_CACHE_ALIAS = 'throttle'
+# Turns off both the login / register limits and the API throttles; only for local load tests
+RATELIMIT_ENABLE = os.getenv('RATELIMIT_ENABLE', 'True').lower() in ('true', '1', 'yes')
 
 # Configure Django REST Framework
 REST_FRAMEWORK = {
-    # Use JWT authentication for API endpoints
+    # Use JWT authentication for API endpoints (reuses the token verified by JWTAuthenticationMiddleware)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth_app.authentication.CookieJWTAuthentication',
     ),
     # Configure throttling settings for API rate limiting
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'auth_app.throttling.SharedUserRateThrottle',
+        'auth_app.throttling.SharedAnonRateThrottle',
     ],
     # Set default throttle rates
     'DEFAULT_THROTTLE_RATES': {
@@ -119,6 +269,8 @@ REST_FRAMEWORK = {
         'anon': '50/hour',
     },
 }
+if not RATELIMIT_ENABLE:
+    REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES'] = []
 
 # Configure JWT settings
 from datetime import timedelta
@@ -128,8 +280,77 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Checks refresh tokens against the in-process revocation filter before the blacklist
+    'TOKEN_REFRESH_SERIALIZER': 'auth_app.serializers.RevocableTokenRefreshSerializer',
 }
 INSTALLED_APPS += ['rest_framework_simplejwt.token_blacklist'] # Token blacklist app for JWT
+# Concurrent refreshes of one refresh token (several tabs) get the same rotated pair for this
+# many seconds instead of 401s; 0 disables. Share the cache between workers for it to
+# work across processes (see auth_app.token_refresh).
+TOKEN_REFRESH_GRACE_SECONDS = float(os.getenv('TOKEN_REFRESH_GRACE_SECONDS', 5))
+TOKEN_REFRESH_CACHE_ALIAS = os.getenv('TOKEN_REFRESH_CACHE_ALIAS', 'default')
+# In-process filter of the blacklisted refresh tokens (auth_app.revocation), which spares
+# refreshes the blacklist query. Each process reads the newly blacklisted tokens every
+# SYNC seconds and rebuilds it, dropping expired ones, every REBUILD seconds. Expired
+# tokens are deleted by `manage.py compact_token_blacklist`.
+TOKEN_REVOCATION_FILTER = os.getenv('TOKEN_REVOCATION_FILTER', 'True').lower() in ('true', '1', 'yes')
+TOKEN_REVOCATION_FILTER_SYNC_SECONDS = float(os.getenv('TOKEN_REVOCATION_FILTER_SYNC_SECONDS', 30))
+TOKEN_REVOCATION_FILTER_REBUILD_SECONDS = float(os.getenv('TOKEN_REVOCATION_FILTER_REBUILD_SECONDS', 3600))
+
+# Audit trail of logins, logouts, token refreshes and to-do changes (auth_app.audit). Events
+# are queued in memory and inserted by a background thread per process, AUDIT_LOG_BATCH_SIZE
+# at a time or AUDIT_LOG_FLUSH_SECONDS after the first one, and on shutdown. With more than
+# AUDIT_LOG_MAX_QUEUE events waiting, requests wait up to AUDIT_LOG_BLOCK_SECONDS for room,
+# then the event is dropped and logged. With AUDIT_LOG_BACKGROUND off there is no thread:
+# the request that fills a batch or comes past its deadline writes it (the test suite runs so).
+AUDIT_LOG_ENABLED = os.getenv('AUDIT_LOG_ENABLED', 'True').lower() in ('true', '1', 'yes')
+AUDIT_LOG_BACKGROUND = os.getenv('AUDIT_LOG_BACKGROUND', 'True').lower() in ('true', '1', 'yes')
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', 500))
+AUDIT_LOG_FLUSH_SECONDS = float(os.getenv('AUDIT_LOG_FLUSH_SECONDS', 1))
+AUDIT_LOG_MAX_QUEUE = int(os.getenv('AUDIT_LOG_MAX_QUEUE', 10000))
+AUDIT_LOG_BLOCK_SECONDS = float(os.getenv('AUDIT_LOG_BLOCK_SECONDS', 0.5))
+
+# Per-process cache of authenticated users, keyed by user id
+JWT_USER_CACHE_MAX_SIZE = int(os.getenv('JWT_USER_CACHE_MAX_SIZE', 1024))  # 0 disables the cache
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', 60))  # Seconds before a cached user is reloaded
+# Seconds a cached user's is_active and password are trusted before being checked again, which
+# bounds how long a deactivation made without a post_save (e.g. a queryset update) goes unseen
+JWT_USER_CACHE_SECURITY_TTL = float(os.getenv('JWT_USER_CACHE_SECURITY_TTL', 5))
+
+# Server-Sent Events change feed (/auth/todos/events/, ASGI only). The default broker only
+# reaches streams of the same process: run one ASGI worker or plug in a shared broker.
+TODO_EVENTS_BROKER = os.getenv('TODO_EVENTS_BROKER', 'auth_app.events.InProcessEventBroker')
+TODO_EVENTS_MAX_CONNECTIONS = int(os.getenv('TODO_EVENTS_MAX_CONNECTIONS', 5))  # Open streams per user
+TODO_EVENTS_HISTORY = int(os.getenv('TODO_EVENTS_HISTORY', 100))  # Events kept per user for Last-Event-ID resume
+TODO_EVENTS_HEARTBEAT = float(os.getenv('TODO_EVENTS_HEARTBEAT', 15))  # Seconds between heartbeats on an idle stream
+TODO_EVENTS_RETRY_MS = int(os.getenv('TODO_EVENTS_RETRY_MS', 5000))  # Reconnection delay suggested to clients
+
+# Delta sync (/auth/todos/changes/): tombstones of deleted to-dos are kept this long, then
+# pruned by `manage.py compact_todo_changes` (run it daily, e.g. from cron). Clients that
+# last synced before the window are told to resync from scratch.
+TODO_CHANGES_RETENTION_DAYS = float(os.getenv('TODO_CHANGES_RETENTION_DAYS', 30))
+
+# Clearing completed to-dos: rows deleted per transaction, and the count past which they are
+# only hidden (202 Accepted) and left to `manage.py purge_deleted_todos`. 0 never defers.
+TODO_CLEAR_BATCH_SIZE = int(os.getenv('TODO_CLEAR_BATCH_SIZE', 500))
+TODO_CLEAR_DEFER_THRESHOLD = int(os.getenv('TODO_CLEAR_DEFER_THRESHOLD', 0))
+
+# Most rows accepted by one upload to the to-do import endpoint (the import_todos command has no limit)
+TODO_IMPORT_MAX_ROWS = int(os.getenv('TODO_IMPORT_MAX_ROWS', 100000))
+# Most users in one upload to the admin-only /auth/users/import/, whose passwords are all hashed
+# while the request waits; larger files are refused (413) and go through the provision_users command
+USER_IMPORT_MAX_ROWS = int(os.getenv('USER_IMPORT_MAX_ROWS', 100))
+
+# Request instrumentation: per-route latency histograms, query counts and cache hits,
+# exposed in Prometheus format at /metrics. Off by default; when off the
+# middlewares drop out of the stack entirely.
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'False').lower() in ('true', '1', 'yes')
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'False').lower() in ('true', '1', 'yes')  # Send the phase timings in a Server-Timing header
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # When set, /metrics requires "Authorization: Bearer <token>"
+
+# Process pool hashing passwords for the async login / register views and user provisioning
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', 0)) or None  # Defaults to the CPU count
+PASSWORD_HASHING_MAX_PENDING = int(os.getenv('PASSWORD_HASHING_MAX_PENDING', 0)) or None  # Defaults to 4 jobs per worker
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
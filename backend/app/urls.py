@@ -14,10 +14,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
+from auth_app.metrics import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('auth/', include('auth_app.urls')),  # Include authentication routes
+    path('metrics', metrics_view, name='metrics'),  # Prometheus metrics (REQUEST_METRICS)
 ]
+
+# Not served by the API-only profile, which does not even import it (see API_ONLY in settings)
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
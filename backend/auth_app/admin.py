@@ -1,3 +1,62 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.db import transaction
+
+from .changes import record_changes
+from .models import Todo, user_todo_db
+from .signals import todos_changed
 
 # Register your models here.
+
+@admin.register(Todo)
+class TodoAdmin(admin.ModelAdmin):
+    """
+    Admin for to-do items. Every edit is logged with `record_changes` and
+    announced through `todos_changed`, so that list versions (and with them
+    ETags) and the change feed stay in sync with the table.
+    """
+    list_display = ('text', 'user', 'completed', 'created_at')
+    list_filter = ('completed',)
+    search_fields = ('text', 'user__username')
+    raw_id_fields = ('user',)
+    readonly_fields = ('created_at', 'version')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.version += 1
+        moved_from = form.initial['user'] if change and 'user' in form.changed_data else None
+        with transaction.atomic(using=user_todo_db(obj.user_id)):
+            super().save_model(request, obj, form, change)
+            version = record_changes(obj.user_id, upserted=[obj.pk])
+            if moved_from is not None:
+                # The item moved to another user, so the previous owner's list changed as well
+                previous_version = record_changes(moved_from, deleted=[obj.pk])
+        todos_changed.send(sender=Todo, user_id=obj.user_id, action='update' if change else 'create', version=version)
+        if moved_from is not None:
+            todos_changed.send(sender=Todo, user_id=moved_from, action='delete', version=previous_version)
+
+    def delete_model(self, request, obj):
+        pk = obj.pk
+        with transaction.atomic(using=user_todo_db(obj.user_id)):
+            super().delete_model(request, obj)
+            version = record_changes(obj.user_id, deleted=[pk])
+        todos_changed.send(sender=Todo, user_id=obj.user_id, action='delete', version=version)
+
+    def delete_queryset(self, request, queryset):
+        ids_by_user = defaultdict(list)
+        for user_id, pk in queryset.values_list('user_id', 'pk'):
+            ids_by_user[user_id].append(pk)
+        users_by_db = defaultdict(list)
+        for user_id in ids_by_user:
+            users_by_db[user_todo_db(user_id)].append(user_id)
+        versions = {}
+        # One transaction per database, holding the rows, change log and list version of its users
+        for db, user_ids in users_by_db.items():
+            ids = [pk for user_id in user_ids for pk in ids_by_user[user_id]]
+            with transaction.atomic(using=db):
+                super().delete_queryset(request, queryset.using(db).filter(pk__in=ids))
+                for user_id in user_ids:
+                    versions[user_id] = record_changes(user_id, deleted=ids_by_user[user_id])
+        for user_id, version in versions.items():
+            todos_changed.send(sender=Todo, user_id=user_id, action='delete', version=version)
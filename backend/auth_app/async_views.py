@@ -0,0 +1,511 @@
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
+from django_ratelimit.core import is_ratelimited
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .audit import audit_log, client_ip
+from .authentication import CookieJWTAuthentication
+from .changes import ResyncRequired, achanges_since, create_todo, toggle_todos
+from .conditional import if_none_match, parse_if_match, todo_etag, todo_list_etag
+from .events import TodoEvent, TooManyConnections, todo_events
+from .hashing import HashingPoolBusy, hashing_pool
+from .metrics import timed
+from .models import Todo, TodoListVersion
+from .purge import clear_completed_todos
+from .provisioning import aintegrity_conflict, aregistration_conflict
+from .pagination import TodoKeysetPagination
+from .response_cache import todo_list_cache
+from .renderers import FastJSONRenderer
+from .serializers import TodoChangesSerializer, TodoSerializer, TodoSearchSerializer, serialize_todo_rows
+from .views import export_file_format, export_response, todo_search_rows
+from .signals import todos_changed
+from .transfer import FORMATS, aiter_export
+from .user_cache import user_cache
+
+# Async views served when the app runs under app.asgi (see ASYNC_API in settings).
+# They mirror the sync DRF views in views.py and share their rate limit counters,
+# caches and response formats, so both can serve the same clients side by side.
+
+
+def read_json(request):
+    """
+    Parses a JSON (or form-encoded) request body into a dict.
+    Returns:
+        dict | None: The parsed body, or None if it is not valid JSON.
+    """
+    if request.content_type != 'application/json':
+        return request.POST.dict()
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def check_ratelimit(request, group, rate):
+    """Counts the request against the IP rate limit of `group`, raising `Ratelimited` past it."""
+    limited = await sync_to_async(is_ratelimited)(
+        request=request, group=group, key='ip', rate=rate, increment=True,
+    )
+    if limited:
+        raise Ratelimited()
+
+
+def busy_response():
+    response = JsonResponse({'error': 'Server busy, please retry shortly'}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+@csrf_protect
+@require_POST
+async def register_user(request):
+    """
+    Registers a new user with the provided username, email, and password.
+    The password is hashed in the process pool, off the event loop.
+    Args:
+        request: The HTTP request containing user registration data.
+    Returns:
+        JsonResponse: A response indicating success or failure of the registration.
+    """
+    await check_ratelimit(request, 'auth_app.views.register_user', '10/h')
+    data = read_json(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    username = data.get('username')
+    email = data.get('email')
+    password = data.get('password')
+    if not username or not password:
+        return JsonResponse({'error': 'Username and password are required'}, status=400)
+
+    # Username and email checked in one query
+    conflict = await aregistration_conflict(username, email)
+    if conflict:
+        return JsonResponse({'error': conflict}, status=400)
+
+    # Validate password using Django's built-in validators
+    try:
+        validate_password(password)
+    except ValidationError as e:
+        return JsonResponse({'error': e.messages}, status=400)
+
+    try:
+        encoded = await hashing_pool.make_password(password)
+    except HashingPoolBusy:
+        return busy_response()
+
+    try:
+        user = await User.objects.acreate(
+            username=User.normalize_username(username),
+            email=User.objects.normalize_email(email),
+            password=encoded,
+        )
+    except IntegrityError:
+        # Username or email registered by a concurrent request since the check
+        return JsonResponse({'error': await aintegrity_conflict(username, email)}, status=400)
+    await audit_log.arecord('register', user.pk, client_ip(request))
+    return JsonResponse({'message': 'User registered successfully'}, status=201)
+
+
+@csrf_protect
+@require_POST
+async def login_user(request):
+    """
+    Authenticates a user and sets JWT tokens in cookies upon successful login.
+    The password is verified in the process pool, off the event loop, and
+    hashes made with outdated parameters are upgraded on the way.
+    Args:
+        request: The HTTP request containing login credentials.
+    Returns:
+        JsonResponse: A response indicating success or failure of the login.
+    """
+    await check_ratelimit(request, 'auth_app.views.login_user', '5/m')
+    data = read_json(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    email = data.get('email')
+    password = data.get('password')
+
+    try:
+        user = await User.objects.aget(email=email)
+    except User.DoesNotExist:
+        await audit_log.arecord('login_failed', ip=client_ip(request), data={'email': email})
+        return JsonResponse({'error': 'Invalid username or password'}, status=401)
+    if not user.is_active or password is None or not user.has_usable_password():
+        await audit_log.arecord('login_failed', user.pk, client_ip(request), {'email': email})
+        return JsonResponse({'error': 'Invalid username or password'}, status=401)
+
+    try:
+        is_correct, must_update = await hashing_pool.verify_password(password, user.password)
+    except HashingPoolBusy:
+        return busy_response()
+    if not is_correct:
+        await audit_log.arecord('login_failed', user.pk, client_ip(request), {'email': email})
+        return JsonResponse({'error': 'Invalid username or password'}, status=401)
+
+    if must_update:
+        # Re-hash with the current hasher parameters
+        try:
+            user.password = await hashing_pool.make_password(password)
+        except HashingPoolBusy:
+            pass  # Upgrade on a later login instead of failing this one
+        else:
+            await User.objects.filter(pk=user.pk).aupdate(password=user.password)
+            user_cache.invalidate(user.pk)
+
+    refresh = await sync_to_async(RefreshToken.for_user)(user)
+    await audit_log.arecord('login', user.pk, client_ip(request))
+    response = JsonResponse({'message': 'Login successful'})
+    response.set_cookie(
+        key='access',
+        value=str(refresh.access_token),
+        httponly=True,
+        secure=False,  # Need to be True in production
+        samesite='Lax',
+    )
+    response.set_cookie(
+        key='refresh',
+        value=str(refresh),
+        httponly=True,
+        secure=False, # Need to be True in production
+        samesite='Lax',
+    )
+    return response
+
+
+def json_response(data, status=200):
+    """Renders `data` as JSON, byte for byte like the sync views."""
+    return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+
+authenticator = CookieJWTAuthentication()
+
+
+async def authenticate(request):
+    """
+    Resolves the user of an API request: the access cookie already verified by
+    `JWTAuthenticationMiddleware`, else an `Authorization: Bearer` header.
+    Raises:
+        NotAuthenticated, AuthenticationFailed: If no valid credentials were sent.
+    """
+    jwt_auth = getattr(request, 'jwt_auth', None)
+    if jwt_auth is None:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+        if raw_token is None:
+            raise exceptions.NotAuthenticated()
+        with timed('auth'):
+            jwt_auth = await authenticator.aauthenticate_token(raw_token)
+        request.jwt_auth = jwt_auth
+    request.user = jwt_auth[0]
+    return request.user
+
+
+def check_throttles(request):
+    """Applies the DRF throttles configured in `DEFAULT_THROTTLE_CLASSES`."""
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            raise exceptions.Throttled(throttle.wait())
+
+
+def async_api_view(methods):
+    """
+    Turns an async view into an authenticated JSON API endpoint, doing for it
+    what `@api_view` + `IsAuthenticated` + the default throttles do for the sync
+    views: method check, JWT authentication, throttling and DRF-shaped error
+    responses. Like DRF views, the endpoint relies on the SameSite access cookie
+    rather than a CSRF token.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                await authenticate(request)
+                await sync_to_async(check_throttles)(request)
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                response = json_response(detail, status=exc.status_code)
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    response.status_code = 401
+                    response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+                if isinstance(exc, exceptions.MethodNotAllowed):
+                    response['Allow'] = ', '.join(methods)
+                if getattr(exc, 'wait', None):
+                    response['Retry-After'] = '%d' % exc.wait
+                return response
+        return csrf_exempt(wrapped)
+    return decorator
+
+
+@async_api_view(['GET', 'POST'])
+async def todo_list_create(request):
+    """
+    Handles retrieving and creating to-do items for the authenticated user.
+    Async counterpart of `views.todo_list_create`, sharing its pagination,
+    ETags and rendered page cache.
+    Args:
+        request: The HTTP request containing the to-do data.
+    Returns:
+        HttpResponse: A response with a page of to-dos or the created to-do item.
+    """
+    user_id = request.user.pk
+    if request.method == 'GET':
+        paginator = TodoKeysetPagination()
+        list_version = await todo_list_cache.aget_version(user_id)
+        etag = todo_list_etag(user_id, list_version, paginator.get_page_key(request))
+        page_url = request.build_absolute_uri()
+
+        if if_none_match(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            content = await todo_list_cache.aget_page(user_id, list_version, page_url)
+            if content is not None:
+                response = HttpResponse(content, content_type='application/json')
+            else:
+                # The version of the database the rows come from, see TodoListCache
+                list_version = await todo_list_cache.aload_version(user_id, list_version)
+                etag = todo_list_etag(user_id, list_version, paginator.get_page_key(request))
+                rows = Todo.objects.for_user(user_id).values(*TodoSerializer.Meta.fields)
+                todos = await paginator.apaginate_queryset(rows, request)
+                with timed('serialization'):
+                    data = serialize_todo_rows(todos)
+                with timed('render'):
+                    response = json_response(paginator.get_paginated_data(data))
+                await todo_list_cache.aset_page(user_id, list_version, page_url, response.content)
+        response['ETag'] = etag
+        # Let browsers keep the page but always revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    data = read_json(request)
+    if data is None:
+        return json_response({'detail': 'JSON parse error'}, status=400)
+    serializer = TodoSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+    # The insert, the list version bump and the change log entry share a transaction
+    # (see `record_changes`), and the async ORM has no transactions: this needs a thread
+    todo, version = await sync_to_async(create_todo)(user_id, **serializer.validated_data)
+    data = TodoSerializer(todo).data
+    await todos_changed.asend(sender=Todo, user_id=user_id, action='create', version=version, data={'todo': data})
+    return json_response(data, status=201)
+
+
+@async_api_view(['PATCH'])
+async def toggle_todo(request, todo_id):
+    """
+    Toggles the completion status of a to-do item.
+    Async counterpart of `views.toggle_todo`, including `If-Match` handling.
+    Args:
+        request: The HTTP request containing the toggle request.
+        todo_id: The ID of the to-do item to be toggled.
+    Returns:
+        HttpResponse: A response with the updated to-do item or an error message.
+    """
+    todos = Todo.objects.for_user(request.user.pk).filter(id=todo_id)
+    expected_versions = parse_if_match(request)
+    if expected_versions is not None:
+        todos_to_toggle = todos.filter(version__in=expected_versions)
+    else:
+        todos_to_toggle = todos
+    # A transaction with the change log entry, like the create
+    updated, version = await sync_to_async(toggle_todos)(todos_to_toggle, request.user.pk)
+
+    if not updated:
+        if expected_versions is not None and await todos.aexists():
+            return json_response({'error': 'Todo has been modified'}, status=412)
+        return json_response({'error': 'Todo not found'}, status=404)
+
+    todo = updated[0]
+    data = TodoSerializer(todo).data
+    await todos_changed.asend(sender=Todo, user_id=request.user.pk, action='toggle', version=version, data={'todo': data})
+    response = json_response(data)
+    response['ETag'] = todo_etag(todo)
+    return response
+
+
+@async_api_view(['DELETE'])
+async def clear_completed(request):
+    """
+    Deletes all completed to-do items for the authenticated user.
+    Async counterpart of `views.clear_completed`, including the deferred mode.
+    Args:
+        request: The HTTP request containing the delete request.
+    Returns:
+        HttpResponse: A response indicating the number of deleted to-do items.
+    """
+    # Each batch of deletions commits with its tombstones and sends its own change
+    deleted, deferred = await sync_to_async(clear_completed_todos)(request.user.pk)
+    return json_response({'deleted': deleted}, status=202 if deferred else 204)
+
+
+@async_api_view(['GET'])
+async def export_todos(request):
+    """
+    Streams all to-do items of the authenticated user as NDJSON or CSV.
+    Async counterpart of `views.export_todos`: chunks of rows are fetched in a
+    worker thread, so the export streams without buffering the file.
+    Args:
+        request: The HTTP request containing the export request.
+    Returns:
+        StreamingHttpResponse: The export file, or a 400 response for an unknown type.
+    """
+    file_format = export_file_format(request)
+    if file_format is None:
+        return json_response({'error': f'type must be one of {", ".join(FORMATS)}'}, status=400)
+    return export_response(aiter_export(request.user, file_format), file_format)
+
+
+@async_api_view(['GET'])
+async def todo_search(request):
+    """
+    Searches the to-do items of the authenticated user.
+    Async counterpart of `views.todo_search`, with the same parameters and ETags.
+    Args:
+        request: The HTTP request containing the search parameters.
+    Returns:
+        HttpResponse: A page of matching to-dos, or the parameter errors.
+    """
+    serializer = TodoSearchSerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+    user_id = request.user.pk
+    list_version = await todo_list_cache.aget_version(user_id)
+    etag = todo_list_etag(user_id, list_version, 'search?' + request.GET.urlencode())
+
+    if if_none_match(request, etag):
+        response = HttpResponse(status=304)
+    else:
+        rows, paginator = todo_search_rows(user_id, serializer.validated_data)
+        todos = await paginator.apaginate_queryset(rows, request)
+        with timed('serialization'):
+            data = serialize_todo_rows(todos)
+        with timed('render'):
+            response = json_response(paginator.get_paginated_data(data))
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@async_api_view(['GET'])
+async def todo_changes(request):
+    """
+    Returns what changed in the authenticated user's to-dos since a seq.
+    Async counterpart of `views.todo_changes`, with the same parameters.
+    Args:
+        request: The HTTP request containing `since` and `limit`.
+    Returns:
+        HttpResponse: The changes and the next `seq`, the parameter errors, or 410.
+    """
+    serializer = TodoChangesSerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+    try:
+        data = await achanges_since(request.user.pk, **serializer.validated_data)
+    except ResyncRequired:
+        return json_response({'error': 'Changes since this seq are no longer available, sync again from 0'}, status=410)
+    response = json_response(data)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
+def parse_last_event_id(request):
+    """Reads the id to resume from: the `Last-Event-ID` header, or `?last_event_id=` for a fresh page."""
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def stream_todo_events(user_id, last_event_id):
+    """
+    Yields the Server-Sent Events of one stream: first what the client missed
+    (or a `ready` / `reset` event carrying the current list version), then every
+    change as it is published, with a comment line as heartbeat when idle.
+    """
+    try:
+        subscription = todo_events.subscribe(user_id)
+    except TooManyConnections:
+        return
+    try:
+        yield b'retry: %d\n\n' % settings.TODO_EVENTS_RETRY_MS
+        # Subscribed before reading the version, so no change can fall in between. From the
+        # database, not the cache: another worker's write may not have reached it yet
+        current = await TodoListVersion.objects.acurrent(user_id)
+        if last_event_id is None:
+            backlog = [TodoEvent(user_id, current, 'ready')]
+        elif last_event_id == current:
+            backlog = []
+        else:
+            backlog = todo_events.history(user_id, last_event_id) if last_event_id < current else None
+            if backlog is None:
+                # The missed events are no longer kept: the client must reload the list
+                backlog = [TodoEvent(user_id, current, 'reset')]
+        sent = current
+        for event in backlog:
+            yield event.encode()
+            sent = event.id
+
+        while True:
+            try:
+                event = await subscription.get(settings.TODO_EVENTS_HEARTBEAT)
+            except TimeoutError:
+                yield b': heartbeat\n\n'
+                continue
+            if subscription.overflowed:
+                subscription.drain()
+                sent = await TodoListVersion.objects.acurrent(user_id)
+                yield TodoEvent(user_id, sent, 'reset').encode()
+            elif event.id > sent:
+                yield event.encode()
+                sent = event.id
+    finally:
+        todo_events.unsubscribe(subscription)
+
+
+@async_api_view(['GET'])
+async def todo_event_stream(request):
+    """
+    Streams the changes of the authenticated user's to-do list as Server-Sent
+    Events, for clients to stay in sync without polling the list.
+    Each event is named after the change (`created`, `toggled`, `deleted`,
+    `cleared`, `batch`, `imported`) and its id is the new list version, so a
+    reconnecting `EventSource` resumes with `Last-Event-ID`. `reset` tells the
+    client to reload the list. Only served under ASGI.
+    Args:
+        request: The HTTP request opening the stream.
+    Returns:
+        StreamingHttpResponse: The event stream, or 429 when the user already
+        has `TODO_EVENTS_MAX_CONNECTIONS` streams open.
+    """
+    user_id = request.user.pk
+    if todo_events.connections(user_id) >= todo_events.max_connections:
+        response = json_response({'error': 'Too many open event streams'}, status=429)
+        response['Retry-After'] = str(settings.TODO_EVENTS_RETRY_MS // 1000)
+        return response
+    response = StreamingHttpResponse(
+        stream_todo_events(user_id, parse_last_event_id(request)), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,293 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.utils import timezone
+
+from .models import AuditEvent
+
+logger = logging.getLogger(__name__)
+
+# Columns of an audit log export, in order
+AUDIT_FIELDS = ('id', 'created_at', 'user_id', 'action', 'ip', 'data')
+# Seconds before the first retry of a failed batch insert, doubled for each further one
+RETRY_DELAY = 0.5
+
+# Queue markers: stop the writer, or report when everything queued before has been written
+_STOP = object()
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class AuditLog:
+    """
+    Write-behind audit trail: requests queue their events in memory and a
+    background thread inserts them into `AuditEvent` with `bulk_create`.
+
+    A batch is written once `batch_size` events are queued, or at the latest
+    `flush_interval` seconds after its first event, so a request never waits
+    for an audit insert. A failed insert is retried `retries` times, with
+    growing delays, before its events are dropped and logged. The queue holds
+    at most `max_queue` events: when the writer falls behind, requests wait up
+    to `block_timeout` seconds for room, and past that the event is dropped
+    and logged rather than stalling the request any longer. Events still
+    queued at exit are written by `close()`, run by `atexit`; only a killed
+    process loses them.
+
+    The writer thread starts with the first event of each process (so after
+    the fork of a preforking server) and uses a database connection of its
+    own. With `background` False there is no thread: the request whose event
+    fills a batch, or comes `flush_interval` seconds after the first queued
+    one, writes the queued events itself, and `flush()` writes them inline,
+    e.g. in tests.
+    """
+    def __init__(self, enabled=True, background=True, batch_size=500, flush_interval=1.0, max_queue=10000,
+                 block_timeout=0.5, retries=3):
+        self.enabled = enabled
+        self.background = background
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit = False
+        # Without the writer thread: when the queued events are due
+        self._deadline = None
+
+    def record(self, action, user_id=None, ip=None, data=None):
+        """
+        Queues an event. Returns at once unless the queue is full.
+        Args:
+            action: What happened, e.g. 'login' or 'todo.create'.
+            user_id: The user who did it, if known.
+            ip: The client address.
+            data: JSON details.
+        """
+        if not self.enabled:
+            return
+        event = (timezone.now(), user_id, action, ip, data)
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self._put_waiting(event)
+        if self._due():
+            self._drain()
+
+    async def arecord(self, action, user_id=None, ip=None, data=None):
+        """Like `record()`, but waits for room in the queue off the event loop."""
+        if not self.enabled:
+            return
+        event = (timezone.now(), user_id, action, ip, data)
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            await sync_to_async(self._put_waiting, thread_sensitive=False)(event)
+        if self._due():
+            await sync_to_async(self._drain)()
+
+    def _put_waiting(self, event):
+        try:
+            self._queue.put(event, timeout=self.block_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.error('Audit log queue is full, dropped a %r event of user %s', event[2], event[1])
+
+    def _due(self):
+        """Without the writer thread, whether the queued events should be written now."""
+        if self.background:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if self._deadline is None:
+                self._deadline = now + self.flush_interval
+            return self._queue.qsize() >= self.batch_size or now >= self._deadline
+
+    def pending(self):
+        """Number of queued events not written yet."""
+        return self._queue.qsize()
+
+    def start(self):
+        """Starts the writer thread, unless it is running or the log has none."""
+        if self._atexit and (not self.background or self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if not self._atexit:
+                atexit.register(self.close)
+                self._atexit = True
+            if not self.background or self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout=None):
+        """
+        Blocks until the events queued so far are written (or dropped).
+        Returns:
+            bool: False if `timeout` seconds passed first.
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self._drain()
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=10):
+        """Writes the queued events and stops the writer thread."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        else:
+            self._drain()
+
+    def _drain(self):
+        """Writes the queued events from the calling thread, with no writer thread running."""
+        with self._lock:
+            self._deadline = None
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _Flush):
+                item.done.set()
+            elif item is not _STOP:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+    def _run(self):
+        try:
+            while True:
+                batch = []
+                item = self._queue.get()
+                # The time trigger counts from the first event of the batch
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if item is _STOP or isinstance(item, _Flush):
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        item = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        item = None
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        item = None
+                        break
+                if batch:
+                    self.write(batch)
+                if isinstance(item, _Flush):
+                    item.done.set()
+                elif item is _STOP:
+                    self._drain()
+                    return
+        finally:
+            connections[router.db_for_write(AuditEvent)].close()
+
+    def write(self, batch):
+        """Inserts `(created_at, user_id, action, ip, data)` events in one statement, with retries."""
+        db = router.db_for_write(AuditEvent)
+        events = [
+            AuditEvent(created_at=created_at, user_id=user_id, action=action, ip=ip, data=data)
+            for created_at, user_id, action, ip, data in batch
+        ]
+        # Other threads write on the connection of their request, and leave it alone
+        writer = threading.current_thread() is self._thread
+        for attempt in range(self.retries + 1):
+            try:
+                if writer:
+                    # Honors CONN_MAX_AGE and drops broken connections, as a request would
+                    close_old_connections()
+                # A savepoint when written from inside a request's transaction
+                with transaction.atomic(using=db):
+                    AuditEvent.objects.using(db).bulk_create(events)
+            except Exception:
+                logger.exception('Could not write %d audit log events (attempt %d)', len(events), attempt + 1)
+                if writer:
+                    connections[db].close()
+                if attempt < self.retries:
+                    time.sleep(RETRY_DELAY * 2 ** attempt)
+            else:
+                with self._lock:
+                    self.written += len(events)
+                return
+        with self._lock:
+            self.dropped += len(events)
+        logger.error('Dropped %d audit log events', len(events))
+
+
+audit_log = AuditLog(
+    enabled=getattr(settings, 'AUDIT_LOG_ENABLED', True),
+    background=getattr(settings, 'AUDIT_LOG_BACKGROUND', True),
+    batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', 1.0),
+    max_queue=getattr(settings, 'AUDIT_LOG_MAX_QUEUE', 10000),
+    block_timeout=getattr(settings, 'AUDIT_LOG_BLOCK_SECONDS', 0.5),
+)
+
+
+def client_ip(request):
+    """The address the request came from, as seen by Django (`REMOTE_ADDR`)."""
+    return request.META.get('REMOTE_ADDR') or None
+
+
+def todo_change_details(data):
+    """
+    What the audit trail keeps of a `todos_changed` event: ids and counts, not
+    the to-do texts.
+    """
+    if not data:
+        return None
+    if 'todo' in data:
+        return {'todo_id': data['todo']['id']}
+    if 'results' in data:
+        return {'operations': len(data['results'])}
+    return data
+
+
+def audit_events(user_id=None, action=None, since=None, until=None):
+    """
+    The audit trail, oldest entry first, optionally filtered.
+    Args:
+        user_id: Only this user's entries.
+        action: Only entries of this action.
+        since / until: `created_at` range, from inclusive to exclusive.
+    Returns:
+        QuerySet: The matching entries as `AUDIT_FIELDS` tuples.
+    """
+    events = AuditEvent.objects.all()
+    if user_id is not None:
+        events = events.filter(user_id=user_id)
+    if action:
+        events = events.filter(action=action)
+    if since is not None:
+        events = events.filter(created_at__gte=since)
+    if until is not None:
+        events = events.filter(created_at__lt=until)
+    return events.order_by('id').values_list(*AUDIT_FIELDS)
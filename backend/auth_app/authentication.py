@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import timed
+from .user_cache import user_cache
+
+
+class CookieJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that reuses the result of `JWTAuthenticationMiddleware`.
+
+    The middleware validates the `access` cookie once per request and stores
+    `(user, validated_token)` on the request as `jwt_auth`; this class hands that
+    pair straight to DRF instead of decoding the token a second time. Requests
+    without the cookie fall back to the standard `Authorization: Bearer` header.
+    Users are resolved through the per-process `user_cache`, so a warm worker
+    authenticates without touching the database.
+    """
+    def authenticate(self, request):
+        jwt_auth = getattr(request._request, 'jwt_auth', None)
+        if jwt_auth is not None:
+            return jwt_auth
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_token(self, raw_token):
+        """
+        Validates a raw access token and resolves its user.
+        Args:
+            raw_token: The encoded JWT.
+        Returns:
+            tuple: The `(user, validated_token)` pair.
+        Raises:
+            InvalidToken, AuthenticationFailed: If the token or its user is not acceptable.
+        """
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
+
+    async def aauthenticate_token(self, raw_token):
+        """Async counterpart of `authenticate_token`; token checks are CPU only."""
+        validated_token = self.get_validated_token(raw_token)
+        user_id = self.get_user_id(validated_token)
+        try:
+            user = await user_cache.aget(user_id)
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self.check_user(user, validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        try:
+            user = user_cache.get(user_id)
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self.check_user(user, validated_token)
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+        return user
@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from .changes import record_changes
+from .models import Todo, user_todo_db
+from .serializers import TodoSerializer
+from .signals import todos_changed
+
+
+class BatchConflict(Exception):
+    """Raised when a to-do of the batch changed between its locking read and the write."""
+
+
+def apply_todo_batch(user, operations):
+    """
+    Applies a validated list of batch operations to a user's to-dos.
+
+    Every write happens inside one transaction with a fixed number of queries,
+    independent of the batch size:
+        1. one SELECT ... FOR UPDATE locking every to-do referenced by id,
+        2. one `bulk_create` for the created to-dos,
+        3. one CASE-based UPDATE for the updated / toggled to-dos, which only
+           writes rows still at the version read in 1. (see `update_todos`),
+        4. one filtered DELETE for the deleted to-dos,
+        5. the change log entries of the batch (`record_changes`).
+    An operation may carry the `version` of the to-do the client last saw, as
+    `If-Match` does for a single item: if the to-do has another version at that
+    point of the batch, the result is 412 and the operation changes nothing.
+    Operations are applied in order, so several operations may target the same
+    to-do (e.g. update then delete). An operation on a to-do that does not exist,
+    belongs to another user or was deleted earlier in the batch yields a 404
+    result without aborting the rest of the batch.
+    Args:
+        user: The authenticated user owning the to-dos.
+        operations: Validated data from `TodoBatchOperationSerializer`.
+    Returns:
+        list: One result dict per operation, in request order.
+    Raises:
+        BatchConflict: When a locked to-do was written meanwhile anyway (on a
+        backend without row locks); nothing of the batch is written.
+    """
+    ids = {operation['id'] for operation in operations if 'id' in operation}
+    results = [None] * len(operations)
+    created = []  # (index, todo)
+    changed = {}
+    read_versions = {}
+    deleted = set()
+    version = None
+
+    user_todos = Todo.objects.for_user(user.pk)
+    with transaction.atomic(using=user_todo_db(user.pk)):
+        todos = user_todos.select_for_update().in_bulk(ids) if ids else {}
+
+        for index, operation in enumerate(operations):
+            op = operation['op']
+            if op == 'create':
+                todo = Todo(user=user, text=operation['text'], completed=operation.get('completed', False))
+                created.append((index, todo))
+                continue
+
+            todo = todos.get(operation['id'])
+            if todo is None or todo.pk in deleted:
+                results[index] = {'op': op, 'id': operation['id'], 'status': 404, 'error': 'Todo not found'}
+                continue
+            expected_version = operation.get('version')
+            if expected_version is not None and expected_version != todo.version:
+                results[index] = {'op': op, 'id': todo.pk, 'status': 412, 'error': 'Todo has been modified'}
+                continue
+
+            if op == 'delete':
+                deleted.add(todo.pk)
+                changed.pop(todo.pk, None)
+                results[index] = {'op': op, 'id': todo.pk, 'status': 204}
+                continue
+
+            if op == 'toggle':
+                todo.completed = not todo.completed
+            else:
+                todo.text = operation.get('text', todo.text)
+                todo.completed = operation.get('completed', todo.completed)
+            read_versions.setdefault(todo.pk, todo.version)
+            todo.version += 1
+            changed[todo.pk] = todo
+            results[index] = {'op': op, 'id': todo.pk, 'status': 200, 'todo': TodoSerializer(todo).data}
+
+        if created:
+            user_todos.bulk_create([todo for _, todo in created])
+        if changed:
+            update_todos(user_todos, changed, read_versions)
+        if deleted:
+            user_todos.filter(id__in=deleted).delete()
+        if created or changed or deleted:
+            version = record_changes(
+                user.pk, upserted=[todo.pk for _, todo in created] + list(changed), deleted=deleted,
+            )
+
+    for index, todo in created:
+        results[index] = {'op': 'create', 'id': todo.pk, 'status': 201, 'todo': TodoSerializer(todo).data}
+
+    if version is not None:
+        todos_changed.send(sender=Todo, user_id=user.pk, action='batch', version=version, data={'results': results})
+    return results
+
+
+def update_todos(todos, changed, read_versions):
+    """
+    Writes the new `text`, `completed` and `version` of several to-dos in one
+    UPDATE, like `bulk_update` but only for the rows still at the version they
+    were read with: the predicate is folded into the WHERE clause as a CASE on
+    the id.
+    Args:
+        todos: The user's `Todo` queryset.
+        changed: The to-dos to write, by id.
+        read_versions: Version of each to-do when it was read, by id.
+    Raises:
+        BatchConflict: When a row is no longer at its read version.
+    """
+    def by_id(values, field):
+        return Case(
+            *[When(id=pk, then=Value(value)) for pk, value in values.items()],
+            output_field=Todo._meta.get_field(field),
+        )
+
+    updated = todos.filter(id__in=list(changed), version=by_id(read_versions, 'version')).update(
+        text=by_id({pk: todo.text for pk, todo in changed.items()}, 'text'),
+        completed=by_id({pk: todo.completed for pk, todo in changed.items()}, 'completed'),
+        version=by_id({pk: todo.version for pk, todo in changed.items()}, 'version'),
+    )
+    if updated != len(changed):
+        raise BatchConflict()
@@ -0,0 +1,152 @@
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import NotSupportedError, connections, router
+
+from .models import RateLimitCounter, supports_update_returning
+
+
+class DatabaseCounterCache(BaseCache):
+    """
+    A cache backend for integer counters, shared by every worker process.
+
+    Rate limiting needs counters that all workers agree on; with the per-process
+    locmem cache, N workers silently allow N times the configured rate. This
+    backend keeps counters in the `RateLimitCounter` table and changes them
+    with single atomic upserts (`INSERT ... ON CONFLICT DO UPDATE ... RETURNING`),
+    so a hit costs one short write and concurrent increments are never lost.
+    It implements the subset of the cache API used by django_ratelimit (`add`,
+    `incr`, `get`) and DRF throttles (see `auth_app.throttling`), plus
+    `incr_or_create` for a one-statement fixed-window hit.
+
+    Supported databases: PostgreSQL and SQLite >= 3.35.
+
+    Options:
+        CULL_EVERY: Delete expired counters once every this many writes (default 1000).
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._cull_every = int(options.get('CULL_EVERY', 1000))
+        self._writes = 0
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Stores the counter unless a live one exists. Returns whether it was stored."""
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        table, connection = self._table_and_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("key", "value", "expires_at") VALUES (%s, %s, %s) '
+                f'ON CONFLICT ("key") DO UPDATE SET "value" = excluded."value", "expires_at" = excluded."expires_at" '
+                f'WHERE {table}."expires_at" <= %s',
+                [key, self._to_int(value), self._expires_at(timeout, now), now],
+            )
+            added = cursor.rowcount > 0
+        self._maybe_cull(now)
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = (
+            RateLimitCounter.objects.using(self._db())
+            .filter(key=key, expires_at__gt=time.time())
+            .values_list('value', flat=True)
+            .first()
+        )
+        return default if value is None else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        table, connection = self._table_and_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("key", "value", "expires_at") VALUES (%s, %s, %s) '
+                f'ON CONFLICT ("key") DO UPDATE SET "value" = excluded."value", "expires_at" = excluded."expires_at"',
+                [key, self._to_int(value), self._expires_at(timeout, now)],
+            )
+        self._maybe_cull(now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return bool(
+            RateLimitCounter.objects.using(self._db())
+            .filter(key=key, expires_at__gt=now)
+            .update(expires_at=self._expires_at(timeout, now))
+        )
+
+    def incr(self, key, delta=1, version=None):
+        """Atomically increments a live counter. Raises ValueError if it does not exist."""
+        key = self.make_and_validate_key(key, version=version)
+        table, connection = self._table_and_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET "value" = "value" + %s WHERE "key" = %s AND "expires_at" > %s RETURNING "value"',
+                [delta, key, time.time()],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found." % key)
+        return row[0]
+
+    def incr_or_create(self, key, delta=1, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Increments a counter, creating it (or restarting it once expired) with
+        `delta` and the given timeout. One statement whatever the counter's state.
+        Returns:
+            int: The counter value after the increment.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        table, connection = self._table_and_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ("key", "value", "expires_at") VALUES (%s, %s, %s) '
+                f'ON CONFLICT ("key") DO UPDATE SET '
+                f'"value" = CASE WHEN {table}."expires_at" > %s THEN {table}."value" + excluded."value" ELSE excluded."value" END, '
+                f'"expires_at" = CASE WHEN {table}."expires_at" > %s THEN {table}."expires_at" ELSE excluded."expires_at" END '
+                f'RETURNING "value"',
+                [key, delta, self._expires_at(timeout, now), now, now],
+            )
+            value = cursor.fetchone()[0]
+        self._maybe_cull(now)
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted, _ = RateLimitCounter.objects.using(self._db()).filter(key=key).delete()
+        return bool(deleted)
+
+    def clear(self):
+        RateLimitCounter.objects.using(self._db()).all().delete()
+
+    def cull(self):
+        """Deletes every expired counter."""
+        deleted, _ = RateLimitCounter.objects.using(self._db()).filter(expires_at__lte=time.time()).delete()
+        return deleted
+
+    def _maybe_cull(self, now):
+        self._writes += 1
+        if self._cull_every and self._writes % self._cull_every == 0:
+            self.cull()
+
+    def _expires_at(self, timeout, now):
+        expires_at = self.get_backend_timeout(timeout)
+        # Counters without a timeout live for a year
+        return now + 365 * 24 * 3600 if expires_at is None else expires_at
+
+    def _to_int(self, value):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise TypeError('DatabaseCounterCache only stores integer counters.')
+        return value
+
+    def _db(self):
+        return router.db_for_write(RateLimitCounter)
+
+    def _table_and_connection(self):
+        connection = connections[self._db()]
+        if not supports_update_returning(connection):
+            raise NotSupportedError('DatabaseCounterCache requires PostgreSQL or SQLite >= 3.35.')
+        return connection.ops.quote_name(RateLimitCounter._meta.db_table), connection
@@ -0,0 +1,251 @@
+from django.db import connections, transaction
+from django.db.models import BooleanField, DateTimeField, F, Max, Value, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Todo, TodoChange, TodoListVersion, user_todo_db
+from .replicas import pin_primary, reads_from_replica
+from .shards import check_user_shard, todo_databases
+from .serializers import TodoSerializer, serialize_todo_rows
+
+
+class ResyncRequired(Exception):
+    """Raised when the changes after a seq are no longer all in the change log."""
+
+
+# Columns of a change log row, as written by `record_changes` and `record_deletions`
+CHANGE_COLUMNS = ('user', 'todo_id', 'seq', 'deleted', 'changed_at')
+# Rows per INSERT statement, well below SQLite's limit of bound parameters
+UPSERT_BATCH_SIZE = 1000
+
+
+def upsert_changes_sql(connection, rows_sql):
+    """
+    Wraps `VALUES ...` or a `SELECT` of `CHANGE_COLUMNS` into the change log
+    upsert: a to-do keeps one row, overwritten by its latest change. Raw SQL
+    rather than `bulk_create`, which spends far longer building and preparing
+    model instances than the database spends writing the rows.
+    """
+    quote = connection.ops.quote_name
+    table = quote(TodoChange._meta.db_table)
+    columns = [quote(TodoChange._meta.get_field(name).column) for name in CHANGE_COLUMNS]
+    user, todo, seq, deleted, changed_at = columns
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) {rows_sql} '
+        f'ON CONFLICT ({user}, {todo}) DO UPDATE SET '
+        f'{seq} = excluded.{seq}, {deleted} = excluded.{deleted}, {changed_at} = excluded.{changed_at}'
+    )
+
+
+def record_changes(user_id, upserted=(), deleted=()):
+    """
+    Logs a write to a user's to-dos for delta sync, and bumps the list version.
+
+    Must run inside the transaction of the write itself: the version row of the
+    user stays locked from the bump until commit, so the writes of one user
+    commit in the order of their seqs and a reader never sees seq N + 1 before
+    seq N. Each changed to-do gets the next number of the change sequence and
+    its single `TodoChange` row is upserted; a to-do listed in both `upserted`
+    and `deleted` ends up as a tombstone.
+    Args:
+        user_id: Owner of the changed to-dos.
+        upserted: Ids of the created or updated to-dos.
+        deleted: Ids of the deleted to-dos.
+    Returns:
+        int: The new list version, for `todos_changed`.
+    """
+    operations = dict.fromkeys(upserted, False)
+    operations.update(dict.fromkeys(deleted, True))
+    db = user_todo_db(user_id)
+    connection = connections[db]
+    with transaction.atomic(using=db):
+        version, last_seq = TodoListVersion.objects.bump(user_id, changes=len(operations))
+        check_user_shard(user_id, db)
+        first_seq = last_seq - len(operations) + 1
+        changed_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        rows = [
+            (user_id, todo_id, first_seq + n, is_deleted, changed_at)
+            for n, (todo_id, is_deleted) in enumerate(sorted(operations.items()))
+        ]
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                cursor.execute(
+                    upsert_changes_sql(connection, f'VALUES {values}'), [value for row in batch for value in row],
+                )
+    return version
+
+
+def record_deletions(user_id, todos, count):
+    """
+    Like `record_changes(user_id, deleted=...)` for every to-do of a queryset,
+    without reading their ids: the tombstones are written by one
+    `INSERT ... SELECT`, numbered with `ROW_NUMBER()`. For deletions too large
+    to pass around as lists of ids, e.g. a deferred clear.
+    Args:
+        user_id: Owner of the to-dos.
+        todos: `Todo` queryset of the `count` deleted to-dos (still in the table).
+        count: Number of to-dos the queryset selects.
+    Returns:
+        int: The new list version.
+    """
+    db = user_todo_db(user_id)
+    connection = connections[db]
+    with transaction.atomic(using=db):
+        version, last_seq = TodoListVersion.objects.bump(user_id, changes=count)
+        check_user_shard(user_id, db)
+        rows = todos.order_by().values_list(
+            'user_id',
+            'id',
+            Window(RowNumber(), order_by=F('id').asc()) + Value(last_seq - count),
+            Value(True, output_field=BooleanField()),
+            Value(timezone.now(), output_field=DateTimeField()),
+        )
+        select, params = rows.query.get_compiler(db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(upsert_changes_sql(connection, select), params)
+    return version
+
+
+def create_todo(user_id, **fields):
+    """
+    Creates a to-do and logs it, in one transaction.
+    Returns:
+        tuple: The created to-do and the new list version.
+    """
+    with transaction.atomic(using=user_todo_db(user_id)):
+        todo = Todo.objects.for_user(user_id).create(user_id=user_id, **fields)
+        version = record_changes(user_id, upserted=[todo.pk])
+    return todo, version
+
+
+def toggle_todos(todos, user_id):
+    """
+    Toggles the to-dos of a queryset (see `TodoQuerySet.toggle`) and logs them,
+    in one transaction.
+    Args:
+        todos: Queryset of the user's to-dos, from `Todo.objects.for_user()`.
+        user_id: Owner of the to-dos.
+    Returns:
+        tuple: The toggled to-dos and the new list version, None if none matched.
+    """
+    with transaction.atomic(using=user_todo_db(user_id)):
+        updated = todos.toggle()
+        version = record_changes(user_id, upserted=[todo.pk for todo in updated]) if updated else None
+    return updated, version
+
+
+def changes_since(user_id, since, limit):
+    """
+    Reads the changes of a user's to-dos after a seq, oldest first.
+
+    Upserts carry the current state of the to-do, deletions only its id. With
+    `since` 0 the feed is a full sync: every live to-do plus the tombstones not
+    compacted yet, which a client starting empty can simply skip.
+    Args:
+        user_id: Owner of the to-dos.
+        since: Last seq the client applied, 0 for a full sync.
+        limit: Most changes returned.
+    Returns:
+        dict: The `changes`, the `seq` to pass as `since` next time and
+        whether more changes follow (`has_more`).
+    Raises:
+        ResyncRequired: When tombstones after `since` were compacted, or
+        `since` is ahead of the user's change sequence (on the primary, when
+        the replica read is behind).
+    """
+    rows = list(change_log_rows(user_id, since, limit))
+    live_ids = [todo_id for _, todo_id, deleted in rows[:limit] if not deleted]
+    todos = list(live_todo_rows(user_id, live_ids)) if live_ids else []
+    # Read after the log: a compaction that ran meanwhile is seen here
+    sequence = change_sequence(user_id).first() or (0, 0)
+    if since > sequence[0] and reads_from_replica():
+        # The client got `since` from the primary or a replica further ahead
+        pin_primary()
+        return changes_since(user_id, since, limit)
+    return build_changes(rows, todos, sequence, since, limit)
+
+
+async def achanges_since(user_id, since, limit):
+    """Async counterpart of `changes_since`, on the async ORM (reads only, no transaction)."""
+    rows = [row async for row in change_log_rows(user_id, since, limit)]
+    live_ids = [todo_id for _, todo_id, deleted in rows[:limit] if not deleted]
+    todos = [row async for row in live_todo_rows(user_id, live_ids)] if live_ids else []
+    sequence = await change_sequence(user_id).afirst() or (0, 0)
+    if since > sequence[0] and reads_from_replica():
+        pin_primary()
+        return await achanges_since(user_id, since, limit)
+    return build_changes(rows, todos, sequence, since, limit)
+
+
+def change_log_rows(user_id, since, limit):
+    # One row more than the limit tells whether more changes follow
+    return (
+        TodoChange.objects.for_user(user_id).filter(seq__gt=since)
+        .order_by('seq').values_list('seq', 'todo_id', 'deleted')[:limit + 1]
+    )
+
+
+def live_todo_rows(user_id, ids):
+    return Todo.objects.for_user(user_id).filter(id__in=ids).values(*TodoSerializer.Meta.fields)
+
+
+def change_sequence(user_id):
+    return TodoListVersion.objects.for_user(user_id).values_list('change_seq', 'compacted_seq')
+
+
+def build_changes(rows, todos, sequence, since, limit):
+    """
+    Builds the `changes_since` response from the change log rows (up to
+    `limit` + 1), the live to-do rows they reference and the user's
+    `(change_seq, compacted_seq)`.
+    """
+    change_seq, compacted_seq = sequence
+    if since and (since < compacted_seq or since > change_seq):
+        raise ResyncRequired()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    todos = {row['id']: row for row in serialize_todo_rows(todos)}
+
+    changes = []
+    for seq, todo_id, deleted in rows:
+        todo = None if deleted else todos.get(todo_id)
+        if todo is None:
+            # Deleted after the log was read, its tombstone comes with a later seq
+            changes.append({'seq': seq, 'op': 'delete', 'id': todo_id})
+        else:
+            changes.append({'seq': seq, 'op': 'upsert', 'todo': todo})
+    return {
+        'changes': changes,
+        'seq': rows[-1][0] if rows else since,
+        'has_more': has_more,
+    }
+
+
+def compact_changes(before):
+    """
+    Prunes the tombstones recorded before `before`.
+
+    For each user concerned, the highest pruned seq becomes `compacted_seq`
+    in the same transaction as the delete, so that a client still syncing from
+    an older seq gets `ResyncRequired` instead of silently missing deletions.
+    The live to-dos keep their rows: a full sync never needs old tombstones.
+    Args:
+        before: Datetime, tombstones changed earlier are pruned.
+    Returns:
+        int: The number of pruned tombstones.
+    """
+    pruned = 0
+    for db in todo_databases():
+        stale = list(
+            TodoChange.objects.using(db).filter(deleted=True, changed_at__lt=before)
+            .values('user_id').annotate(last_seq=Max('seq')).values_list('user_id', 'last_seq')
+        )
+        for user_id, last_seq in stale:
+            with transaction.atomic(using=db):
+                TodoListVersion.objects.using(db).filter(user_id=user_id, compacted_seq__lt=last_seq).update(
+                    compacted_seq=last_seq,
+                )
+                pruned += TodoChange.objects.using(db).filter(user_id=user_id, deleted=True, seq__lte=last_seq).delete()[0]
+    return pruned
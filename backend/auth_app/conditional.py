@@ -0,0 +1,55 @@
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+
+
+def todo_etag(todo):
+    """Returns the strong ETag of a single to-do item, derived from its row version."""
+    return quote_etag(str(todo.version))
+
+
+def todo_list_etag(user_id, list_version, page_key):
+    """
+    Returns the strong ETag of one page of a user's to-do list.
+    The user id is part of the tag so that a browser shared by two accounts
+    never revalidates one user's cached page for the other.
+    """
+    key = f'{user_id}:{list_version}:{page_key}'
+    return quote_etag(hashlib.sha256(key.encode()).hexdigest()[:32])
+
+
+def if_none_match(request, etag):
+    """
+    Whether the `If-None-Match` header matches the given ETag (weak comparison),
+    meaning the client's copy is current and a 304 can be returned.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return etags == ['*'] or etag in (tag.removeprefix('W/') for tag in etags)
+
+
+def parse_if_match(request):
+    """
+    Reads the row versions a client expects from the `If-Match` header.
+    Returns:
+        list | None: The expected versions, or None when the header is absent or `*`.
+        An empty list means no listed ETag can ever match (weak or foreign ETags),
+        which must be answered with 412 Precondition Failed.
+    """
+    header = request.META.get('HTTP_IF_MATCH')
+    if not header:
+        return None
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return None
+    versions = []
+    for etag in etags:
+        # If-Match uses strong comparison, so weak validators never match
+        if etag.startswith('W/'):
+            continue
+        value = etag.strip('"')
+        if value.isdigit():
+            versions.append(int(value))
+    return versions
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .renderers import orjson
+
+# SSE event names of the `todos_changed` actions
+EVENT_TYPES = {
+    'create': 'created',
+    'update': 'updated',
+    'toggle': 'toggled',
+    'delete': 'deleted',
+    'clear': 'cleared',
+    'batch': 'batch',
+    'import': 'imported',
+    # The list moved to another shard with new ids: clients reload it
+    'move': 'reset',
+}
+
+
+class TooManyConnections(Exception):
+    """Raised when a user already has the maximum number of open event streams."""
+
+
+class TodoEvent:
+    """
+    A change to one user's to-do list.
+    Args:
+        user_id: Owner of the list.
+        id: The list version the change produced, increasing per user; sent as
+            the SSE `id` so clients can resume with `Last-Event-ID`.
+        type: Event name, e.g. 'created' (see `EVENT_TYPES`).
+        data: JSON-serializable details, e.g. the created to-do.
+    """
+    __slots__ = ('user_id', 'id', 'type', 'data')
+
+    def __init__(self, user_id, id, type, data=None):
+        self.user_id = user_id
+        self.id = id
+        self.type = type
+        self.data = data or {}
+
+    def encode(self):
+        """Formats the event as a Server-Sent Events message."""
+        payload = {'version': self.id, **self.data}
+        data = orjson.dumps(payload) if orjson is not None else json.dumps(payload, separators=(',', ':')).encode()
+        return b'id: %d\nevent: %s\ndata: %s\n\n' % (self.id, self.type.encode(), data)
+
+
+class Subscription:
+    """
+    One open event stream. Events reach it from any thread and are queued on
+    the event loop that opened it; a subscriber too slow to drain its queue is
+    flagged as `overflowed` and has to resynchronize.
+    """
+    def __init__(self, user_id, max_pending):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+        self.overflowed = False
+
+    def push(self, event):
+        """Hands an event to the stream; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            pass  # The loop is closed, the stream is gone
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Waits for the next event. Raises `TimeoutError` after `timeout` seconds."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class InProcessEventBroker:
+    """
+    Publishes to-do change events to the event streams of this process.
+
+    Publishers are the write paths, through the `todos_changed` signal;
+    subscribers are the SSE views. The last `history` events of each user are
+    kept so that a reconnecting client can catch up from its `Last-Event-ID`.
+
+    Only streams served by the same process see an event, so with several
+    workers set `TODO_EVENTS_BROKER` to a broker backed by shared storage (the
+    database, files, ...). Such a broker overrides `publish` to write the event
+    to the shared store and `history` to read it back, and calls `deliver`
+    for every event it receives from the store.
+    Args:
+        max_connections: Open streams allowed per user.
+        history: Events kept per user for resuming.
+        max_users: Users whose history is kept, least recently active dropped first.
+        max_pending: Events queued per stream before it counts as overflowed.
+    """
+    def __init__(self, max_connections=5, history=100, max_users=10000, max_pending=100):
+        self.max_connections = max_connections
+        self.history_size = history
+        self.max_users = max_users
+        self.max_pending = max_pending
+        self._subscriptions = {}
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        """Records an event and delivers it to the user's open streams."""
+        with self._lock:
+            events = self._history.get(event.user_id)
+            if events is None:
+                events = self._history[event.user_id] = deque(maxlen=self.history_size)
+            events.append(event)
+            self._history.move_to_end(event.user_id)
+            while len(self._history) > self.max_users:
+                self._history.popitem(last=False)
+        self.deliver(event)
+
+    def deliver(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(event.user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def history(self, user_id, after_id):
+        """
+        Returns the user's events newer than `after_id`, oldest first, or None
+        when some of them are no longer kept and the client must resynchronize.
+        """
+        with self._lock:
+            events = list(self._history.get(user_id, ()))
+        if not events or events[0].id > after_id + 1:
+            return None
+        return [event for event in events if event.id > after_id]
+
+    def subscribe(self, user_id):
+        """Opens a stream for the user. Raises `TooManyConnections` at the limit."""
+        subscription = Subscription(user_id, self.max_pending)
+        with self._lock:
+            subscriptions = self._subscriptions.setdefault(user_id, set())
+            if len(subscriptions) >= self.max_connections:
+                raise TooManyConnections()
+            subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connections(self, user_id):
+        with self._lock:
+            return len(self._subscriptions.get(user_id, ()))
+
+
+todo_events = import_string(getattr(settings, 'TODO_EVENTS_BROKER', 'auth_app.events.InProcessEventBroker'))(
+    max_connections=getattr(settings, 'TODO_EVENTS_MAX_CONNECTIONS', 5),
+    history=getattr(settings, 'TODO_EVENTS_HISTORY', 100),
+)
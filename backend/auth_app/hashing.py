@@ -0,0 +1,104 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+class HashingPoolBusy(Exception):
+    """Raised when too many password hashing jobs are already queued."""
+
+
+def _init_worker():
+    # Spawned workers start with a fresh interpreter, forked ones inherit Django
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _verify_password(password, encoded):
+    from django.contrib.auth.hashers import verify_password
+    return verify_password(password, encoded)
+
+
+def _make_password(password):
+    from django.contrib.auth.hashers import make_password
+    return make_password(password)
+
+
+class PasswordHashingPool:
+    """
+    Runs password hashing and verification in a bounded pool of worker processes.
+
+    PBKDF2 burns tens to hundreds of milliseconds of CPU per call. Running it on
+    the event loop would stall every other connection of the ASGI worker, so the
+    async login / register views hand it to this pool instead. At most
+    `max_pending` jobs may be queued or running at once; further requests are
+    refused with `HashingPoolBusy`, so a login burst turns into quick 503s with
+    `Retry-After` instead of an ever-growing backlog.
+    """
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            return self._executor
+
+    async def verify_password(self, password, encoded):
+        """
+        Checks a password against its encoded hash.
+        Returns:
+            tuple: `(is_correct, must_update)`, where `must_update` tells whether
+            the hash was made with outdated parameters and should be upgraded.
+        """
+        return await self._run(_verify_password, password, encoded)
+
+    async def make_password(self, password):
+        """Hashes a password with the currently preferred hasher and parameters."""
+        return await self._run(_make_password, password)
+
+    def make_passwords(self, passwords):
+        """
+        Hashes many passwords across all the worker processes, for bulk user
+        provisioning. Blocks until all are done; not bounded by `max_pending`,
+        which only sheds request load.
+        Returns:
+            list: The encoded hashes, in the order of `passwords`.
+        """
+        passwords = list(passwords)
+        if not passwords:
+            return []
+        chunksize = max(1, len(passwords) // (self.max_workers * 4))
+        return list(self.executor.map(_make_password, passwords, chunksize=chunksize))
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingPoolBusy()
+            self._pending += 1
+        try:
+            return await asyncio.wrap_future(self.executor.submit(fn, *args))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hashing_pool = PasswordHashingPool(
+    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None),
+    max_pending=getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', None),
+)
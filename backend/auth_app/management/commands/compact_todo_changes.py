@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from auth_app.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Prunes tombstones older than the retention window from the to-do change log. '
+        'Clients syncing from before a pruned tombstone are told to do a full resync.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=settings.TODO_CHANGES_RETENTION_DAYS,
+            help='Keep tombstones this many days (default: TODO_CHANGES_RETENTION_DAYS)',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        pruned = compact_changes(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'{pruned} tombstones pruned'))
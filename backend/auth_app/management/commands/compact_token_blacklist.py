@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth_app.revocation import COMPACT_BATCH_SIZE, compact_token_blacklist
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired outstanding refresh tokens and their blacklist entries, in small '
+        'transactions. Runs once, or keeps compacting with --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE, help='Tokens deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.02, help='Seconds to sleep between batches')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, compacting every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = compact_token_blacklist(options['batch_size'], options['pause'])
+            if deleted or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'{deleted} expired tokens deleted'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
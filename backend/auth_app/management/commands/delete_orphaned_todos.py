@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from auth_app.shards import ORPHAN_BATCH_SIZE, delete_orphaned_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the to-dos, change log and list version of users that no longer exist, on every '
+        'shard. Their foreign keys have no database constraint, so users deleted outside Django '
+        '(raw SQL, a restore of default) leave them behind.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=ORPHAN_BATCH_SIZE, help='User ids checked per query on default',
+        )
+
+    def handle(self, *args, **options):
+        deleted = delete_orphaned_rows(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rows of {deleted} deleted users removed'))
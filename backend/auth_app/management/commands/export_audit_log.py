@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from auth_app.audit import audit_events
+from auth_app.transfer import FORMATS, iter_audit_export
+
+
+def parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f'Not a date and time: {value}')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams the audit trail, oldest entry first, as NDJSON or CSV to a file or '
+        'stdout. Entries are written in batches, up to AUDIT_LOG_FLUSH_SECONDS after the event.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only the entries of this user id')
+        parser.add_argument('--action', help='Only the entries of this action, e.g. login_failed')
+        parser.add_argument('--since', type=parse_moment, help='From this date and time (ISO 8601), inclusive')
+        parser.add_argument('--until', type=parse_moment, help='Until this date and time (ISO 8601), exclusive')
+        parser.add_argument('--type', choices=sorted(FORMATS), default='ndjson', help='File format')
+        parser.add_argument('--output', help='File to write, stdout by default')
+
+    def handle(self, *args, **options):
+        events = audit_events(options['user'], options['action'], options['since'], options['until'])
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in iter_audit_export(events, options['type']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
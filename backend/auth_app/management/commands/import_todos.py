@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_app.transfer import IMPORT_BATCH_SIZE, PARSERS, TodoImporter
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports to-dos for a user from an NDJSON or CSV file (as produced by the export '
+        'endpoint), streaming the file and inserting in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for standard input')
+        parser.add_argument('--user', required=True, help='Username, email or id of the owner')
+        parser.add_argument('--type', choices=sorted(PARSERS), help='File format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per insert and transaction')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        path = options['path']
+        file_format = options['type'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+        started = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - started
+            self.stderr.write(
+                f"\r{result['imported']} imported, {result['skipped']} skipped "
+                f"({result['imported'] / elapsed if elapsed else 0:.0f} rows/s)",
+                ending='',
+            )
+
+        importer = TodoImporter(user, batch_size=options['batch_size'], progress=progress)
+        if path == '-':
+            result = importer.run(PARSERS[file_format](sys.stdin.buffer))
+        else:
+            try:
+                with open(path, 'rb') as f:
+                    result = importer.run(PARSERS[file_format](f))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        self.stderr.write('')
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} to-dos for {user.username}, skipped {result['skipped']}."
+        ))
+
+    def get_user(self, identifier):
+        User = get_user_model()
+        lookup = {'pk': int(identifier)} if identifier.isdigit() else (
+            {'email': identifier} if '@' in identifier else {'username': identifier}
+        )
+        try:
+            return User.objects.get(**lookup)
+        except (User.DoesNotExist, User.MultipleObjectsReturned):
+            raise CommandError(f'No single user matches {identifier!r}')
@@ -0,0 +1,13 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from auth_app.shards import todo_databases
+
+
+class Command(BaseCommand):
+    help = 'Applies the migrations to every to-do shard (DATABASE_SHARD_URLS), default included.'
+
+    def handle(self, *args, **options):
+        for alias in todo_databases():
+            self.stdout.write(f'Migrating {alias}')
+            call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'])
@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_app.hashing import PasswordHashingPool, hashing_pool
+from auth_app.provisioning import PARSERS, PROVISION_BATCH_SIZE, UserProvisioner
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates users from an NDJSON or CSV file with username, email and password (or '
+        'password_hash) fields, hashing passwords in a process pool and inserting in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, or - for standard input')
+        parser.add_argument('--type', choices=sorted(PARSERS), help='File format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=PROVISION_BATCH_SIZE, help='Users per insert and transaction')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: PASSWORD_HASHING_WORKERS)')
+        parser.add_argument(
+            '--skip-password-validation', action='store_true',
+            help='Do not run the password validators, e.g. for load test users',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['type'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        pool = PasswordHashingPool(max_workers=options['workers']) if options['workers'] else hashing_pool
+
+        started = time.monotonic()
+
+        def progress(result):
+            elapsed = time.monotonic() - started
+            self.stderr.write(
+                f"\r{result['created']} created, {result['skipped']} skipped "
+                f"({result['created'] / elapsed if elapsed else 0:.0f} users/s)",
+                ending='',
+            )
+
+        provisioner = UserProvisioner(
+            batch_size=options['batch_size'],
+            validate_passwords=not options['skip_password_validation'],
+            pool=pool,
+            progress=progress,
+        )
+        try:
+            if path == '-':
+                result = provisioner.run(PARSERS[file_format](sys.stdin.buffer))
+            else:
+                try:
+                    with open(path, 'rb') as f:
+                        result = provisioner.run(PARSERS[file_format](f))
+                except OSError as exc:
+                    raise CommandError(exc)
+        finally:
+            pool.shutdown()
+
+        self.stderr.write('')
+        for error in result['errors']:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f"Created {result['created']} users, skipped {result['skipped']}."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth_app.purge import PURGE_BATCH_SIZE, purge_deleted_todos
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the to-dos hidden by deferred clears of completed items, in small '
+        'transactions. Runs once, or keeps polling with --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.02, help='Seconds to sleep between batches')
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, purging every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_deleted_todos(options['batch_size'], options['pause'])
+            if purged or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'{purged} to-dos purged'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from auth_app.models import Todo
+from auth_app.shards import hash_ring, move_user, sharding_enabled, todo_databases
+from auth_app.signals import todos_changed
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves users whose to-dos are not on the shard the hash ring gives them, e.g. after '
+        'adding a shard or listing one in TODO_DRAINING_SHARDS. With --user, moves one user '
+        'to --to. Each move locks the user\'s list for its duration and renumbers the to-dos, '
+        'so clients reload their list.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Move only this user id')
+        parser.add_argument('--to', help='Destination shard alias for --user (default: from the hash ring)')
+        parser.add_argument('--limit', type=int, help='Move at most this many users')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between users')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is off, set DATABASE_SHARD_URLS')
+        ring = hash_ring()
+        if options['to'] is not None and options['to'] not in todo_databases():
+            raise CommandError(f'Unknown shard {options["to"]}, expected one of {", ".join(todo_databases())}')
+
+        users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+            if not users.exists():
+                raise CommandError(f'No user {options["user"]}')
+        moves = []
+        for user_id, shard in users.values_list('pk', 'todo_shard__shard').iterator():
+            current = shard or DEFAULT_DB_ALIAS
+            target = options['to'] or ring.shard_for(user_id)
+            if current != target:
+                moves.append((user_id, current, target))
+                if options['limit'] and len(moves) >= options['limit']:
+                    break
+
+        moved_todos = 0
+        for user_id, current, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f'user {user_id}: {current} -> {target}')
+                continue
+            count, version = move_user(user_id, target)
+            moved_todos += count
+            if version is not None:
+                todos_changed.send(sender=Todo, user_id=user_id, action='move', version=version)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'user {user_id}: {current} -> {target}, {count} to-dos')
+            if options['pause']:
+                time.sleep(options['pause'])
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{len(moves)} users moved ({moved_todos} to-dos)'))
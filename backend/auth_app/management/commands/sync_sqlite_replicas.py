@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the SQLite primary database into the SQLite files configured as read '
+        'replicas (DATABASE_REPLICA_URLS), to try replica routing locally. Runs once, or '
+        'keeps copying with --interval, which then plays the part of the replication lag.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help='Keep running, copying every this many seconds')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite, use the replication of its server')
+        replicas = [connections[alias].settings_dict['NAME'] for alias in settings.DATABASE_REPLICAS]
+        if not replicas or any(connections[alias].vendor != 'sqlite' for alias in settings.DATABASE_REPLICAS):
+            raise CommandError('Set DATABASE_REPLICA_URLS to SQLite files, e.g. sqlite:///replica1.sqlite3')
+        while True:
+            primary.ensure_connection()
+            for name in replicas:
+                target = sqlite3.connect(name)
+                try:
+                    # Online backup: a consistent snapshot, while the primary keeps taking writes
+                    primary.connection.backup(target)
+                finally:
+                    target.close()
+            if not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'{len(replicas)} replicas synced'))
+                return
+            time.sleep(options['interval'])
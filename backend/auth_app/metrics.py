@@ -0,0 +1,277 @@
+import bisect
+import hmac
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+# Timings of the request being handled, set by `RequestMetricsMiddleware`.
+# A ContextVar follows the request into async views and sync_to_async threads.
+current_timings = ContextVar('current_timings', default=None)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_DISABLED = nullcontext()
+
+
+class RequestTimings:
+    """
+    Timings collected while handling one request.
+
+    Phases are exclusive and add up to the total: `middleware` (everything
+    outside the view, including URL resolution), `auth` (JWT verification),
+    `view`, `serialization` and `render`. Database time overlaps them and is
+    reported on its own, with the number of queries.
+    """
+    __slots__ = (
+        'started', 'phases', 'queries', 'db_time', 'cache_hits', 'cache_misses',
+        'view_started', 'nested_before_view', 'render_started',
+    )
+    # Phases that may be timed inside the view and are not view time
+    nested_phases = ('auth', 'serialization', 'render')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_started = None
+        self.nested_before_view = 0.0
+        self.render_started = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def start_view(self):
+        self.view_started = time.perf_counter()
+        self.nested_before_view = self._nested()
+
+    def stop_view(self):
+        if self.view_started is None:
+            return
+        span = time.perf_counter() - self.view_started
+        self.view_started = None
+        self.add('view', span - (self._nested() - self.nested_before_view))
+
+    def start_render(self):
+        self.stop_view()
+        self.render_started = time.perf_counter()
+
+    def stop_render(self, response=None):
+        if self.render_started is not None:
+            self.add('render', time.perf_counter() - self.render_started)
+            self.render_started = None
+
+    def finish(self):
+        """Closes the open phases. Returns the phase durations, including `middleware` and `total`."""
+        self.stop_view()
+        total = time.perf_counter() - self.started
+        phases = dict(self.phases)
+        phases['middleware'] = max(0.0, total - sum(phases.values()))
+        phases['total'] = total
+        return phases
+
+    def _nested(self):
+        return sum(self.phases.get(phase, 0.0) for phase in self.nested_phases)
+
+
+@contextmanager
+def _timed(timings, phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+
+
+def timed(phase):
+    """
+    Context manager adding the time spent in its block to a phase of the
+    current request. A no-op when request metrics are disabled.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        return _DISABLED
+    return _timed(timings, phase)
+
+
+def count_cache(hit):
+    """Counts a response cache hit or miss for the current request."""
+    timings = current_timings.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.db_time += time.perf_counter() - started
+
+
+def _install_db_wrapper(sender=None, connection=None, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def install_db_instrumentation():
+    """Counts and times the queries of every database connection, now and future ones."""
+    connection_created.connect(_install_db_wrapper, dispatch_uid='auth_app.metrics')
+    for connection in connections.all(initialized_only=True):
+        _install_db_wrapper(connection=connection)
+
+
+def server_timing_header(phases, timings):
+    """Formats the timings as a `Server-Timing` header value (durations in ms)."""
+    entries = [
+        f'{name};dur={phases[name] * 1000:.2f}'
+        for name in ('total', 'middleware', 'auth', 'view', 'serialization', 'render')
+        if name in phases
+    ]
+    entries.append(f'db;dur={timings.db_time * 1000:.2f};desc="{timings.queries} queries"')
+    if timings.cache_hits or timings.cache_misses:
+        entries.append(f'cache;desc="{timings.cache_hits} hit, {timings.cache_misses} miss"')
+    return ', '.join(entries)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus model."""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetricsRegistry:
+    """
+    In-process aggregate of the request timings, per route and method.
+
+    Every worker process keeps its own registry; scrape each worker (or sum the
+    series) when running several.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.responses = {}
+            self.phases = {}
+            self.queries = {}
+            self.db_time = {}
+            self.cache = {'hit': 0, 'miss': 0}
+
+    def observe(self, method, route, status, phases, timings):
+        method = method if method in KNOWN_METHODS else 'OTHER'
+        key = (method, route)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(phases['total'])
+            status_key = (method, route, str(status))
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+            for phase, seconds in phases.items():
+                if phase != 'total':
+                    phase_key = (method, route, phase)
+                    self.phases[phase_key] = self.phases.get(phase_key, 0.0) + seconds
+            self.queries[key] = self.queries.get(key, 0) + timings.queries
+            self.db_time[key] = self.db_time.get(key, 0.0) + timings.db_time
+            self.cache['hit'] += timings.cache_hits
+            self.cache['miss'] += timings.cache_misses
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                '# HELP http_request_duration_seconds Request latency.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = _labels(method=method, route=route)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(bound)
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {histogram.sum!r}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            lines += ['# HELP http_responses_total Responses by status code.', '# TYPE http_responses_total counter']
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{{_labels(method=method, route=route, status=status)}}} {count}')
+
+            lines += [
+                '# HELP http_request_phase_seconds_total Time spent per request phase.',
+                '# TYPE http_request_phase_seconds_total counter',
+            ]
+            for (method, route, phase), seconds in sorted(self.phases.items()):
+                lines.append(f'http_request_phase_seconds_total{{{_labels(method=method, route=route, phase=phase)}}} {seconds!r}')
+
+            lines += ['# HELP http_request_db_queries_total Database queries run.', '# TYPE http_request_db_queries_total counter']
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(f'http_request_db_queries_total{{{_labels(method=method, route=route)}}} {count}')
+
+            lines += ['# HELP http_request_db_seconds_total Time spent in database queries.', '# TYPE http_request_db_seconds_total counter']
+            for (method, route), seconds in sorted(self.db_time.items()):
+                lines.append(f'http_request_db_seconds_total{{{_labels(method=method, route=route)}}} {seconds!r}')
+
+            lines += ['# HELP todo_list_cache_requests_total Rendered to-do page cache lookups.', '# TYPE todo_list_cache_requests_total counter']
+            for result, count in sorted(self.cache.items()):
+                lines.append(f'todo_list_cache_requests_total{{result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = RequestMetricsRegistry()
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Exposes the request metrics of this process in Prometheus text format.
+    Answers 404 unless `REQUEST_METRICS` is on; when `METRICS_TOKEN` is set the
+    scraper must send it as `Authorization: Bearer <token>`.
+    """
+    if not settings.REQUEST_METRICS:
+        raise Http404()
+    token = settings.METRICS_TOKEN
+    if token:
+        sent = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(sent.encode(), token.encode()):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:09
+
+import auth_app.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+from auth_app.search import drop_search_index, install_search_index
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0006_todo_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoSearchEntry',
+            fields=[
+                ('todo', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='auth_app.todo')),
+                ('document', auth_app.models.FullTextField(db_column='auth_app_todo_fts')),
+            ],
+            options={
+                'db_table': 'auth_app_todo_fts',
+                'managed': False,
+            },
+        ),
+        # SQLite: FTS5 table and sync triggers, PostgreSQL: GIN index on the tsvector
+        migrations.RunPython(create_search_index, remove_search_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def log_existing_todos(apps, schema_editor):
+    """Gives every existing to-do its change log row, so a full sync returns it."""
+    Todo = apps.get_model('auth_app', 'Todo')
+    TodoChange = apps.get_model('auth_app', 'TodoChange')
+    TodoListVersion = apps.get_model('auth_app', 'TodoListVersion')
+    db = schema_editor.connection.alias
+    now = django.utils.timezone.now()
+    last_seqs = {}
+    batch = []
+    todos = Todo.objects.using(db).order_by('user_id', 'id').values_list('user_id', 'id')
+    for user_id, todo_id in todos.iterator(chunk_size=2000):
+        seq = last_seqs[user_id] = last_seqs.get(user_id, 0) + 1
+        batch.append(TodoChange(user_id=user_id, todo_id=todo_id, seq=seq, changed_at=now))
+        if len(batch) >= 2000:
+            TodoChange.objects.using(db).bulk_create(batch)
+            batch = []
+    TodoChange.objects.using(db).bulk_create(batch)
+    for user_id, seq in last_seqs.items():
+        if not TodoListVersion.objects.using(db).filter(user_id=user_id).update(change_seq=seq):
+            TodoListVersion.objects.using(db).create(user_id=user_id, change_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0007_todo_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todolistversion',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='todolistversion',
+            name='compacted_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TodoChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('todo_id', models.BigIntegerField()),
+                ('seq', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='todo_changes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('deleted', True)), fields=['changed_at'], name='todo_change_tombstone_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'todo_id'), name='todo_change_user_todo_uniq'), models.UniqueConstraint(fields=('user', 'seq'), name='todo_change_user_seq_uniq')],
+            },
+        ),
+        migrations.RunPython(log_existing_todos, migrations.RunPython.noop),
+    ]
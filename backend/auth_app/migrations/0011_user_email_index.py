@@ -0,0 +1,21 @@
+from django.db import migrations
+
+# Login, registration and user provisioning look users up by email, which
+# django.contrib.auth does not index. Not unique: existing rows may share an
+# email (superusers created without one, older registration races).
+INDEX_NAME = 'auth_user_email_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('auth_app', '0010_todo_shards'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {INDEX_NAME} ON auth_user (email)',
+            f'DROP INDEX {INDEX_NAME}',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0011_user_email_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('action', models.CharField(max_length=32)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'id'], name='audit_event_user_idx'), models.Index(fields=['created_at'], name='audit_event_created_idx')],
+            },
+        ),
+    ]
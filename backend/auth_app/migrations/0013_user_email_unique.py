@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count
+
+# Registration and provisioning check that an email is free before inserting,
+# which two concurrent requests can both pass: only a unique index closes the
+# race. Partial, since users without an email (e.g. superusers) store '' and
+# may be many. It also serves the lookups by email, replacing the plain index
+# of 0011.
+INDEX_NAME = 'auth_user_email_uniq'
+OLD_INDEX_NAME = 'auth_user_email_idx'
+
+
+def check_duplicate_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias).exclude(email='')
+        .values('email').annotate(users=Count('id')).filter(users__gt=1)
+        .values_list('email', flat=True)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Users share these emails, give them distinct emails (or clear them) '
+            f'before migrating: {", ".join(duplicates)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0012_audit_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            [
+                f"CREATE UNIQUE INDEX {INDEX_NAME} ON auth_user (email) WHERE email <> ''",
+                f'DROP INDEX {OLD_INDEX_NAME}',
+            ],
+            [
+                f'CREATE INDEX {OLD_INDEX_NAME} ON auth_user (email)',
+                f'DROP INDEX {INDEX_NAME}',
+            ],
+        ),
+    ]
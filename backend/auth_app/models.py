@@ -1,11 +1,332 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.sql import UpdateQuery
 from django.contrib.auth.models import User
+from django.core.exceptions import EmptyResultSet
+from django.utils import timezone
+
+
+def supports_update_returning(connection):
+    """
+    Whether the backend accepts `UPDATE ... RETURNING` (PostgreSQL, SQLite >= 3.35).
+    SQLite gained RETURNING for INSERT and UPDATE in the same release, so the
+    insert feature flag doubles as a version check there.
+    """
+    return (
+        connection.vendor in ('postgresql', 'sqlite')
+        and connection.features.can_return_columns_from_insert
+    )
+
+
+def user_todo_db(user_id):
+    """
+    The database alias holding a user's to-dos, change log and list version,
+    for their transactions and raw queries (see `auth_app.shards`).
+    """
+    return router.db_for_write(Todo, user_id=user_id)
+
+
+class UserOwnedQuerySet(models.QuerySet):
+    def for_user(self, user_id):
+        """
+        The rows of one user, read from and written to the database holding
+        them: the `user_id` hint lets `auth_app.shards.ShardRouter` pick the
+        user's shard, including for `bulk_create` and `update` on the result.
+        """
+        clone = self.filter(user_id=user_id)
+        clone._hints = {**self._hints, 'user_id': user_id}
+        return clone
+
+
+class TodoQuerySet(UserOwnedQuerySet):
+    def update_returning(self, **changes):
+        """
+        Updates the matching rows and bumps their `version` in one conditional
+        UPDATE statement, returning the updated rows as model instances.
+
+        Row filters (ownership, expected `version`, ...) belong on the queryset, so
+        a concurrent writer can never be overwritten silently: rows that no longer
+        match are simply not updated and not returned. Backends without
+        `UPDATE ... RETURNING` fall back to a locked update-and-refetch inside a
+        transaction.
+        Args:
+            **changes: Field values or expressions, as for `QuerySet.update`.
+        Returns:
+            list: The updated to-do items.
+        """
+        changes.setdefault('version', F('version') + 1)
+        # As QuerySet.update() does, so that self.db is the database written to
+        self._for_write = True
+        connection = connections[self.db]
+        if not supports_update_returning(connection):
+            with transaction.atomic(using=self.db):
+                pks = list(self.select_for_update().values_list('pk', flat=True))
+                if not pks:
+                    return []
+                manager = self.model._base_manager.using(self.db)
+                manager.filter(pk__in=pks).update(**changes)
+                return list(manager.filter(pk__in=pks))
+
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(changes)
+        query.clear_select_clause()
+        try:
+            sql, params = query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            # A filter no row can match, e.g. `version__in=[]`
+            return []
+
+        fields = self.model._meta.concrete_fields
+        columns = [field.get_col(self.model._meta.db_table) for field in fields]
+        returning = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with transaction.mark_for_rollback_on_error(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{sql} RETURNING {returning}', params)
+                rows = cursor.fetchall()
+
+        converters = [
+            connection.ops.get_db_converters(col) + col.get_db_converters(connection)
+            for col in columns
+        ]
+        attnames = [field.attname for field in fields]
+        todos = []
+        for row in rows:
+            values = []
+            for value, col, field_converters in zip(row, columns, converters):
+                for converter in field_converters:
+                    value = converter(value, col, connection)
+                values.append(value)
+            todos.append(self.model.from_db(self.db, attnames, values))
+        return todos
+
+    update_returning.alters_data = True
+
+    def toggle(self):
+        """Flips `completed` on the matching rows, see `update_returning`."""
+        return self.update_returning(
+            completed=Case(When(completed=True, then=Value(False)), default=Value(True)),
+        )
+
+    toggle.alters_data = True
+
+    async def atoggle(self):
+        return await sync_to_async(self.toggle)()
+
+    atoggle.alters_data = True
+
+
+class TodoManager(models.Manager.from_queryset(TodoQuerySet)):
+    def get_queryset(self):
+        # Soft-deleted rows only wait for `purge_deleted_todos`, see `auth_app.purge`.
+        # `Todo._base_manager` still sees them.
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Todo(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todos')
+    # No database constraint: with sharding the row may live in another database than the user.
+    # Deleting a user still cascades, in Python and through `delete_sharded_todos` on the other
+    # shards; `manage.py delete_orphaned_todos` removes the rows of users deleted around Django.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todos', db_constraint=False)
     text = models.CharField(max_length=255)
     completed = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so that imports can keep the original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Row version for optimistic concurrency, bumped on every update
+    version = models.PositiveIntegerField(default=1)
+    # Set by a deferred clear: the row is gone for the API and waits for the purge
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = TodoManager()
+
+    class Meta:
+        indexes = [
+            # Backs the keyset-paginated list: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='todo_user_created_id_idx'),
+            # Backs batched clears: WHERE user_id = ? AND completed ORDER BY id LIMIT ?
+            models.Index(fields=['user', 'id'], condition=models.Q(completed=True), name='todo_user_completed_idx'),
+            # Backs the purge: WHERE deleted_at IS NOT NULL LIMIT ?
+            models.Index(
+                fields=['deleted_at'], condition=models.Q(deleted_at__isnull=False), name='todo_pending_purge_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text
+
+
+class FullTextField(models.TextField):
+    """The hidden column of an FTS5 table that is named after the table."""
+
+
+@FullTextField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class TodoSearchEntry(models.Model):
+    """
+    A row of the SQLite FTS5 index over `Todo.text`, for full-text search joins.
+    Unmanaged: the virtual table and the triggers keeping it in sync with the
+    to-dos are created by `auth_app.search.install_search_index`, on SQLite only.
+    """
+    todo = models.OneToOneField(
+        Todo, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry',
+    )
+    # Left operand of MATCH, e.g. `filter(document__match='text : "milk"*')`
+    document = FullTextField(db_column='auth_app_todo_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'auth_app_todo_fts'
+
+
+class TodoListVersionManager(models.Manager.from_queryset(UserOwnedQuerySet)):
+    def current(self, user_id):
+        """Returns the list version of a user, 0 if the list was never written."""
+        return self.for_user(user_id).values_list('version', flat=True).first() or 0
+
+    async def acurrent(self, user_id):
+        return await self.for_user(user_id).values_list('version', flat=True).afirst() or 0
+
+    def bump(self, user_id, changes=0):
+        """
+        Increments the list version of a user, and advances the change sequence
+        by `changes`, with a single atomic UPDATE. Inside a transaction the row
+        stays locked until commit, which serializes the writers of one user.
+        Args:
+            user_id: Owner of the list.
+            changes: Number of to-dos changed by the write, see `TodoChange`.
+        Returns:
+            tuple: The new list version and change sequence.
+        """
+        increments = {'version': F('version') + 1, 'change_seq': F('change_seq') + changes}
+        db = self._db or user_todo_db(user_id)
+        versions = self.using(db).filter(user_id=user_id)
+        if not versions.update(**increments):
+            try:
+                with transaction.atomic(using=db):
+                    versions.create(user_id=user_id, version=1, change_seq=changes)
+                return 1, changes
+            except IntegrityError:
+                # Another request created the row first, count this write as well
+                versions.update(**increments)
+        return versions.values_list('version', 'change_seq').get()
+
+
+class TodoListVersion(models.Model):
+    """
+    Per-user counter bumped by every write to the user's to-do list.
+    The list endpoint derives its ETag from it, so unchanged lists can be
+    revalidated without reading the `Todo` table. It also holds the user's
+    change sequence, the cursor of delta sync (see `TodoChange`).
+    """
+    # No database constraint, like `Todo.user`
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='todo_list_version', db_constraint=False,
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    # Last `TodoChange.seq` handed out
+    change_seq = models.PositiveBigIntegerField(default=0)
+    # Highest seq of the pruned tombstones: syncing from an older seq needs a full resync
+    compacted_seq = models.PositiveBigIntegerField(default=0)
+
+    objects = TodoListVersionManager()
+
+    def __str__(self):
+        return f'{self.user_id}: {self.version}'
+
+
+class TodoChange(models.Model):
+    """
+    The latest change of one to-do, in its owner's change log for delta sync.
+
+    Each write upserts one row per to-do it touched, with the next numbers of the
+    owner's change sequence (see `auth_app.changes.record_changes`), so a to-do
+    has a single row: its last upsert, or a tombstone once deleted. "What changed
+    since seq N" is then one index range scan. Tombstones are pruned by the
+    `compact_todo_changes` command.
+    """
+    # No database constraint, like `Todo.user`
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todo_changes', db_constraint=False)
+    # No foreign key: tombstones outlive their to-do
+    todo_id = models.BigIntegerField()
+    seq = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'todo_id'], name='todo_change_user_todo_uniq'),
+            # Backs the change feed: WHERE user_id = ? AND seq > ? ORDER BY seq
+            models.UniqueConstraint(fields=['user', 'seq'], name='todo_change_user_seq_uniq'),
+        ]
+        indexes = [
+            # Backs compaction: tombstones older than the retention window
+            models.Index(fields=['changed_at'], condition=models.Q(deleted=True), name='todo_change_tombstone_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.seq} {"delete" if self.deleted else "upsert"} {self.todo_id}'
+
+
+class UserShard(models.Model):
+    """
+    Directory entry: the database holding a user's to-dos, change log and list
+    version, when sharding is on (see `auth_app.shards`). Users without an
+    entry are on `default`. Lives in `default` only.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='todo_shard')
+    shard = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.shard}'
+
+
+class RateLimitCounter(models.Model):
+    """
+    A fixed-window request counter shared by every worker process.
+    Written only through `auth_app.cache_backends.DatabaseCounterCache`.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    value = models.BigIntegerField()
+    # Unix timestamp, compared without any timezone conversion in raw upserts
+    expires_at = models.FloatField(db_index=True)
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+
+class AuditEvent(models.Model):
+    """
+    One entry of the audit trail: a login, logout, token refresh or to-do
+    change, with who did it, from where and when.
+
+    Entries are queued in memory and inserted in batches by
+    `auth_app.audit.AuditLog`, never updated. `created_at` is when the event
+    happened, not when its batch was written.
+    """
+    created_at = models.DateTimeField(default=timezone.now)
+    # No foreign key: entries outlive their user, and failed logins have none
+    user_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=32)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    data = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Backs a user's history: WHERE user_id = ? ORDER BY id
+            models.Index(fields=['user_id', 'id'], name='audit_event_user_idx'),
+            # Backs time ranges over everyone's entries
+            models.Index(fields=['created_at'], name='audit_event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.created_at:%Y-%m-%d %H:%M:%S} {self.action} {self.user_id}'
@@ -0,0 +1,166 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TodoKeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination for a user's to-do list, newest first.
+
+    Rows are ordered by `(-created_at, -id)` so that todos created in the same
+    instant still have a stable order. Instead of an OFFSET, each page carries an
+    opaque cursor encoding the `(created_at, id)` of its last row, and the next
+    page is fetched with `WHERE (created_at, id) < cursor`. Together with the
+    `(user, -created_at, -id)` index on `Todo` this keeps every page an index
+    range scan of `limit + 1` rows, however many todos the user has.
+    Pages may hold `Todo` instances or `values()` dicts (see `serialize_todo_rows`).
+    Parameters are read from `request.GET`, so the paginator serves both the DRF
+    views and the plain async views.
+
+    Query parameters:
+        - cursor: Opaque cursor returned as `next` by the previous page.
+        - limit: Page size, capped at `max_limit`.
+    """
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request):
+        """Async counterpart of `paginate_queryset`, for the async views."""
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([todo async for todo in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """Narrows the queryset down to the requested page (plus one look-ahead row)."""
+        self.request = request
+        self.limit = self.get_limit(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        # Fetch one extra row to find out whether there is a next page
+        return queryset[:self.limit + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_key(self, request):
+        """
+        Returns a normalized `cursor:limit` string identifying the requested page,
+        used to key per-page ETags without running the query.
+        """
+        cursor = request.GET.get(self.cursor_query_param, '')
+        return f'{cursor}:{self.get_limit(request)}'
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.GET[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last))
+
+    def encode_cursor(self, todo):
+        created_at, pk = (todo['created_at'], todo['id']) if isinstance(todo, dict) else (todo.created_at, todo.pk)
+        position = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = position.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+
+class TodoSearchPagination(TodoKeysetPagination):
+    """
+    Keyset pagination of full-text search results, most recently added first.
+
+    Results are ordered by id alone, not by `created_at`: on SQLite the id is
+    the rowid of the FTS5 index, which can then return a page in order and stop
+    after `limit + 1` matches instead of sorting all of them.
+    Args:
+        key: Field holding the id to order by, `search_entry` for the FTS5 join.
+    """
+    def __init__(self, key='id'):
+        self.key = key
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(f'-{self.key}')
+        if position is not None:
+            queryset = queryset.filter(**{f'{self.key}__lt': position})
+        return queryset[:self.limit + 1]
+
+    def encode_cursor(self, todo):
+        pk = todo['id'] if isinstance(todo, dict) else todo.pk
+        return base64.urlsafe_b64encode(str(pk).encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.GET.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return int(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
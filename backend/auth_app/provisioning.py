@@ -0,0 +1,218 @@
+from functools import partial
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .hashing import hashing_pool
+from .shards import assign_new_users
+from .transfer import MAX_REPORTED_ERRORS, parse_csv, parse_ndjson
+
+PROVISION_BATCH_SIZE = 1000
+
+USERNAME_TAKEN = 'Username already taken'
+EMAIL_TAKEN = 'Email already registered'
+
+# Formats of user files: one record per user, with `username`, `email` and
+# either `password` or `password_hash` (a Django encoded hash, e.g. exported
+# from another deployment); users without either get an unusable password.
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': partial(parse_csv, required='username'),
+}
+
+
+def taken_usernames(username, email):
+    """Usernames of the users holding `username` or `email`: one query, on the username and email indexes."""
+    taken = Q(username=username)
+    if email:
+        # Users without an email all store ''
+        taken |= Q(email=email)
+    return User.objects.filter(taken).values_list('username', flat=True)[:2]
+
+
+def conflict_error(username, taken):
+    if not taken:
+        return None
+    return USERNAME_TAKEN if username in taken else EMAIL_TAKEN
+
+
+def registration_conflict(username, email):
+    """
+    Checks that a username and an email are both free, in a single round trip.
+    Returns:
+        str: The error to report, None when both are free.
+    """
+    return conflict_error(username, list(taken_usernames(username, email)))
+
+
+async def aregistration_conflict(username, email):
+    return conflict_error(username, [name async for name in taken_usernames(username, email)])
+
+
+def integrity_conflict(username, email):
+    """
+    The error to report when inserting a user hit a unique index (username, or
+    non-empty email since migration 0013): the user that took it committed
+    before the index raised, so looking again tells which one.
+    """
+    return registration_conflict(username, email) or USERNAME_TAKEN
+
+
+async def aintegrity_conflict(username, email):
+    return await aregistration_conflict(username, email) or USERNAME_TAKEN
+
+
+class UserProvisioner:
+    """
+    Creates users from parsed records in `bulk_create` batches.
+
+    For each batch, the usernames and emails already taken are looked up in
+    one query, the passwords are hashed across the processes of the hashing
+    pool, and the new users are inserted in one transaction. Like
+    `TodoImporter`, committed batches stay committed if a later one fails, and
+    invalid or duplicate records are skipped and reported with their line
+    numbers (the first `MAX_REPORTED_ERRORS` of them). `bulk_create` sends no
+    `post_save`; the work of its receivers for new users (the shard
+    assignment) is done here.
+    Args:
+        batch_size: Users per lookup, insert and transaction.
+        max_rows: Refuse records beyond this many, None for no limit.
+        validate_passwords: Run `AUTH_PASSWORD_VALIDATORS` on plain passwords.
+        pool: `PasswordHashingPool` hashing the passwords.
+        progress: Optional callable receiving the result dict after each batch.
+    """
+    def __init__(self, batch_size=PROVISION_BATCH_SIZE, max_rows=None, validate_passwords=True, pool=None, progress=None):
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.validate_passwords = validate_passwords
+        self.pool = pool or hashing_pool
+        self.progress = progress
+        self.max_username_length = User._meta.get_field('username').max_length
+        self.result = {'created': 0, 'skipped': 0, 'errors': [], 'truncated': False}
+        # Seen earlier in the file, taken or not
+        self.usernames = set()
+        self.emails = set()
+
+    def run(self, records):
+        """
+        Provisions `(line_number, record)` pairs from the `PARSERS`.
+        Returns:
+            dict: Counts of created and skipped users, plus the first errors.
+        """
+        batch = []
+        for number, record in records:
+            if self.max_rows is not None and self.result['created'] + len(batch) >= self.max_rows:
+                self.result['truncated'] = True
+                break
+            try:
+                batch.append((number, self.build(record)))
+            except ValueError as exc:
+                self.skip(number, str(exc))
+                continue
+            if len(batch) >= self.batch_size:
+                self.insert(batch)
+                batch = []
+        if batch:
+            self.insert(batch)
+        return self.result
+
+    def build(self, record):
+        if isinstance(record, str):
+            raise ValueError(record)
+        username = record.get('username')
+        if not isinstance(username, str) or not username.strip():
+            raise ValueError('username is required')
+        username = User.normalize_username(username.strip())
+        if len(username) > self.max_username_length:
+            raise ValueError(f'username is longer than {self.max_username_length} characters')
+        email = record.get('email') or ''
+        if not isinstance(email, str):
+            raise ValueError('email must be a string')
+        email = User.objects.normalize_email(email.strip())
+        try:
+            User.username_validator(username)
+            if email:
+                validate_email(email)
+        except ValidationError as exc:
+            raise ValueError(' '.join(exc.messages))
+
+        password, encoded = record.get('password') or None, record.get('password_hash') or None
+        if encoded is not None:
+            try:
+                identify_hasher(encoded)
+            except ValueError:
+                raise ValueError('password_hash is not a Django password hash')
+        elif password is not None:
+            if not isinstance(password, str):
+                raise ValueError('password must be a string')
+            if self.validate_passwords:
+                try:
+                    validate_password(password, User(username=username, email=email))
+                except ValidationError as exc:
+                    raise ValueError(' '.join(exc.messages))
+        else:
+            encoded = make_password(None)
+
+        if username in self.usernames:
+            raise ValueError('username appears earlier in the file')
+        if email and email in self.emails:
+            raise ValueError('email appears earlier in the file')
+        self.usernames.add(username)
+        if email:
+            self.emails.add(email)
+        return {'username': username, 'email': email, 'password': password, 'encoded': encoded}
+
+    def insert(self, batch):
+        taken = User.objects.filter(
+            Q(username__in=[row['username'] for _, row in batch])
+            | Q(email__in=[row['email'] for _, row in batch if row['email']])
+        ).values_list('username', 'email')
+        taken_usernames, taken_emails = set(), set()
+        for username, email in taken:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+        fresh = []
+        for number, row in batch:
+            if row['username'] in taken_usernames:
+                self.skip(number, USERNAME_TAKEN)
+            elif row['email'] and row['email'] in taken_emails:
+                self.skip(number, EMAIL_TAKEN)
+            else:
+                fresh.append((number, row))
+
+        to_hash = [row for _, row in fresh if row['encoded'] is None]
+        for row, encoded in zip(to_hash, self.pool.make_passwords(row['password'] for row in to_hash)):
+            row['encoded'] = encoded
+        users = [User(username=row['username'], email=row['email'], password=row['encoded']) for _, row in fresh]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                assign_new_users([user.pk for user in users])
+        except IntegrityError:
+            # Registered meanwhile: insert one by one to find out which
+            self.insert_each(fresh, users)
+        else:
+            self.result['created'] += len(users)
+        if self.progress is not None:
+            self.progress(self.result)
+
+    def insert_each(self, rows, users):
+        for (number, _), user in zip(rows, users):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+            except IntegrityError:
+                self.skip(number, integrity_conflict(user.username, user.email))
+            else:
+                self.result['created'] += 1
+
+    def skip(self, number, message):
+        self.result['skipped'] += 1
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append({'line': number, 'error': message})
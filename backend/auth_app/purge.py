@@ -0,0 +1,143 @@
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from .changes import record_changes, record_deletions
+from .models import Todo, supports_update_returning, user_todo_db
+from .shards import todo_databases
+from .signals import todos_changed
+
+CLEAR_BATCH_SIZE = 500
+PURGE_BATCH_SIZE = 500
+
+
+def delete_batch(todos, batch_size):
+    """
+    Deletes up to `batch_size` to-dos of a queryset, the first ones in its order.
+
+    Without `pre_delete` / `post_delete` receivers or cascades on `Todo`, this is
+    a single bounded `DELETE ... WHERE id IN (SELECT ... LIMIT n) RETURNING id`:
+    no row is loaded into Python. Otherwise the ids are read first and the
+    batch goes through Django's deletion collector, so that receivers run.
+    Args:
+        todos: `Todo` queryset, ordered along an index so that picking a batch
+            reads `batch_size` index entries; from the base manager when
+            soft-deleted rows are meant. Routed like a write: `for_user()`
+            or `using()` picks the database.
+        batch_size: Most rows deleted.
+    Returns:
+        list: Ids of the deleted to-dos.
+    """
+    todos = todos.all()
+    todos._for_write = True
+    db = todos.db
+    connection = connections[db]
+    batch = todos.values('id')[:batch_size]
+    # SQLite gained RETURNING for DELETE in the same release as for UPDATE
+    if supports_update_returning(connection) and Collector(using=db).can_fast_delete(todos):
+        select, params = batch.query.get_compiler(db).as_sql()
+        table = connection.ops.quote_name(Todo._meta.db_table)
+        with transaction.mark_for_rollback_on_error(using=db):
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table} WHERE id IN ({select}) RETURNING id', params)
+                return [row[0] for row in cursor.fetchall()]
+    ids = [row['id'] for row in batch]
+    if ids:
+        Todo._base_manager.using(db).filter(pk__in=ids).delete()
+    return ids
+
+
+def delete_completed_todos(user_id, batch_size=None):
+    """
+    Deletes the completed to-dos of a user in batches of `batch_size`, each in
+    its own short transaction together with its tombstones, so a large clear
+    never holds locks for long. A failure keeps the batches committed so far.
+    Every batch bumps the list version, so each one sends its own `clear`
+    change once committed: event streams see every version and never have to
+    reset over a gap.
+    Returns:
+        tuple: The number of deleted to-dos and the new list version, None if
+        nothing was deleted.
+    """
+    batch_size = batch_size or getattr(settings, 'TODO_CLEAR_BATCH_SIZE', CLEAR_BATCH_SIZE)
+    todos = Todo.objects.for_user(user_id).filter(completed=True).order_by('id')
+    deleted, version = 0, None
+    while True:
+        with transaction.atomic(using=user_todo_db(user_id)):
+            ids = delete_batch(todos, batch_size)
+            if ids:
+                version = record_changes(user_id, deleted=ids)
+        if ids:
+            todos_changed.send(sender=Todo, user_id=user_id, action='clear', version=version, data={'deleted': len(ids)})
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted, version
+
+
+def defer_clear_completed(user_id):
+    """
+    Clears the completed to-dos of a user without deleting them: one UPDATE
+    marks them `deleted_at` (hiding them from every query of `Todo.objects`)
+    and one INSERT writes their tombstones, under a single `clear` change.
+    `purge_deleted_todos` deletes the rows later, in small transactions.
+    Returns:
+        tuple: The number of cleared to-dos and the new list version, None if
+        nothing was cleared.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=user_todo_db(user_id)):
+        cleared = Todo.objects.for_user(user_id).filter(completed=True).update(deleted_at=now)
+        if not cleared:
+            return 0, None
+        version = record_deletions(user_id, Todo._base_manager.filter(user_id=user_id, deleted_at=now), cleared)
+    todos_changed.send(sender=Todo, user_id=user_id, action='clear', version=version, data={'deleted': cleared})
+    return cleared, version
+
+
+def should_defer_clear(user_id):
+    """Whether the user has more completed to-dos than `TODO_CLEAR_DEFER_THRESHOLD` (0: never)."""
+    threshold = getattr(settings, 'TODO_CLEAR_DEFER_THRESHOLD', 0)
+    if not threshold:
+        return False
+    # Reads at most threshold + 1 entries of the completed index, never counts them all
+    return Todo.objects.for_user(user_id).filter(completed=True).order_by('user', 'id')[threshold:].exists()
+
+
+def clear_completed_todos(user_id):
+    """
+    Removes the completed to-dos of a user: deleted right away in batches, or
+    soft-deleted for the purge when there are more than
+    `TODO_CLEAR_DEFER_THRESHOLD` of them.
+    Sends the `todos_changed` of the clear itself.
+    Returns:
+        tuple: The number of cleared to-dos and whether the deletion was
+        deferred.
+    """
+    if should_defer_clear(user_id):
+        return defer_clear_completed(user_id)[0], True
+    return delete_completed_todos(user_id)[0], False
+
+
+def purge_deleted_todos(batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Deletes the soft-deleted to-dos of every user, on every shard, `batch_size`
+    rows per transaction, sleeping `pause` seconds between batches to let other
+    writers in. Their tombstones were written when they were cleared.
+    Returns:
+        int: The number of purged to-dos.
+    """
+    purged = 0
+    for db in todo_databases():
+        todos = Todo._base_manager.using(db).filter(deleted_at__isnull=False)
+        while True:
+            with transaction.atomic(using=db):
+                ids = delete_batch(todos, batch_size)
+            purged += len(ids)
+            if len(ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return purged
@@ -0,0 +1,34 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stock encoder is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in `JSONRenderer` that encodes with orjson when it is installed.
+
+    The output is byte for byte what `JSONRenderer` produces for the API's
+    data (strings, ints, bools, None, lists and dicts with string keys): compact
+    separators, raw UTF-8, and U+2028 / U+2029 escaped. Dates and other types
+    orjson would format differently are handed to DRF's encoder. Anything
+    orjson refuses (non-string keys, huge integers, ...) and pretty printed
+    output (`indent`) fall back to `JSONRenderer`. Floats are not guaranteed to
+    use the same exponent notation, so use it for responses without floats.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict JavaScript subset as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,101 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Apps whose reads may go to a replica. Everything else (sessions, the token
+# blacklist, ...) always uses the primary.
+REPLICATED_APPS = ('auth', 'auth_app')
+# Models of those apps that never use a replica: counters read back right after an
+# increment, and the audit trail, written from every request
+PRIMARY_ONLY_MODELS = ('auth_app.ratelimitcounter', 'auth_app.auditevent')
+# Writes that pin the rest of the request, and the client for `REPLICA_PIN_SECONDS`, to
+# the primary: the rows clients read back
+PINNING_MODELS = ('auth.user', 'auth_app.todo', 'auth_app.todolistversion', 'auth_app.todochange')
+
+
+class ReadState:
+    """Where the reads of one request (or one thread outside requests) go."""
+    def __init__(self, pinned=False):
+        # Read from the primary: the client wrote recently, or this request did
+        self.pinned = pinned
+        # This request wrote to a replicated model, see `ReplicaPinningMiddleware`
+        self.wrote = False
+        # Replica picked for the request, so that all its reads see one snapshot
+        self.replica = None
+
+
+# Set per request by `ReplicaPinningMiddleware`. A ContextVar follows the request into
+# async views and sync_to_async threads; the state itself is mutable so that a pin made
+# in such a thread is seen by the rest of the request.
+current_read_state = ContextVar('current_read_state', default=None)
+
+
+def read_state():
+    state = current_read_state.get()
+    if state is None:
+        # Outside a request (commands, shell): one state for the rest of the context
+        state = ReadState()
+        current_read_state.set(state)
+    return state
+
+
+def pin_primary():
+    """Sends the remaining reads of the current request to the primary."""
+    read_state().pinned = True
+
+
+def reads_from_replica():
+    """Whether reads of replicated models currently go to a replica."""
+    return bool(getattr(settings, 'DATABASE_REPLICAS', ())) and not read_state().pinned
+
+
+class ReplicaRouter:
+    """
+    Sends reads of users and to-dos to the read replicas, everything else to
+    the primary (`default`).
+
+    Reads stay on the primary while the current request is pinned: the client
+    wrote users or to-dos less than `REPLICA_PIN_SECONDS` ago (see
+    `ReplicaPinningMiddleware`), the request is not a GET / HEAD / OPTIONS, or
+    it already wrote users or to-dos. Bookkeeping writes of any request (rate
+    limit counters, audit entries, ...) do not pin it. Reads also stay on the
+    primary inside a transaction there, which must see its own writes. A
+    request reads from a single replica, picked at random on its first read.
+    Replicas are never migrated: they receive the schema from the primary.
+    """
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+    def db_for_read(self, model, **hints):
+        if (
+            not self.replicas
+            or model._meta.app_label not in REPLICATED_APPS
+            or model._meta.label_lower in PRIMARY_ONLY_MODELS
+        ):
+            return DEFAULT_DB_ALIAS
+        state = read_state()
+        if state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(self.replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        if self.replicas and model._meta.label_lower in PINNING_MODELS:
+            state = read_state()
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in self.replicas:
+            return False
+        return None
+
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import count_cache
+from .models import TodoListVersion
+
+
+class TodoListCache:
+    """
+    Cache of rendered to-do list pages, stored as JSON bytes per user and page,
+    next to each user's list version.
+
+    Page entries are keyed by the user's list version, so every page of the
+    previous version is unreachable as soon as the version moves; the stale
+    entries are dropped by the backend's own eviction (`TIMEOUT`, `MAX_ENTRIES`
+    and `CULL_FREQUENCY` of the configured cache alias). A repeat read is two
+    cache lookups, the version and the page, and no query.
+
+    The version is cached for `version_timeout` seconds. Writes store their new
+    version once done (see `auth_app.signals`); a miss reads `TodoListVersion`
+    and only adds the entry, never replacing one a write stored meanwhile. A
+    page miss renders from the database and keys the page by the version read
+    there, not by the cached one, so a page never holds rows older than its
+    version, e.g. from a replica that is behind.
+
+    Any Django cache backend works. With a per-process backend such as locmem
+    each worker renders and keeps its own copy of a page, and a write only
+    updates the version of its own worker: the others serve the previous
+    version until their entry expires. Deployments running several workers
+    should point `TODO_LIST_CACHE_ALIAS` at a shared backend (memcached,
+    redis, ...), where every write reaches every worker at once.
+    """
+    def __init__(self, alias=None, version_timeout=None):
+        self.alias = alias or getattr(settings, 'TODO_LIST_CACHE_ALIAS', 'default')
+        self.version_timeout = (
+            getattr(settings, 'TODO_LIST_VERSION_TIMEOUT', 10) if version_timeout is None else version_timeout
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_version(self, user_id):
+        """Returns the user's list version, 0 if the list was never written."""
+        version = self.cache.get(self._version_key(user_id))
+        if version is None:
+            version = TodoListVersion.objects.current(user_id)
+            self.cache.add(self._version_key(user_id), version, self.version_timeout)
+        return version
+
+    async def aget_version(self, user_id):
+        version = await self.cache.aget(self._version_key(user_id))
+        if version is None:
+            version = await TodoListVersion.objects.acurrent(user_id)
+            await self.cache.aadd(self._version_key(user_id), version, self.version_timeout)
+        return version
+
+    def load_version(self, user_id, cached):
+        """
+        Reads the list version from the database, for a page rendered from it.
+        Caches it when newer than the `cached` one the request started with.
+        """
+        version = TodoListVersion.objects.current(user_id)
+        if version > cached:
+            self.set_version(user_id, version)
+        return version
+
+    async def aload_version(self, user_id, cached):
+        version = await TodoListVersion.objects.acurrent(user_id)
+        if version > cached:
+            await self.aset_version(user_id, version)
+        return version
+
+    def set_version(self, user_id, version):
+        """Stores the version a write committed."""
+        self.cache.set(self._version_key(user_id), version, self.version_timeout)
+
+    async def aset_version(self, user_id, version):
+        await self.cache.aset(self._version_key(user_id), version, self.version_timeout)
+
+    def get_page(self, user_id, version, page_url):
+        """Returns the rendered page, or None on a miss."""
+        content = self.cache.get(self._page_key(user_id, version, page_url))
+        self._count(content)
+        return content
+
+    async def aget_page(self, user_id, version, page_url):
+        content = await self.cache.aget(self._page_key(user_id, version, page_url))
+        self._count(content)
+        return content
+
+    def set_page(self, user_id, version, page_url, content):
+        self.cache.set(self._page_key(user_id, version, page_url), content)
+
+    async def aset_page(self, user_id, version, page_url, content):
+        await self.cache.aset(self._page_key(user_id, version, page_url), content)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _count(self, content):
+        count_cache(content is not None)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def _version_key(self, user_id):
+        return f'todo_list_version:{user_id}'
+
+    def _page_key(self, user_id, version, page_url):
+        # The page URL (host, cursor, limit, ...) is hashed as it ends up in the `next` link
+        digest = hashlib.sha256(page_url.encode()).hexdigest()
+        return f'todo_list:{user_id}:{version}:{digest}'
+
+
+todo_list_cache = TodoListCache()
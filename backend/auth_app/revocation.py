@@ -0,0 +1,238 @@
+import hashlib
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+COMPACT_BATCH_SIZE = 1000
+# Blacklist rows re-read by each sync below the highest id seen, for rows whose
+# transaction committed after a row with a higher id had been read
+SYNC_OVERLAP = 1000
+LOAD_CHUNK_SIZE = 10000
+
+
+def fingerprint(jti):
+    """
+    64-bit fingerprint of a token id. simplejwt ids are random uuid4 hex, whose
+    first 16 digits serve as is; other ids are hashed.
+    """
+    try:
+        prefix = bytes.fromhex(jti[:16])
+    except ValueError:
+        prefix = b''
+    if len(prefix) != 8:
+        prefix = hashlib.blake2b(jti.encode(), digest_size=8).digest()
+    return int.from_bytes(prefix, 'big')
+
+
+class RevocationFilter:
+    """
+    In-process set of the blacklisted refresh tokens that have not expired
+    yet, to answer "definitely not revoked" without querying the blacklist.
+
+    Tokens are kept as sorted 64-bit fingerprints in an `array` (8 bytes per
+    token, looked up by bisection), plus a set of those blacklisted since the
+    array was built: by this process through `RevocableRefreshToken`, or read
+    from the blacklist rows added since the last sync, every `sync_interval`
+    seconds. Every `rebuild_interval` seconds the array is rebuilt in a
+    background thread, dropping expired tokens. A fingerprint match is only a
+    "maybe" (another token may share it), confirmed against the database.
+
+    A token blacklisted by another process is missed until the next sync. The
+    negative answers are therefore only used where the following blacklist
+    write catches such a token anyway, see `RevocableRefreshToken`. Until the
+    first build completes, every token is a "maybe".
+    """
+    def __init__(self, enabled=True, sync_interval=30, rebuild_interval=3600):
+        self.enabled = enabled
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._fingerprints = None
+        self._recent = set()
+        # Tokens added while a rebuild runs, which its snapshot may not contain
+        self._pending = None
+        self._last_id = 0
+        self._synced_at = None
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._fingerprints is not None
+
+    def __len__(self):
+        return (len(self._fingerprints) if self._fingerprints is not None else 0) + len(self._recent)
+
+    def might_be_revoked(self, jti):
+        """False if the token is definitely not blacklisted (as of the last sync)."""
+        if not self.enabled:
+            return True
+        self.maintain()
+        fingerprints = self._fingerprints
+        if fingerprints is None:
+            return True
+        value = fingerprint(jti)
+        if value in self._recent:
+            return True
+        index = bisect_left(fingerprints, value)
+        return index < len(fingerprints) and fingerprints[index] == value
+
+    def add(self, jti):
+        value = fingerprint(jti)
+        with self._lock:
+            self._recent.add(value)
+            if self._pending is not None:
+                self._pending.add(value)
+
+    def maintain(self):
+        """Starts a rebuild, or syncs the newly blacklisted tokens, when one is due."""
+        now = time.monotonic()
+        if self._due(self._built_at, self.rebuild_interval, now):
+            with self._lock:
+                if self._pending is not None or not self._due(self._built_at, self.rebuild_interval, now):
+                    return
+                self._pending = set()
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+        elif self.ready and self._due(self._synced_at, self.sync_interval, now):
+            with self._lock:
+                if not self._due(self._synced_at, self.sync_interval, now):
+                    return
+                self._synced_at = now
+            self.sync()
+
+    def rebuild(self):
+        """Reloads every unexpired blacklisted token; blocks, `maintain()` runs it in a thread."""
+        with self._lock:
+            if self._pending is None:
+                self._pending = set()
+        try:
+            last_id = 0
+            values = []
+            rows = (
+                BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+                .values_list('id', 'token__jti').iterator(chunk_size=LOAD_CHUNK_SIZE)
+            )
+            for row_id, jti in rows:
+                values.append(fingerprint(jti))
+                last_id = max(last_id, row_id)
+            values.sort()
+            fingerprints = array('Q', values)
+            del values
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self._fingerprints = fingerprints
+            self._recent, self._pending = self._pending, None
+            self._last_id = max(self._last_id, last_id)
+            self._built_at = self._synced_at = now
+
+    def sync(self):
+        """Adds the tokens blacklisted since the last build or sync."""
+        rows = list(
+            BlacklistedToken.objects.filter(id__gt=self._last_id - SYNC_OVERLAP)
+            .values_list('id', 'token__jti')
+        )
+        with self._lock:
+            for row_id, jti in rows:
+                value = fingerprint(jti)
+                self._recent.add(value)
+                if self._pending is not None:
+                    self._pending.add(value)
+                self._last_id = max(self._last_id, row_id)
+
+    def clear(self):
+        with self._lock:
+            self._fingerprints = None
+            self._recent = set()
+            self._last_id = 0
+            self._synced_at = self._built_at = None
+
+    def _due(self, last, interval, now):
+        return last is None or now - last >= interval
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            # Retry after a sync interval; meanwhile the database answers
+            self._built_at = time.monotonic() - self.rebuild_interval + self.sync_interval
+            raise
+        finally:
+            connection.close()
+
+
+revocation_filter = RevocationFilter(
+    enabled=getattr(settings, 'TOKEN_REVOCATION_FILTER', True),
+    sync_interval=getattr(settings, 'TOKEN_REVOCATION_FILTER_SYNC_SECONDS', 30),
+    rebuild_interval=getattr(settings, 'TOKEN_REVOCATION_FILTER_REBUILD_SECONDS', 3600),
+)
+
+
+def blacklist_after_rotation():
+    return api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token checked against `revocation_filter` instead of a blacklist
+    query when the filter rules it out.
+
+    That is safe as long as a blacklist write follows the check, i.e. on
+    refresh with `BLACKLIST_AFTER_ROTATION` and on logout: `blacklist()` refuses
+    a token which already is blacklisted, so a token the filter had not heard
+    of yet is still rejected, by the write instead of the read.
+    """
+    def check_blacklist(self):
+        if blacklist_after_rotation() and not revocation_filter.might_be_revoked(self.payload[api_settings.JTI_CLAIM]):
+            return
+        super().check_blacklist()
+
+    def blacklist(self):
+        """
+        Blacklists the token.
+        Raises:
+            TokenError: If it already was blacklisted, e.g. by a concurrent refresh.
+        """
+        blacklisted, created = super().blacklist()
+        if not created:
+            raise TokenError(_('Token is blacklisted'))
+        revocation_filter.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted, created
+
+
+def compact_token_blacklist(batch_size=COMPACT_BATCH_SIZE, pause=0):
+    """
+    Deletes expired outstanding tokens and their blacklist entries, `batch_size`
+    tokens per transaction, sleeping `pause` seconds between batches. Unlike
+    simplejwt's `flushexpiredtokens`, which deletes them in one statement, the
+    tables stay writable for logins and refreshes meanwhile.
+    Returns:
+        int: The number of deleted outstanding tokens.
+    """
+    deleted = 0
+    now = aware_utcnow()
+    # Tokens expire in about the order they were issued, so the oldest ids come first
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id').values_list('id', flat=True)
+    while True:
+        with transaction.atomic():
+            ids = list(expired[:batch_size])
+            if ids:
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,129 @@
+import re
+
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Todo
+
+# Search words: letters and digits, as split by the FTS5 unicode61 tokenizer
+WORD_RE = re.compile(r'[^\W_]+')
+MAX_SEARCH_TERMS = 8
+
+FTS_TABLE = 'auth_app_todo_fts'
+TSVECTOR_INDEX = 'auth_app_todo_text_search_idx'
+# Text search configuration of the PostgreSQL index: no stemming or stop words,
+# like the SQLite tokenizer
+TSVECTOR_CONFIG = 'simple'
+
+# SQLite: an external-content FTS5 table over auth_app_todo, kept in sync by
+# triggers. `user_id` is indexed as well, so that FTS5 intersects the matches
+# with the user's rows itself and can stream them in rowid order. The prefix indexes
+# serve 2 and 3 character prefixes; other lengths scan a range of the term index.
+SQLITE_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, user_id, content='auth_app_todo', content_rowid='id', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auth_app_todo BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auth_app_todo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+    END
+    """,
+    # Toggles only write `completed` and `version`, and leave the index alone
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF text, user_id ON auth_app_todo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text, user_id) VALUES ('delete', old.id, old.text, old.user_id);
+        INSERT INTO {FTS_TABLE}(rowid, text, user_id) VALUES (new.id, new.text, new.user_id);
+    END
+    """,
+]
+SQLITE_TRIGGERS = (f'{FTS_TABLE}_insert', f'{FTS_TABLE}_delete', f'{FTS_TABLE}_update')
+
+
+def install_search_index(connection):
+    """
+    Creates the full-text index of `Todo.text` where it is missing.
+
+    SQLite gets the FTS5 table and its triggers; when a trigger had to be
+    (re)created, e.g. because a migration rebuilt auth_app_todo and dropped
+    them, the index is rebuilt from the table. PostgreSQL gets a GIN index on
+    the `tsvector` of the text. Other backends have no index and search with
+    `icontains`. Safe to run repeatedly, it also runs after every `migrate`.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                SQLITE_TRIGGERS,
+            )
+            intact = cursor.fetchone()[0] == len(SQLITE_TRIGGERS)
+            for statement in SQLITE_INDEX_SQL:
+                cursor.execute(statement)
+            if not intact:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TSVECTOR_INDEX} ON auth_app_todo "
+                f"USING gin (to_tsvector('{TSVECTOR_CONFIG}', text))"
+            )
+
+
+def drop_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {TSVECTOR_INDEX}')
+
+
+def search_terms(query):
+    """Splits a search string into lowercase words, at most `MAX_SEARCH_TERMS`."""
+    return WORD_RE.findall(query.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_todos(user_id, terms, vendor):
+    """
+    Selects the to-dos of a user whose text contains every term, each matched
+    as a word prefix ('mil' finds 'Buy milk').
+    Args:
+        user_id: Owner of the to-dos.
+        terms: Words from `search_terms`, at least one.
+        vendor: `connection.vendor` of the database the query runs on.
+    Returns:
+        tuple: The `Todo` queryset and the field to order (and page) it by,
+        newest first. On SQLite that is the rowid of the FTS5 table, so the
+        page is read from the index in order and stops after `limit + 1` rows.
+    """
+    todos = Todo.objects.for_user(user_id)
+    if vendor == 'sqlite':
+        return todos.filter(search_entry__document__match=fts5_query(user_id, terms)), 'search_entry'
+    if vendor == 'postgresql':
+        # Same expression as the GIN index, or the index is not used
+        match = RawSQL(
+            f"to_tsvector('{TSVECTOR_CONFIG}', {Todo._meta.db_table}.text) @@ to_tsquery('{TSVECTOR_CONFIG}', %s)",
+            [' & '.join(f'{term}:*' for term in terms)],
+            output_field=BooleanField(),
+        )
+        return todos.filter(match), 'id'
+    condition = Q()
+    for term in terms:
+        condition &= Q(text__icontains=term)
+    return todos.filter(condition), 'id'
+
+
+def fts5_query(user_id, terms):
+    """
+    Builds the FTS5 MATCH expression: every term as a prefix, single characters
+    included, like the PostgreSQL and `icontains` searches, within one user's rows.
+    """
+    # Terms only hold letters and digits, quoting them keeps FTS5 operators out
+    phrases = ' AND '.join(f'"{term}"*' for term in terms)
+    return f'user_id : "{int(user_id)}" AND text : ({phrases})'
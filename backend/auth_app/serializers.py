@@ -1,7 +1,128 @@
-from rest_framework import serializers
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from .models import Todo
+from .revocation import RevocableRefreshToken
 
 class TodoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Todo
-        fields = ['id', 'text', 'completed', 'created_at']
+        fields = ['id', 'text', 'completed', 'created_at', 'version']
+        read_only_fields = ['version']
+
+def serialize_todo_rows(rows):
+    """
+    Fast read path for to-do lists: turns `values(*TodoSerializer.Meta.fields)`
+    rows into exactly what `TodoSerializer(todos, many=True).data` returns,
+    without building a model instance and running every field per row.
+    Only `created_at` needs converting; datetimes are formatted in one pass.
+    Args:
+        rows: Dicts of `Todo.objects.values(*TodoSerializer.Meta.fields)`.
+    Returns:
+        list: New dicts, in the serializer's field order.
+    """
+    format_datetime = datetime_formatter()
+    return [{**row, 'created_at': format_datetime(row['created_at'])} for row in rows]
+
+def datetime_formatter():
+    """
+    Returns a function formatting datetimes like `serializers.DateTimeField`.
+    In the common setup (ISO 8601 output, UTC current timezone, UTC values from
+    the database) it is a bare `isoformat()`; anything else goes through the
+    DRF field itself.
+    """
+    to_representation = serializers.DateTimeField().to_representation
+    if (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601 or timezone.get_current_timezone_name() != 'UTC':
+        return to_representation
+
+    def format_utc(value):
+        text = value.isoformat()
+        if text.endswith('+00:00'):
+            return text[:-6] + 'Z'
+        return to_representation(value)
+    return format_utc
+
+class TodoBatchOperationSerializer(serializers.Serializer):
+    """
+    Validates a single operation of a batch request.
+    - create: requires `text`, accepts `completed`.
+    - update: requires `id` and at least one of `text` / `completed`.
+    - toggle, delete: require `id`.
+    - update, toggle, delete: accept the `version` the client expects the to-do
+      to have, as `If-Match` does for a single item.
+    """
+    OPERATIONS = ('create', 'update', 'toggle', 'delete')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.IntegerField(required=False, min_value=1)
+    text = serializers.CharField(max_length=255, required=False)
+    completed = serializers.BooleanField(required=False)
+    version = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        op = attrs['op']
+        if op == 'create':
+            if 'text' not in attrs:
+                raise serializers.ValidationError({'text': 'This field is required.'})
+            if 'version' in attrs:
+                raise serializers.ValidationError({'version': 'Only update, toggle and delete accept a version.'})
+        elif 'id' not in attrs:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        elif op == 'update' and 'text' not in attrs and 'completed' not in attrs:
+            raise serializers.ValidationError('Provide `text` and/or `completed` to update.')
+        return attrs
+
+class TodoBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 200
+
+    operations = TodoBatchOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+class TodoSearchSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of a to-do search. All are optional.
+    - q: Words the text must contain, each matched as a word prefix.
+    - completed: Only completed (true) or open (false) items.
+    - created_after / created_before: `created_at` range, from inclusive to exclusive.
+    """
+    q = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    completed = serializers.BooleanField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        after, before = attrs.get('created_after'), attrs.get('created_before')
+        if after is not None and before is not None and after >= before:
+            raise serializers.ValidationError('created_after must be earlier than created_before.')
+        return attrs
+
+class TodoChangesSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the to-do change feed.
+    - since: `seq` of the last change the client applied, 0 for a full sync.
+    - limit: Most changes returned at once.
+    """
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=200)
+
+class AuditLogQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of an audit log export. All are optional.
+    - user: Only this user's entries.
+    - action: Only entries of this action, e.g. `login_failed` or `todo.clear`.
+    - since / until: `created_at` range, from inclusive to exclusive.
+    - type: `ndjson` (the default) or `csv`.
+    """
+    user = serializers.IntegerField(min_value=1, required=False, source='user_id')
+    action = serializers.CharField(max_length=32, required=False)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    type = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer (`SIMPLE_JWT['TOKEN_REFRESH_SERIALIZER']`) whose tokens
+    skip the blacklist query when the in-process revocation filter rules them
+    out, see `auth_app.revocation`.
+    """
+    token_class = RevocableRefreshToken
@@ -0,0 +1,264 @@
+import hashlib
+from bisect import bisect
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.exceptions import APIException
+
+from .models import Todo, TodoChange, TodoListVersion, UserShard
+
+# Models stored with their user's shard; everything else lives in `default`
+SHARDED_MODELS = ('todo', 'todochange', 'todolistversion', 'todosearchentry')
+# Points per shard on the hash ring: more points, more even spread
+RING_POINTS = 128
+MOVE_BATCH_SIZE = 1000
+ORPHAN_BATCH_SIZE = 1000
+
+
+class ShardMoved(APIException):
+    """Raised by a write that reached a shard the user has just been moved away from."""
+    status_code = 503
+    default_detail = 'Your to-dos are being moved, try again in a moment.'
+    default_code = 'shard_moved'
+    wait = 1
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of user ids onto shards. Each shard owns `points` arcs
+    of the ring, so adding a shard takes about 1/N of the users from each
+    other shard and moves nothing else.
+    """
+    def __init__(self, shards, points=RING_POINTS):
+        ring = sorted((_hash(f'{shard}#{point}'), shard) for shard in shards for point in range(points))
+        self.hashes = [position for position, _ in ring]
+        self.shards = [shard for _, shard in ring]
+
+    def shard_for(self, user_id):
+        return self.shards[bisect(self.hashes, _hash(user_id)) % len(self.shards)]
+
+
+def sharding_enabled():
+    return len(getattr(settings, 'TODO_SHARDS', ())) > 1
+
+
+def todo_databases():
+    """Aliases of every database holding to-dos, `default` first."""
+    return list(getattr(settings, 'TODO_SHARDS', ())) or [DEFAULT_DB_ALIAS]
+
+
+def hash_ring():
+    """The ring of the shards accepting users: `TODO_SHARDS` minus `TODO_DRAINING_SHARDS`."""
+    draining = set(settings.TODO_DRAINING_SHARDS)
+    return HashRing([shard for shard in settings.TODO_SHARDS if shard not in draining])
+
+
+class ShardDirectory:
+    """
+    Where each user's to-dos live, read from `UserShard` and cached in the
+    `TODO_SHARD_CACHE_ALIAS` cache. Like the list page cache, several worker
+    processes should share that cache, so that a move is seen by all of them
+    at once; with a per-process cache, `TODO_SHARD_CACHE_TIMEOUT` bounds how
+    long a worker keeps reading a moved user's former shard.
+    """
+    @property
+    def cache(self):
+        return caches[settings.TODO_SHARD_CACHE_ALIAS]
+
+    def get(self, user_id):
+        key = self._key(user_id)
+        shard = self.cache.get(key)
+        if shard is None:
+            shard = self.lookup(user_id)
+            self.cache.set(key, shard, settings.TODO_SHARD_CACHE_TIMEOUT)
+        return shard
+
+    def lookup(self, user_id):
+        """The user's shard, from the directory table itself."""
+        return UserShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list(
+            'shard', flat=True,
+        ).first() or DEFAULT_DB_ALIAS
+
+    def assign(self, user_id, shard):
+        UserShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(user_id=user_id, defaults={'shard': shard})
+        self.forget(user_id)
+
+    def forget(self, user_id):
+        self.cache.delete(self._key(user_id))
+
+    def _key(self, user_id):
+        return f'todo_shard:{user_id}'
+
+
+shard_directory = ShardDirectory()
+
+
+class ShardRouter:
+    """
+    Sends the to-dos, change log and list version of a user to the user's
+    shard, and everything else to `default`.
+
+    The user comes from the `user_id` hint that `UserOwnedQuerySet.for_user()`
+    and `user_todo_db()` pass along, or from the instance being saved. Queries
+    without either (the admin, per-shard maintenance using `.using()`) are
+    left to the next router. Users on `default` are left to it as well, so
+    `ReplicaRouter` still serves their reads from replicas; the other shards
+    have no replicas.
+    """
+    def __init__(self):
+        self.databases = set(todo_databases())
+
+    def user_shard(self, model, hints):
+        if model._meta.app_label != 'auth_app' or model._meta.model_name not in SHARDED_MODELS:
+            instance = hints.get('instance')
+            if instance is not None and instance._state.db not in (None, DEFAULT_DB_ALIAS):
+                # E.g. `todo.user` of a to-do read from a shard: users are in `default`
+                return DEFAULT_DB_ALIAS
+            return None
+        user_id = hints.get('user_id')
+        instance = hints.get('instance')
+        if user_id is None and instance is not None:
+            # A to-do being saved, or the user of a related manager such as `user.todos`
+            user_id = instance.pk if isinstance(instance, User) else getattr(instance, 'user_id', None)
+        if user_id is None:
+            return None
+        shard = shard_directory.get(user_id)
+        return None if shard == DEFAULT_DB_ALIAS else shard
+
+    def db_for_read(self, model, **hints):
+        return self.user_shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.user_shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db in self.databases and obj2._state.db in self.databases:
+            return True
+        return None
+
+
+def check_user_shard(user_id, db):
+    """
+    Makes sure a write of a user's to-dos goes to the user's current shard,
+    reading the directory table rather than its cache. Called inside the
+    write's transaction, after the list version row is locked, which
+    `move_user` holds during a move.
+    Raises:
+        ShardMoved: If the user was moved to another shard meanwhile.
+    """
+    if sharding_enabled() and shard_directory.lookup(user_id) != db:
+        shard_directory.forget(user_id)
+        raise ShardMoved()
+
+
+def assign_new_user(user_id):
+    """Places a new user on the shard the hash ring gives, see `auth_app.signals`."""
+    if sharding_enabled():
+        UserShard.objects.using(DEFAULT_DB_ALIAS).create(user_id=user_id, shard=hash_ring().shard_for(user_id))
+
+
+def assign_new_users(user_ids):
+    """`assign_new_user` for users inserted with `bulk_create`, which sends no `post_save`."""
+    if sharding_enabled():
+        ring = hash_ring()
+        UserShard.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [UserShard(user_id=user_id, shard=ring.shard_for(user_id)) for user_id in user_ids],
+        )
+
+
+def delete_user_rows(user_id, db):
+    """Deletes a user's to-dos, change log and list version from one database."""
+    with transaction.atomic(using=db):
+        Todo._base_manager.using(db).filter(user_id=user_id).delete()
+        TodoChange.objects.using(db).filter(user_id=user_id).delete()
+        TodoListVersion.objects.using(db).filter(user_id=user_id).delete()
+
+
+def delete_orphaned_rows(batch_size=ORPHAN_BATCH_SIZE):
+    """
+    Deletes the to-dos, change log and list version of users that no longer
+    exist, on every shard.
+
+    Their foreign keys to `User` have no database constraint, since the rows
+    may live in another database than the user. Deleting a user through Django
+    cascades in Python, and `delete_sharded_todos` covers the other shards;
+    this cleans up after deletions that bypassed both (raw SQL, a database
+    restore, a failed shard). The user ids found on a shard are checked
+    against `default` `batch_size` at a time.
+    Returns:
+        int: The number of users whose rows were deleted.
+    """
+    deleted = 0
+    for db in todo_databases():
+        user_ids = set()
+        for manager in (Todo._base_manager, TodoChange.objects, TodoListVersion.objects):
+            user_ids.update(manager.using(db).order_by().values_list('user_id', flat=True).distinct())
+        user_ids = sorted(user_ids)
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            existing = set(User.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=batch).values_list('pk', flat=True))
+            for user_id in batch:
+                if user_id not in existing:
+                    delete_user_rows(user_id, db)
+                    deleted += 1
+    return deleted
+
+
+def move_user(user_id, target):
+    """
+    Moves a user's to-dos from their current shard to `target`.
+
+    The list version row of the user stays locked on the source from the start
+    of the copy until the source rows are deleted: every write bumps it, so
+    writers wait, then fail `check_user_shard` and the client retries against
+    the new shard. The to-dos get new ids on the target (ids are only unique
+    within a shard), so the move bumps the list version and marks the whole
+    change log compacted: clients reload their list, and delta sync clients get
+    410 and sync again from 0. Soft-deleted to-dos awaiting the purge are not
+    copied.
+    Args:
+        user_id: The user to move.
+        target: Alias of the destination shard.
+    Returns:
+        tuple: The number of moved to-dos and the new list version, None if
+        the user already was on `target`.
+    """
+    source = shard_directory.lookup(user_id)
+    if source == target:
+        return 0, None
+    with transaction.atomic(using=source):
+        version, change_seq = TodoListVersion.objects.db_manager(source).bump(user_id)
+        todos = list(
+            Todo.objects.using(source).filter(user_id=user_id).order_by('id')
+            .values_list('text', 'completed', 'created_at', 'version')
+        )
+        # A leftover copy from an interrupted move is replaced
+        delete_user_rows(user_id, target)
+        with transaction.atomic(using=target):
+            copies = Todo.objects.using(target).bulk_create(
+                [
+                    Todo(user_id=user_id, text=text, completed=completed, created_at=created_at, version=row_version)
+                    for text, completed, created_at, row_version in todos
+                ],
+                batch_size=MOVE_BATCH_SIZE,
+            )
+            # Seq change_seq + 1 stands for the move: any client synced before it must resync
+            TodoChange.objects.using(target).bulk_create(
+                [
+                    TodoChange(user_id=user_id, todo_id=todo.pk, seq=change_seq + 2 + n)
+                    for n, todo in enumerate(copies)
+                ],
+                batch_size=MOVE_BATCH_SIZE,
+            )
+            TodoListVersion.objects.using(target).create(
+                user_id=user_id, version=version, change_seq=change_seq + 1 + len(copies), compacted_seq=change_seq + 1,
+            )
+        shard_directory.assign(user_id, target)
+        delete_user_rows(user_id, source)
+    return len(todos), version
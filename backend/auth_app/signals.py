@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .audit import audit_log, todo_change_details
+from .events import EVENT_TYPES, TodoEvent, todo_events
+from .response_cache import todo_list_cache
+from .search import install_search_index
+from .shards import assign_new_user, delete_user_rows, shard_directory, sharding_enabled
+from .user_cache import user_cache
+
+# Sent by every code path that writes to-do rows, once the write is done.
+# Arguments: user_id (owner of the changed list), action ('create', 'update',
+# 'toggle', 'delete', 'clear', 'batch' or 'import'), version (the list version
+# returned by `auth_app.changes.record_changes`, which the write ran in its
+# transaction) and optionally data (JSON details for the change feed, e.g. the
+# created to-do). Bulk writes (queryset update/delete, bulk_create) do not fire
+# model signals, so this is the one place to hook list-level side effects.
+todos_changed = Signal()
+
+
+@receiver([post_save, post_delete], sender=get_user_model(), dispatch_uid='auth_app.invalidate_cached_user')
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drops a user from the JWT user cache whenever the row is saved or deleted,
+    so password changes and deactivations take effect on the next request.
+    """
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='auth_app.assign_user_shard')
+def assign_user_shard(sender, instance, created, raw=False, **kwargs):
+    """With sharding on, records the shard of a new user's to-dos."""
+    if created and not raw:
+        assign_new_user(instance.pk)
+
+
+@receiver(pre_delete, sender=get_user_model(), dispatch_uid='auth_app.delete_sharded_todos')
+def delete_sharded_todos(sender, instance, **kwargs):
+    """
+    Deletes the to-dos of a user being deleted when they live on another shard
+    than `default`, where the deletion cascades to them.
+    """
+    if sharding_enabled():
+        shard = shard_directory.lookup(instance.pk)
+        if shard != instance._state.db:
+            delete_user_rows(instance.pk, shard)
+        shard_directory.forget(instance.pk)
+
+
+@receiver(todos_changed, dispatch_uid='auth_app.publish_todo_list_version')
+def publish_todo_list_version(sender, user_id, action, version, data=None, **kwargs):
+    """
+    Caches the new list version, which moves the list ETags and cached pages
+    on, and publishes the change to the user's event streams once the
+    transaction commits. The new list version is the event id.
+    """
+    todo_list_cache.set_version(user_id, version)
+    event = TodoEvent(user_id, version, EVENT_TYPES.get(action, action), data)
+    transaction.on_commit(lambda: todo_events.publish(event))
+
+
+@receiver(todos_changed, dispatch_uid='auth_app.audit_todo_change')
+def audit_todo_change(sender, user_id, action, version, data=None, **kwargs):
+    """
+    Adds the change to the audit trail once the transaction commits, as
+    `todo.<action>` with the ids or counts of what changed.
+    """
+    details = todo_change_details(data)
+    transaction.on_commit(lambda: audit_log.record(f'todo.{action}', user_id, data=details))
+
+
+@receiver(post_migrate, dispatch_uid='auth_app.ensure_search_index')
+def ensure_search_index(sender, using, **kwargs):
+    """
+    Restores the full-text index after migrations. On SQLite, a migration that
+    rebuilds auth_app_todo (most field changes do) drops the triggers that keep
+    the FTS5 table in sync.
+    """
+    if sender.name == 'auth_app' and MigrationRecorder(connections[using]).migration_qs.filter(
+        app='auth_app', name='0007_todo_search_index',
+    ).exists():
+        install_search_index(connections[using])
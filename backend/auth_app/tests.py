@@ -1,3 +1,1038 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from app.middleware.replica_pinning import ReplicaPinningMiddleware
+from app.middleware.security_headers import SECURITY_HEADERS
+
+from . import async_views
+from .provisioning import EMAIL_TAKEN, USERNAME_TAKEN, UserProvisioner, registration_conflict
+from .admin import TodoAdmin
+from .audit import AuditLog, audit_log
+from .hashing import HashingPoolBusy, PasswordHashingPool
+from .events import InProcessEventBroker, TodoEvent, TooManyConnections
+from .async_views import stream_todo_events
+from .batch import BatchConflict, update_todos
+from .metrics import registry as metrics_registry
+from .models import AuditEvent, RateLimitCounter, Todo, TodoChange, TodoListVersion
+from .purge import purge_deleted_todos
+from .renderers import FastJSONRenderer, orjson
+from .serializers import TodoSerializer, serialize_todo_rows
+from .changes import record_changes
+from .shards import HashRing, ShardMoved, ShardRouter, check_user_shard, delete_orphaned_rows, shard_directory
+from .response_cache import todo_list_cache
+from .revocation import RevocableRefreshToken, RevocationFilter, compact_token_blacklist, revocation_filter
+from .user_cache import UserCache, user_cache
+from .views import CustomTokenRefreshView
+
+
+# Without DEBUG the settings redirect plain HTTP, which is all the test client speaks
+test_settings = override_settings(SECURE_SSL_REDIRECT=False)
+
+
+def setUpModule():
+    test_settings.enable()
+    # Events are written by the requests recording them, inside the test's transaction
+    audit_log.background = False
+
+
+def tearDownModule():
+    audit_log.close()
+    audit_log.background = True
+    test_settings.disable()
+
+
+class TodoAPITestCase(TestCase):
+    """Signs the test client in as `self.user` with an access cookie."""
+    def setUp(self):
+        # Cached pages and users would outlive the rolled back rows they came from
+        for cache in caches.all():
+            cache.clear()
+        # Events still queued at the end are written in the test's transaction, rolled back with it
+        self.addCleanup(audit_log.flush)
+        self.user = User.objects.create_user('alice', 'alice@example.com')
+        self.other = User.objects.create_user('bob', 'bob@example.com')
+        self.client.cookies['access'] = str(AccessToken.for_user(self.user))
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def changes(self, since=0, **params):
+        return self.client.get('/auth/todos/changes/', {'since': since, **params})
+
+
+class TodoListPaginationTests(TodoAPITestCase):
+    def test_pages_follow_next_links_without_gaps_or_duplicates(self):
+        Todo.objects.bulk_create(Todo(user=self.user, text=f'todo {n}') for n in range(25))
+        # Equal created_at everywhere: the id alone has to break the ties
+        Todo.objects.update(created_at=timezone.now())
+        ids, url = [], '/auth/todos/?limit=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [todo['id'] for todo in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(ids, sorted(Todo.objects.values_list('id', flat=True), reverse=True))
+
+    def test_only_lists_own_todos(self):
+        Todo.objects.create(user=self.other, text='not mine')
+        self.assertEqual(self.client.get('/auth/todos/').json()['results'], [])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/auth/todos/?cursor=garbage').status_code, 404)
+
+
+class ConditionalRequestTests(TodoAPITestCase):
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get('/auth/todos/')['ETag']
+        response = self.client.get('/auth/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_write_changes_the_list_etag(self):
+        etag = self.client.get('/auth/todos/')['ETag']
+        self.post_json('/auth/todos/', {'text': 'new'})
+        response = self.client.get('/auth/todos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([todo['text'] for todo in response.json()['results']], ['new'])
+
+    def test_repeat_read_runs_no_query(self):
+        self.post_json('/auth/todos/', {'text': 'new'})
+        first = self.client.get('/auth/todos/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/auth/todos/')
+        self.assertEqual((second.content, second['ETag']), (first.content, first['ETag']))
+
+    @mock.patch.object(todo_list_cache, 'version_timeout', 0.1)
+    def test_write_of_another_worker_shows_once_the_cached_version_expires(self):
+        self.post_json('/auth/todos/', {'text': 'new'})
+        etag = self.client.get('/auth/todos/')['ETag']
+        # No signal reaches this worker
+        TodoListVersion.objects.filter(user=self.user).update(version=99)
+        self.assertEqual(self.client.get('/auth/todos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        time.sleep(0.15)
+        self.assertEqual(self.client.get('/auth/todos/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_page_miss_is_keyed_by_the_database_version(self):
+        # A cached version ahead of the rows read, e.g. from a replica that is behind
+        todo_list_cache.set_version(self.user.pk, 5)
+        self.client.get('/auth/todos/')
+        self.assertIsNone(todo_list_cache.get_page(self.user.pk, 5, 'http://testserver/auth/todos/'))
+        self.assertIsNotNone(todo_list_cache.get_page(self.user.pk, 0, 'http://testserver/auth/todos/'))
+
+    def test_toggle_with_stale_if_match_is_rejected(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        response = self.client.patch(f'/auth/todos/{todo.pk}/toggle/', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        response = self.client.patch(f'/auth/todos/{todo.pk}/toggle/', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        todo.refresh_from_db()
+        self.assertEqual((todo.completed, todo.version), (True, 2))
+
+    def test_toggle_with_only_weak_if_match_is_rejected(self):
+        # If-Match compares strongly: a weak or foreign ETag never matches
+        todo = Todo.objects.create(user=self.user, text='task')
+        for header in ('W/"1"', '"abc"'):
+            response = self.client.patch(f'/auth/todos/{todo.pk}/toggle/', HTTP_IF_MATCH=header)
+            self.assertEqual(response.status_code, 412)
+        todo.refresh_from_db()
+        self.assertEqual((todo.completed, todo.version), (False, 1))
+
+    def test_toggle_of_another_users_todo_is_not_found(self):
+        todo = Todo.objects.create(user=self.other, text='not mine')
+        self.assertEqual(self.client.patch(f'/auth/todos/{todo.pk}/toggle/', HTTP_IF_MATCH='"1"').status_code, 404)
+
+
+class TodoBatchTests(TodoAPITestCase):
+    def batch(self, *operations):
+        response = self.post_json('/auth/todos/batch/', {'operations': list(operations)})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_operations_apply_in_order(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        results = self.batch(
+            {'op': 'create', 'text': 'created'},
+            {'op': 'update', 'id': todo.pk, 'text': 'renamed'},
+            {'op': 'toggle', 'id': todo.pk},
+            {'op': 'delete', 'id': todo.pk},
+            {'op': 'toggle', 'id': todo.pk},
+        )
+        self.assertEqual([result['status'] for result in results], [201, 200, 200, 204, 404])
+        self.assertEqual(results[2]['todo'], {**results[1]['todo'], 'completed': True, 'version': 3})
+        self.assertEqual(list(Todo.objects.values_list('text', flat=True)), ['created'])
+
+    def test_other_users_todos_are_not_found(self):
+        todo = Todo.objects.create(user=self.other, text='not mine')
+        results = self.batch({'op': 'toggle', 'id': todo.pk}, {'op': 'delete', 'id': todo.pk})
+        self.assertEqual([result['status'] for result in results], [404, 404])
+        self.assertTrue(Todo.objects.filter(pk=todo.pk, completed=False).exists())
+
+    def test_expected_version_mismatch_skips_the_operation(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        results = self.batch(
+            {'op': 'toggle', 'id': todo.pk, 'version': 1},
+            {'op': 'update', 'id': todo.pk, 'text': 'lost', 'version': 1},
+            {'op': 'delete', 'id': todo.pk, 'version': 1},
+        )
+        self.assertEqual([result['status'] for result in results], [200, 412, 412])
+        todo.refresh_from_db()
+        self.assertEqual((todo.text, todo.completed, todo.version), ('task', True, 2))
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def operations(size):
+            todos = Todo.objects.bulk_create(Todo(user=self.user, text=f'todo {n}') for n in range(3 * size))
+            return (
+                [{'op': 'create', 'text': f'new {n}'} for n in range(size)]
+                + [{'op': 'update', 'id': todo.pk, 'text': 'renamed', 'version': 1} for todo in todos[:size]]
+                + [{'op': 'toggle', 'id': todo.pk} for todo in todos[size:2 * size]]
+                + [{'op': 'delete', 'id': todo.pk} for todo in todos[2 * size:]]
+            )
+
+        # The first write of a user also looks the user up and creates the list version
+        self.batch({'op': 'create', 'text': 'first'})
+        counts = []
+        for size in (2, 20):
+            batch = operations(size)
+            with CaptureQueriesContext(connection) as queries:
+                results = self.batch(*batch)
+            self.assertEqual({result['status'] for result in results}, {200, 201, 204})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_concurrent_change_after_the_read_fails_the_batch(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        with mock.patch('auth_app.batch.update_todos', side_effect=BatchConflict):
+            response = self.post_json('/auth/todos/batch/', {'operations': [
+                {'op': 'create', 'text': 'new'}, {'op': 'toggle', 'id': todo.pk},
+            ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(Todo.objects.values_list('text', 'completed')), [('task', False)])
+
+    def test_update_skips_rows_written_since_the_read(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        Todo.objects.filter(pk=todo.pk).update(version=5)
+        todo.text = 'stale'
+        with self.assertRaises(BatchConflict):
+            update_todos(Todo.objects.for_user(self.user.pk), {todo.pk: todo}, {todo.pk: 1})
+        todo.refresh_from_db()
+        self.assertEqual((todo.text, todo.version), ('task', 5))
+
+    def test_invalid_batch_writes_nothing(self):
+        response = self.post_json('/auth/todos/batch/', {'operations': [
+            {'op': 'create', 'text': 'valid'}, {'op': 'update', 'id': 1},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Todo.objects.exists())
+
+    def test_batch_is_one_list_version(self):
+        self.batch({'op': 'create', 'text': 'a'}, {'op': 'create', 'text': 'b'})
+        self.assertEqual(TodoListVersion.objects.current(self.user.pk), 1)
+
+
+class TodoChangesTests(TodoAPITestCase):
+    def test_changes_since_a_seq(self):
+        ids = [self.post_json('/auth/todos/', {'text': f'todo {n}'}).json()['id'] for n in range(3)]
+        self.assertEqual(self.changes().json()['seq'], 3)
+        self.client.patch(f'/auth/todos/{ids[0]}/toggle/')
+        data = self.changes(3).json()
+        self.assertEqual([(change['seq'], change['op'], change['todo']['id']) for change in data['changes']], [
+            (4, 'upsert', ids[0]),
+        ])
+        self.assertTrue(data['changes'][0]['todo']['completed'])
+        self.assertEqual(self.client.delete('/auth/todos/clear_completed/').status_code, 204)
+        self.assertEqual(self.changes(4).json(), {
+            'changes': [{'seq': 5, 'op': 'delete', 'id': ids[0]}], 'seq': 5, 'has_more': False,
+        })
+
+    def test_full_sync_keeps_one_row_per_todo(self):
+        todo_id = self.post_json('/auth/todos/', {'text': 'task'}).json()['id']
+        self.client.patch(f'/auth/todos/{todo_id}/toggle/')
+        self.client.patch(f'/auth/todos/{todo_id}/toggle/')
+        data = self.changes().json()
+        self.assertEqual([(change['seq'], change['op']) for change in data['changes']], [(3, 'upsert')])
+
+    def test_limit_pages_the_changes(self):
+        for n in range(3):
+            self.post_json('/auth/todos/', {'text': f'todo {n}'})
+        data = self.changes(limit=2).json()
+        self.assertEqual((len(data['changes']), data['seq'], data['has_more']), (2, 2, True))
+        data = self.changes(2, limit=2).json()
+        self.assertEqual((len(data['changes']), data['seq'], data['has_more']), (1, 3, False))
+
+    def test_compacted_tombstones_require_a_resync(self):
+        todo_id = self.post_json('/auth/todos/', {'text': 'task'}).json()['id']
+        self.client.patch(f'/auth/todos/{todo_id}/toggle/')
+        self.client.delete('/auth/todos/clear_completed/')
+        self.post_json('/auth/todos/', {'text': 'kept'})
+        TodoChange.objects.update(changed_at=timezone.now() - timedelta(days=60))
+        call_command('compact_todo_changes', stdout=open('/dev/null', 'w'))
+        self.assertFalse(TodoChange.objects.filter(deleted=True).exists())
+        self.assertEqual(self.changes(1).status_code, 410)
+        self.assertEqual(self.changes(3).status_code, 200)
+        self.assertEqual([change['op'] for change in self.changes().json()['changes']], ['upsert'])
+
+    def test_seq_ahead_of_the_sequence_requires_a_resync(self):
+        self.assertEqual(self.changes(5).status_code, 410)
+
+
+class ClearCompletedTests(TodoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        Todo.objects.bulk_create(Todo(user=self.user, text=f'todo {n}', completed=n % 2 == 0) for n in range(10))
+
+    def test_clear_deletes_completed_todos(self):
+        response = self.client.delete('/auth/todos/clear_completed/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Todo._base_manager.count(), 5)
+
+    @override_settings(TODO_CLEAR_BATCH_SIZE=2)
+    def test_each_committed_batch_sends_its_event(self):
+        before = TodoListVersion.objects.current(self.user.pk)
+        with mock.patch('auth_app.signals.todo_events.publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.delete('/auth/todos/clear_completed/')
+        events = [call.args[0] for call in publish.call_args_list]
+        # 5 to-dos in batches of 2: no version is skipped, so no stream resets
+        self.assertEqual([event.id for event in events], [before + 1, before + 2, before + 3])
+        self.assertEqual([event.data['deleted'] for event in events], [2, 2, 1])
+        self.assertEqual({event.type for event in events}, {'cleared'})
+
+    @override_settings(TODO_CLEAR_DEFER_THRESHOLD=3)
+    def test_large_clear_is_hidden_then_purged(self):
+        response = self.client.delete('/auth/todos/clear_completed/')
+        self.assertEqual((response.status_code, response.json()), (202, {'deleted': 5}))
+        self.assertEqual(len(self.client.get('/auth/todos/').json()['results']), 5)
+        self.assertEqual(Todo._base_manager.count(), 10)
+        tombstones = [change for change in self.changes().json()['changes'] if change['op'] == 'delete']
+        self.assertEqual(len(tombstones), 5)
+
+        self.assertEqual(purge_deleted_todos(batch_size=2), 5)
+        self.assertEqual(Todo._base_manager.count(), 5)
+        self.assertFalse(Todo._base_manager.filter(completed=True).exists())
+
+    @override_settings(TODO_CLEAR_DEFER_THRESHOLD=3)
+    def test_hidden_todos_cannot_be_toggled(self):
+        hidden = Todo.objects.filter(completed=True).first()
+        self.client.delete('/auth/todos/clear_completed/')
+        self.assertEqual(self.client.patch(f'/auth/todos/{hidden.pk}/toggle/').status_code, 404)
+
+
+class TodoImportTests(TodoAPITestCase):
+    def test_invalid_rows_are_skipped_and_reported(self):
+        body = b'{"text": "ok"}\nnot json\n{"text": ""}\n\n{"text": "fine", "completed": true}\n'
+        response = self.client.post('/auth/todos/import/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['imported'], data['skipped'], data['truncated']), (2, 2, False))
+        self.assertEqual([error['line'] for error in data['errors']], [2, 3])
+        self.assertEqual(sorted(Todo.objects.values_list('text', 'completed')), [('fine', True), ('ok', False)])
+
+    def test_csv_errors_carry_line_numbers(self):
+        body = b'text,completed\nfirst,false\nsecond,maybe\n'
+        data = self.client.post('/auth/todos/import/', body, content_type='text/csv').json()
+        self.assertEqual((data['imported'], data['skipped']), (1, 1))
+        self.assertEqual(data['errors'][0]['line'], 3)
+
+    @override_settings(TODO_IMPORT_MAX_ROWS=2)
+    def test_rows_past_the_limit_are_truncated(self):
+        body = b''.join(b'{"text": "todo %d"}\n' % n for n in range(5))
+        data = self.client.post('/auth/todos/import/', body, content_type='application/x-ndjson').json()
+        self.assertEqual((data['imported'], data['truncated']), (2, True))
+
+    def test_unknown_type_is_rejected(self):
+        response = self.client.post('/auth/todos/import/?type=xml', b'<todo/>', content_type='application/xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class SecurityHeadersTests(TodoAPITestCase):
+    def test_responses_carry_the_security_headers(self):
+        response = self.client.get('/auth/todos/')
+        for name, value in SECURITY_HEADERS.items():
+            self.assertEqual(response[name], value)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+
+    def test_api_only_profile_still_forbids_framing(self):
+        middleware = [name for name in settings.MIDDLEWARE if name not in settings.API_ONLY_EXCLUDED_MIDDLEWARE]
+        with override_settings(MIDDLEWARE=middleware):
+            response = self.client.get('/auth/todos/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        self.assertEqual(response['Content-Security-Policy'], SECURITY_HEADERS['Content-Security-Policy'])
+
+
+class ThrottleTests(TodoAPITestCase):
+    def test_reads_are_counted_outside_the_database(self):
+        self.client.get('/auth/todos/')
+        self.assertFalse(RateLimitCounter.objects.exists())
+
+    def test_writes_are_counted_in_the_shared_counters(self):
+        self.post_json('/auth/todos/', {'text': 'new'})
+        self.assertEqual(RateLimitCounter.objects.get().value, 1)
+
+    @mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', {'user': '2/day', 'anon': '2/day'})
+    def test_reads_and_writes_are_each_held_to_the_rate(self):
+        statuses = [self.client.get('/auth/todos/').status_code for _ in range(3)]
+        statuses += [self.post_json('/auth/todos/', {'text': 'new'}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429, 201, 201, 429])
+        self.assertEqual(RateLimitCounter.objects.get().value, 3)
+
+
+class RegistrationTests(TodoAPITestCase):
+    def register(self, username, email):
+        return self.post_json('/auth/register/', {'username': username, 'email': email, 'password': 'K7#vq-plumb-ore'})
+
+    def test_taken_username_and_email_are_reported(self):
+        self.assertEqual(self.register('alice', 'new@example.com').json(), {'error': USERNAME_TAKEN})
+        self.assertEqual(self.register('carol', 'alice@example.com').json(), {'error': EMAIL_TAKEN})
+
+    def test_users_without_email_do_not_conflict(self):
+        User.objects.create_user('admin', '')
+        self.assertEqual(self.register('carol', '').status_code, 201)
+        self.assertEqual(User.objects.filter(email='').count(), 2)
+
+    def test_email_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('carol', 'alice@example.com')
+
+    def test_email_registered_since_the_check_is_reported(self):
+        # The check passes, then a concurrent registration commits the email first
+        checks = iter([lambda username, email: None, registration_conflict])
+        with mock.patch('auth_app.views.registration_conflict', side_effect=lambda *args: next(checks)(*args)):
+            response = self.register('carol', 'alice@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': EMAIL_TAKEN})
+        self.assertFalse(User.objects.filter(username='carol').exists())
+
+    @override_settings(USER_IMPORT_MAX_ROWS=2)
+    def test_provisioning_upload_is_capped(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        def upload(count):
+            body = b''.join(b'{"username": "user%d"}\n' % n for n in range(count))
+            return self.client.post('/auth/users/import/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(upload(2).json()['created'], 2)
+        response = upload(3)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('provision_users', response.json()['error'])
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 2)
+
+    def test_provisioning_reports_the_field_taken_meanwhile(self):
+        provisioner = UserProvisioner()
+        rows = [
+            (1, {'username': 'alice', 'email': 'alice2@example.com'}),
+            (2, {'username': 'carol', 'email': 'bob@example.com'}),
+            (3, {'username': 'dave', 'email': 'dave@example.com'}),
+        ]
+        users = [User(username=row['username'], email=row['email']) for _, row in rows]
+        provisioner.insert_each(rows, users)
+        self.assertEqual(provisioner.result['created'], 1)
+        self.assertEqual(
+            provisioner.result['errors'], [{'line': 1, 'error': USERNAME_TAKEN}, {'line': 2, 'error': EMAIL_TAKEN}],
+        )
+
+
+class TodoSearchTests(TodoAPITestCase):
+    def search(self, q):
+        response = self.client.get('/auth/todos/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return sorted(todo['text'] for todo in response.json()['results'])
+
+    def test_words_match_as_prefixes(self):
+        Todo.objects.bulk_create(Todo(user=self.user, text=text) for text in ('Buy milk', 'Buy bread', 'Mill visit'))
+        Todo.objects.create(user=self.other, text='Buy milk')
+        self.assertEqual(self.search('mil'), ['Buy milk', 'Mill visit'])
+        self.assertEqual(self.search('buy mi'), ['Buy milk'])
+
+    def test_single_character_matches_as_a_prefix(self):
+        Todo.objects.bulk_create(Todo(user=self.user, text=f't{n}') for n in range(5))
+        Todo.objects.create(user=self.user, text='other')
+        self.assertEqual(self.search('t'), [f't{n}' for n in range(5)])
+
+
+class AsyncViewTests(TodoAPITestCase):
+    """The async views (served under ASGI), called directly with a bearer token."""
+    def request(self, method, path, body=None, headers=None):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}', **(headers or {})}
+        if body is None:
+            return getattr(AsyncRequestFactory(), method)(path, headers=headers)
+        return getattr(AsyncRequestFactory(), method)(
+            path, json.dumps(body), content_type='application/json', headers=headers,
+        )
+
+    async def test_list_matches_the_sync_view(self):
+        await Todo.objects.acreate(user=self.user, text='task')
+        expected = await sync_to_async(self.client.get)('/auth/todos/')
+        response = await async_views.todo_list_create(self.request('get', '/auth/todos/'))
+        self.assertEqual((response.status_code, response.content), (200, expected.content))
+        self.assertEqual(response['ETag'], expected['ETag'])
+        revalidate = self.request('get', '/auth/todos/', headers={'If-None-Match': response['ETag']})
+        revalidated = await async_views.todo_list_create(revalidate)
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_create_then_toggle_with_if_match(self):
+        response = await async_views.todo_list_create(self.request('post', '/auth/todos/', {'text': 'task'}))
+        self.assertEqual(response.status_code, 201)
+        todo_id = json.loads(response.content)['id']
+        toggle = f'/auth/todos/{todo_id}/toggle/'
+        stale = await async_views.toggle_todo(self.request('patch', toggle, headers={'If-Match': '"0"'}), todo_id)
+        self.assertEqual(stale.status_code, 412)
+        response = await async_views.toggle_todo(self.request('patch', toggle), todo_id)
+        self.assertEqual((response.status_code, json.loads(response.content)['completed']), (200, True))
+        self.assertTrue((await Todo.objects.aget(pk=todo_id)).completed)
+
+    async def test_requests_without_credentials_are_refused(self):
+        response = await async_views.todo_list_create(AsyncRequestFactory().get('/auth/todos/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+    async def test_login_is_refused_while_the_hashing_pool_is_busy(self):
+        self.user.set_password('K7#vq-plumb-ore')
+        await self.user.asave()
+        request = AsyncRequestFactory().post(
+            '/auth/login/', json.dumps({'email': 'alice@example.com', 'password': 'K7#vq-plumb-ore'}),
+            content_type='application/json',
+        )
+        request._dont_enforce_csrf_checks = True
+        with mock.patch.object(async_views.hashing_pool, 'verify_password', side_effect=HashingPoolBusy):
+            response = await async_views.login_user(request)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+
+
+@override_settings(REQUEST_METRICS=True, SERVER_TIMING=True, METRICS_TOKEN='scrape')
+class RequestMetricsTests(TodoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+
+    def scrape(self, token='scrape'):
+        return self.client.get('/metrics', headers={'Authorization': f'Bearer {token}'})
+
+    def test_response_carries_the_phase_timings(self):
+        header = self.client.get('/auth/todos/')['Server-Timing']
+        names = set(re.findall(r'(?:^|, )(\w+);', header))
+        self.assertLessEqual({'total', 'middleware', 'auth', 'view', 'db', 'cache'}, names)
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn('cache;desc="0 hit, 1 miss"', header)
+
+    def test_requests_are_aggregated_per_route(self):
+        Todo.objects.create(user=self.user, text='task')
+        self.client.get('/auth/todos/')
+        self.client.get('/auth/todos/')
+        self.client.patch('/auth/todos/0/toggle/')
+        metrics = self.scrape().content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/auth/todos/"} 2', metrics)
+        self.assertIn('http_responses_total{method="PATCH",route="/auth/todos/<int:todo_id>/toggle/",status="404"} 1', metrics)
+        # The second read of the page came from the rendered page cache
+        self.assertIn('todo_list_cache_requests_total{result="hit"} 1', metrics)
+        self.assertIn('todo_list_cache_requests_total{result="miss"} 1', metrics)
+
+    def test_scrape_requires_the_token(self):
+        self.assertEqual(self.scrape('wrong').status_code, 401)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(REQUEST_METRICS=False)
+    def test_disabled_metrics_add_nothing(self):
+        self.assertNotIn('Server-Timing', self.client.get('/auth/todos/'))
+        self.assertEqual(self.scrape().status_code, 404)
+
+
+@skipIf(orjson is None, 'orjson is not installed')
+class FastJSONRendererTests(TodoAPITestCase):
+    def test_output_matches_the_stock_renderer(self):
+        data = {
+            'text': 'Caf\u00e9 \u2028 \u2029 "quoted" \U0001f600', 'count': 2 ** 40, 'done': False, 'none': None,
+            'created_at': timezone.now(), 'day': timezone.now().date(), 'nested': [{'a': []}, 'b'],
+        }
+        expected = JSONRenderer().render(data)
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError('fell back')):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_data_orjson_refuses_falls_back(self):
+        data = {1: 'int key', 'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_list_page_is_encoded_with_orjson(self):
+        Todo.objects.create(user=self.user, text='task')
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError('fell back')):
+            page = self.client.get('/auth/todos/').json()
+        # The row fast path renders what the serializer would
+        self.assertEqual(page['results'], TodoSerializer(Todo.objects.all(), many=True).data)
+        self.assertEqual(
+            serialize_todo_rows(Todo.objects.values(*TodoSerializer.Meta.fields)),
+            TodoSerializer(Todo.objects.all(), many=True).data,
+        )
+
+
+class TodoEventStreamTests(TodoAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = InProcessEventBroker(max_connections=1, history=2, max_pending=1)
+        for target in ('auth_app.signals.todo_events', 'auth_app.async_views.todo_events'):
+            patcher = mock.patch(target, self.broker)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_todos(self, count):
+        """Creates to-dos through the API, publishing their events. Returns the list version."""
+        for n in range(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_json('/auth/todos/', {'text': f'todo {n}'})
+        return TodoListVersion.objects.current(self.user.pk)
+
+    def read(self, last_event_id, count, live=()):
+        """
+        Opens a stream resuming from `last_event_id` and returns its first
+        `count` events as `(id, type)`. With `live` events, publishes them
+        afterwards and returns the next event of the stream as well.
+        """
+        async def run():
+            stream = stream_todo_events(self.user.pk, last_event_id)
+
+            async def next_event():
+                message = (await anext(stream)).decode()
+                fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+                return int(fields['id']), fields['event']
+
+            try:
+                self.assertEqual(await anext(stream), b'retry: %d\n\n' % settings.TODO_EVENTS_RETRY_MS)
+                events = [await next_event() for _ in range(count)]
+                if live:
+                    for event in live:
+                        self.broker.publish(event)
+                    events.append(await next_event())
+            finally:
+                await stream.aclose()
+            return events
+
+        return async_to_sync(run)()
+
+    def test_fresh_stream_starts_with_the_current_version(self):
+        version = self.create_todos(1)
+        self.assertEqual(self.read(None, 1), [(version, 'ready')])
+
+    def test_resumed_stream_replays_the_missed_events(self):
+        version = self.create_todos(3)
+        self.assertEqual(self.read(version - 2, 2), [(version - 1, 'created'), (version, 'created')])
+
+    def test_stream_resuming_past_the_history_resets(self):
+        version = self.create_todos(3)
+        # Only the last 2 events are kept
+        self.assertEqual(self.read(version - 3, 1), [(version, 'reset')])
+
+    def test_live_events_are_streamed(self):
+        version = self.create_todos(1)
+        live = [TodoEvent(self.user.pk, version + 1, 'toggled')]
+        self.assertEqual(self.read(None, 1, live), [(version, 'ready'), (version + 1, 'toggled')])
+        self.assertEqual(self.broker.connections(self.user.pk), 0)
+
+    def test_overflowed_stream_resets(self):
+        version = self.create_todos(1)
+        # One event fits in the stream's queue, the next one overflows it
+        live = [TodoEvent(self.user.pk, version + 1, 'toggled'), TodoEvent(self.user.pk, version + 2, 'toggled')]
+        self.assertEqual(self.read(None, 1, live), [(version, 'ready'), (version, 'reset')])
+
+    def test_connections_past_the_limit_are_refused(self):
+        async def subscribe_twice():
+            self.broker.subscribe(self.user.pk)
+            with self.assertRaises(TooManyConnections):
+                self.broker.subscribe(self.user.pk)
+
+        async_to_sync(subscribe_twice)()
+
+
+class TokenRevocationTests(TodoAPITestCase):
+    def outstanding(self, expires_in=timedelta(days=1)):
+        jti = uuid.uuid4().hex
+        now = timezone.now()
+        return OutstandingToken.objects.create(
+            user=self.user, jti=jti, token=jti, created_at=now, expires_at=now + expires_in,
+        )
+
+    def test_filter_answers_maybe_for_blacklisted_tokens_only(self):
+        revoked, kept = self.outstanding(), self.outstanding()
+        expired = self.outstanding(-timedelta(minutes=1))
+        for token in (revoked, expired):
+            BlacklistedToken.objects.create(token=token)
+        revocations = RevocationFilter(sync_interval=3600, rebuild_interval=3600)
+        revocations.rebuild()
+        self.assertEqual(len(revocations), 1)  # The expired token is left out
+        self.assertTrue(revocations.might_be_revoked(revoked.jti))
+        self.assertFalse(revocations.might_be_revoked(kept.jti))
+        revocations.add(kept.jti)
+        self.assertTrue(revocations.might_be_revoked(kept.jti))
+
+    def test_sync_picks_up_tokens_blacklisted_elsewhere(self):
+        revocations = RevocationFilter(sync_interval=3600, rebuild_interval=3600)
+        revocations.rebuild()
+        token = self.outstanding()
+        BlacklistedToken.objects.create(token=token)
+        self.assertFalse(revocations.might_be_revoked(token.jti))
+        revocations.sync()
+        self.assertTrue(revocations.might_be_revoked(token.jti))
+
+    def test_token_the_filter_missed_is_refused_by_the_blacklist_write(self):
+        refresh = RefreshToken.for_user(self.user)
+        revocations = RevocationFilter(sync_interval=3600, rebuild_interval=3600)
+        revocations.rebuild()
+        # Blacklisted by another process since the filter's last sync
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=refresh['jti']))
+        with mock.patch('auth_app.revocation.revocation_filter', revocations):
+            token = RevocableRefreshToken(str(refresh))  # The filter rules the blacklist read out
+            with self.assertRaises(TokenError):
+                token.blacklist()
+
+    def test_compaction_deletes_expired_tokens_in_batches(self):
+        expired = [self.outstanding(-timedelta(minutes=1)) for _ in range(5)]
+        BlacklistedToken.objects.create(token=expired[0])
+        live = self.outstanding()
+        BlacklistedToken.objects.create(token=live)
+        self.assertEqual(compact_token_blacklist(batch_size=2), 5)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live.jti])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), [live.jti])
+
+
+class UserCacheTests(TodoAPITestCase):
+    def later(self, seconds):
+        """Moves the user cache's clock `seconds` ahead."""
+        return mock.patch('auth_app.user_cache.time.monotonic', return_value=time.monotonic() + seconds)
+
+    def test_cached_user_is_reused_and_invalidated_on_save(self):
+        cache = UserCache(security_ttl=5)
+        cache.get(self.user.pk)
+        with self.assertNumQueries(0):
+            cache.get(self.user.pk).first_name = 'changed'
+        self.assertEqual(cache.get(self.user.pk).first_name, '')
+
+        self.user.first_name = 'Alice'
+        self.user.save()
+        self.assertEqual(user_cache.get(self.user.pk).first_name, 'Alice')
+
+    def test_security_fields_are_checked_again_after_their_ttl(self):
+        cache = UserCache(ttl=60, security_ttl=5)
+        cache.get(self.user.pk)
+        with self.later(6), self.assertNumQueries(1):
+            self.assertTrue(cache.get(self.user.pk).is_active)
+        with self.later(7), self.assertNumQueries(0):
+            cache.get(self.user.pk)
+
+    def test_deactivation_without_signal_ends_access_within_the_security_ttl(self):
+        self.assertEqual(self.client.get('/auth/todos/').status_code, 200)
+        # No post_save: the cached user stays active until its security fields are checked
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/auth/todos/').status_code, 200)
+        with self.later(settings.JWT_USER_CACHE_SECURITY_TTL + 1):
+            self.assertEqual(self.client.get('/auth/todos/').status_code, 401)
+
+    def test_deleted_user_is_not_found(self):
+        cache = UserCache(security_ttl=0)
+        cache.get(self.other.pk)
+        User.objects.filter(pk=self.other.pk).delete()
+        with self.assertRaises(User.DoesNotExist):
+            cache.get(self.other.pk)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PasswordHashingPoolTests(SimpleTestCase):
+    def setUp(self):
+        # Workers start on first use and see the settings of that moment
+        self.pool = PasswordHashingPool(max_workers=2, max_pending=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_passwords_are_hashed_in_order_in_the_workers(self):
+        passwords = [f'password {n}' for n in range(5)]
+        hashes = self.pool.make_passwords(passwords)
+        self.assertEqual([check_password(password, encoded) for password, encoded in zip(passwords, hashes)], [True] * 5)
+        self.assertEqual(async_to_sync(self.pool.verify_password)('password 0', hashes[0]), (True, False))
+
+    def test_jobs_past_max_pending_are_refused(self):
+        async def hash_two():
+            return await asyncio.gather(
+                self.pool.make_password('first'), self.pool.make_password('second'), return_exceptions=True,
+            )
+
+        first, second = async_to_sync(hash_two)()
+        self.assertTrue(check_password('first', first))
+        self.assertIsInstance(second, HashingPoolBusy)
+        # The slot is released once the job is done
+        self.assertTrue(check_password('third', async_to_sync(self.pool.make_password)('third')))
+
+
+class ShardTests(TodoAPITestCase):
+    def test_users_are_routed_to_their_shard(self):
+        shard_directory.assign(self.user.pk, 'shard1')
+        with override_settings(TODO_SHARDS=['default', 'shard1']):
+            router = ShardRouter()
+            self.assertEqual(router.db_for_read(Todo, user_id=self.user.pk), 'shard1')
+            self.assertEqual(router.db_for_write(TodoChange, instance=self.user), 'shard1')
+            # Users on `default` are left to the next router, like every unsharded model
+            self.assertIsNone(router.db_for_write(Todo, user_id=self.other.pk))
+            self.assertIsNone(router.db_for_read(User, user_id=self.user.pk))
+            todo = Todo(user_id=self.user.pk)
+            todo._state.db = 'shard1'
+            self.assertEqual(router.db_for_read(User, instance=todo), 'default')
+
+    def test_write_to_a_former_shard_is_refused(self):
+        shard_directory.assign(self.user.pk, 'shard1')
+        with override_settings(TODO_SHARDS=['default', 'shard1']):
+            check_user_shard(self.user.pk, 'shard1')
+            with self.assertRaises(ShardMoved):
+                check_user_shard(self.user.pk, 'default')
+
+    def test_new_shard_takes_users_from_every_other_shard_only(self):
+        users = range(3000)
+        before = HashRing(['default', 'shard1', 'shard2'])
+        after = HashRing(['default', 'shard1', 'shard2', 'shard3'])
+        moved = [user for user in users if before.shard_for(user) != after.shard_for(user)]
+        self.assertEqual({after.shard_for(user) for user in moved}, {'shard3'})
+        self.assertAlmostEqual(len(moved) / len(users), 1 / 4, delta=0.05)
+
+    def test_deleting_a_user_deletes_their_rows_on_another_shard(self):
+        user_id = self.user.pk
+        shard_directory.assign(user_id, 'shard1')
+        with override_settings(TODO_SHARDS=['default', 'shard1']), \
+                mock.patch('auth_app.signals.delete_user_rows') as delete_user_rows:
+            self.user.delete()
+        delete_user_rows.assert_called_once_with(user_id, 'shard1')
+
+    def test_admin_bulk_delete_commits_on_each_users_shard(self):
+        todos = [Todo.objects.create(user=user, text='task') for user in (self.user, self.other)]
+        before = TodoListVersion.objects.current(self.user.pk)
+        shards = {self.user.pk: 'default', self.other.pk: 'default'}
+        with mock.patch('auth_app.admin.user_todo_db', side_effect=shards.get), \
+                mock.patch('auth_app.admin.transaction', wraps=transaction) as admin_transaction:
+            TodoAdmin(Todo, admin.site).delete_queryset(None, Todo.objects.all())
+        admin_transaction.atomic.assert_called_once_with(using='default')
+        self.assertFalse(Todo.objects.exists())
+        self.assertEqual(TodoListVersion.objects.current(self.user.pk), before + 1)
+        self.assertEqual(
+            sorted(TodoChange.objects.filter(deleted=True).values_list('todo_id', flat=True)),
+            sorted(todo.pk for todo in todos),
+        )
+
+    def test_rows_of_users_deleted_around_django_are_cleaned_up(self):
+        todo = Todo.objects.create(user=self.user, text='task')
+        record_changes(self.user.pk, upserted=[todo.pk])
+        Todo.objects.create(user=self.other, text='kept')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM auth_user WHERE id = %s', [self.user.pk])
+
+        self.assertEqual(delete_orphaned_rows(batch_size=1), 1)
+        self.assertEqual(list(Todo._base_manager.values_list('user_id', flat=True)), [self.other.pk])
+        self.assertFalse(TodoChange.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(TodoListVersion.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(delete_orphaned_rows(), 0)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    `default` stands in for the replica: which database a read would use shows in
+    the request's ReadState. Outside TestCase's transaction, reads may leave the
+    primary.
+    """
+    def setUp(self):
+        # Not for the whole class: the router would keep the flush between tests
+        # away from `default`, as from any replica
+        replicas = override_settings(DATABASE_REPLICAS=['default'], DATABASE_ROUTERS=['auth_app.replicas.ReplicaRouter'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        for cache in caches.all():
+            cache.clear()
+        # Events still queued at the end are written in the test's transaction, rolled back with it
+        self.addCleanup(audit_log.flush)
+        self.user = User.objects.create_user('alice', 'alice@example.com')
+        Todo.objects.create(user=self.user, text='task')
+        self.client.cookies['access'] = str(AccessToken.for_user(self.user))
+
+    def request(self, method, url, **data):
+        """Runs a request and returns its response and ReadState."""
+        states = []
+        pin = ReplicaPinningMiddleware.pin
+
+        def record(middleware, response, state):
+            states.append(state)
+            return pin(middleware, response, state)
+
+        with mock.patch.object(ReplicaPinningMiddleware, 'pin', autospec=True, side_effect=record):
+            response = getattr(self.client, method)(url, **data)
+        return response, states[0]
+
+    def test_throttled_read_stays_on_the_replica(self):
+        response, state = self.request('get', '/auth/todos/')
+        self.assertEqual(response.status_code, 200)
+        # The throttle counted the read in memory, not on the primary
+        self.assertFalse(RateLimitCounter.objects.exists())
+        self.assertEqual((state.pinned, state.wrote, state.replica), (False, False, 'default'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_todo_write_pins_the_client_to_the_primary(self):
+        response, state = self.request('post', '/auth/todos/', data={'text': 'new'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(state.wrote)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+        response, state = self.request('get', '/auth/todos/')
+        self.assertTrue(state.pinned)
+        self.assertIsNone(state.replica)
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class ConcurrentRefreshTests(TransactionTestCase):
+    """Tabs refreshing one refresh token at the same moment, each from its own thread."""
+    TABS = 4
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        # Events still queued at the end are written in the test's transaction, rolled back with it
+        self.addCleanup(audit_log.flush)
+        self.user = User.objects.create_user('alice', 'alice@example.com')
+        self.refresh = RefreshToken.for_user(self.user)
+        # Built here rather than by a background thread racing the test's tables
+        revocation_filter.rebuild()
+        self.addCleanup(revocation_filter.clear)
+
+    def refresh_from_tabs(self):
+        view = CustomTokenRefreshView.as_view()
+        barrier = threading.Barrier(self.TABS)
+        responses = []
+
+        def tab():
+            request = RequestFactory().post('/auth/refresh/')
+            request.COOKIES['refresh'] = str(self.refresh)
+            barrier.wait()
+            try:
+                responses.append(view(request))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=tab) for _ in range(self.TABS)]
+        # The request counters are not under test, and would only add concurrent writes
+        with mock.patch.object(CustomTokenRefreshView, 'throttle_classes', []):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return responses
+
+    def test_tabs_share_one_rotation(self):
+        responses = self.refresh_from_tabs()
+        self.assertEqual([response.status_code for response in responses], [200] * self.TABS)
+        pairs = {(response.cookies['access'].value, response.cookies['refresh'].value) for response in responses}
+        self.assertEqual(len(pairs), 1)
+        self.assertEqual(BlacklistedToken.objects.filter(token__jti=self.refresh['jti']).count(), 1)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+        # The original token and the single rotated one
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+
+    def test_rotated_token_is_refused_after_the_grace_period(self):
+        self.refresh_from_tabs()
+        caches[settings.TOKEN_REFRESH_CACHE_ALIAS].clear()
+        self.client.cookies['refresh'] = str(self.refresh)
+        self.assertEqual(self.client.post('/auth/refresh/').status_code, 401)
+
+
+class AuditLogTests(TransactionTestCase):
+    """The writer thread, on a connection of its own: the rows it inserts must be committed to be seen."""
+    def audit_log(self, **options):
+        log = AuditLog(**options)
+        self.addCleanup(log.close)
+        return log
+
+    def wait_for_rows(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while AuditEvent.objects.count() < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return AuditEvent.objects.count()
+
+    def test_full_batch_is_written_at_once(self):
+        log = self.audit_log(batch_size=3, flush_interval=60)
+        for user_id in (1, 2, 3):
+            log.record('login', user_id)
+        self.assertEqual(self.wait_for_rows(3), 3)
+        self.assertEqual(log.written, 3)
+
+    def test_partial_batch_is_written_after_the_interval(self):
+        log = self.audit_log(batch_size=100, flush_interval=0.1)
+        log.record('login', 1)
+        time.sleep(0.05)
+        log.record('logout', 1)
+        self.assertEqual(self.wait_for_rows(2), 2)
+        self.assertEqual(list(AuditEvent.objects.order_by('id').values_list('action', flat=True)), ['login', 'logout'])
+
+    def test_close_writes_the_queued_events(self):
+        log = self.audit_log(batch_size=100, flush_interval=60)
+        for user_id in range(5):
+            log.record('login', user_id)
+        log.close()
+        self.assertEqual(AuditEvent.objects.count(), 5)
+        self.assertEqual((log.written, log.pending()), (5, 0))
+
+    def test_full_queue_drops_events(self):
+        log = self.audit_log(background=False, batch_size=10, max_queue=2, block_timeout=0, flush_interval=60)
+        with self.assertLogs('auth_app.audit', 'ERROR'):
+            for user_id in range(3):
+                log.record('login', user_id)
+        self.assertEqual((log.dropped, log.pending()), (1, 2))
+        log.flush()
+        self.assertEqual(list(AuditEvent.objects.values_list('user_id', flat=True)), [0, 1])
+
+
+class SynchronousAuditLogTests(TodoAPITestCase):
+    def test_events_wait_for_a_full_batch_or_flush(self):
+        log = AuditLog(background=False, batch_size=3, flush_interval=60)
+        log.record('login', 1)
+        log.record('logout', 1)
+        self.assertEqual((AuditEvent.objects.count(), log.pending()), (0, 2))
+        log.record('login', 2)
+        self.assertEqual((AuditEvent.objects.count(), log.pending()), (3, 0))
+        log.record('logout', 2)
+        log.flush()
+        self.assertEqual(AuditEvent.objects.count(), 4)
+        self.assertIsNone(log._thread)
+
+    def test_event_past_the_interval_writes_the_queue(self):
+        log = AuditLog(background=False, batch_size=100, flush_interval=0.05)
+        log.record('login', 1)
+        self.assertEqual(AuditEvent.objects.count(), 0)
+        time.sleep(0.06)
+        log.record('logout', 1)
+        self.assertEqual(AuditEvent.objects.count(), 2)
+
+    def test_requests_record_their_events(self):
+        self.user.set_password('K7#vq-plumb-ore')
+        self.user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/auth/login/', json.dumps({'email': 'alice@example.com', 'password': 'K7#vq-plumb-ore'}),
+                content_type='application/json',
+            )
+        audit_log.flush()
+        self.assertEqual(list(AuditEvent.objects.values_list('action', 'user_id')), [('login', self.user.pk)])
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+
+def hit_counter(cache, key, timeout):
+    """
+    Counts one hit on a fixed-window counter and returns the new count.
+    Uses the single-statement `incr_or_create` of `DatabaseCounterCache` when
+    available, and the add-then-incr dance of django_ratelimit otherwise.
+    """
+    if hasattr(cache, 'incr_or_create'):
+        return cache.incr_or_create(key, 1, timeout)
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The counter expired between add() and incr()
+        cache.set(key, 1, timeout)
+        return 1
+
+
+class SharedCounterThrottleMixin:
+    """
+    Replaces DRF's per-cache request history with a fixed-window counter. DRF's
+    default keeps a list of timestamps per client and rewrites it on every
+    request, which is neither atomic nor shared between workers; one counter
+    increment is both.
+
+    Requests that write count in the shared rate limiting cache
+    (`RATELIMIT_USE_CACHE`), the store and windowing django_ratelimit uses:
+    they write to the primary anyway. Reads count in `THROTTLE_CACHE_ALIAS`
+    instead, so that a read never writes to the database and can stay on a
+    replica; that cache is per process unless it points at Redis or
+    Memcached. Each kind of request is held to the rate on its own.
+    """
+    def get_cache(self, request):
+        if request.method in SAFE_METHODS:
+            return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+        return caches[getattr(settings, 'RATELIMIT_USE_CACHE', 'default')]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window_start = int(self.now) // self.duration * self.duration
+        self.window_end = window_start + self.duration
+        count = hit_counter(self.get_cache(request), f'{self.key}:{window_start}', self.duration)
+        if count > self.num_requests:
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        return max(self.window_end - self.now, 0)
+
+
+class SharedUserRateThrottle(SharedCounterThrottleMixin, UserRateThrottle):
+    pass
+
+
+class SharedAnonRateThrottle(SharedCounterThrottleMixin, AnonRateThrottle):
+    pass
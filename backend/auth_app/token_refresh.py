@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# How often a refresh waiting for a concurrent rotation of the same token checks for its result
+POLL_INTERVAL = 0.02
+
+
+class RefreshCoalescer:
+    """
+    Makes concurrent refreshes of one refresh token share a single rotation.
+
+    With `ROTATE_REFRESH_TOKENS` and `BLACKLIST_AFTER_ROTATION`, a refresh
+    blacklists the token it was given. Several tabs refreshing at the same
+    moment would each try: the first one wins and the others get 401, which
+    logs the user out. Instead, the first refresh of a token takes a short
+    lock and rotates it; the new access / refresh pair is then kept for
+    `grace` seconds under the old token's id, and the other refreshes of that
+    token wait for the lock and get the same pair, without writing to the
+    outstanding and blacklist tables.
+
+    Within the grace window the old token is thus as good as the new one, so
+    keep it to a few seconds. A pair is not handed out again once its refresh
+    token has been blacklisted (logout). Several worker processes should share
+    the cache, as with `TODO_LIST_CACHE_ALIAS`; with a per-process cache, only
+    refreshes reaching the same process are coalesced.
+    """
+    def __init__(self, alias, grace=5, lock_timeout=5):
+        self.alias = alias
+        self.grace = grace
+        self.lock_timeout = lock_timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def refresh(self, token, rotate):
+        """
+        Rotates a refresh token once for all its concurrent refreshes.
+        Args:
+            token: The refresh token, as sent by the client.
+            rotate: Callable doing the actual rotation and returning the new
+                `{'access': ..., 'refresh': ...}` data; it raises for invalid tokens.
+        Returns:
+            dict: The data of `rotate`, possibly from a concurrent call.
+        """
+        jti = self.token_id(token)
+        if jti is None or self.grace <= 0:
+            return rotate()
+        key = f'token_refresh:{jti}'
+        lock_key = f'{key}:lock'
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            data = self.cache.get(key)
+            if data is not None and not self.revoked(data):
+                return data
+            if data is None and self.cache.add(lock_key, 1, self.lock_timeout):
+                break
+            if data is not None or time.monotonic() >= deadline:
+                # Revoked pair, or a stuck rotation: rotate for ourselves, which fails if the token is blacklisted
+                return rotate()
+            time.sleep(POLL_INTERVAL)
+        try:
+            data = rotate()
+            self.cache.set(key, data, self.grace)
+            return data
+        finally:
+            self.cache.delete(lock_key)
+
+    def token_id(self, token):
+        """The `jti` of a refresh token with a valid signature, or None."""
+        try:
+            payload = token_backend.decode(token, verify=True)
+        except TokenBackendError:
+            return None
+        if payload.get(api_settings.TOKEN_TYPE_CLAIM) != 'refresh':
+            return None
+        return payload.get(api_settings.JTI_CLAIM)
+
+    def revoked(self, data):
+        """Whether the refresh token of a cached pair was blacklisted since, e.g. at logout."""
+        if 'refresh' not in data:
+            return False
+        jti = self.token_id(data['refresh'])
+        return jti is None or BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+refresh_coalescer = RefreshCoalescer(
+    alias=getattr(settings, 'TOKEN_REFRESH_CACHE_ALIAS', 'default'),
+    grace=getattr(settings, 'TOKEN_REFRESH_GRACE_SECONDS', 5),
+)
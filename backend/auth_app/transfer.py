@@ -0,0 +1,330 @@
+import csv
+import json
+from datetime import timezone as dt_timezone
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .audit import AUDIT_FIELDS
+from .changes import record_changes
+from .models import Todo, user_todo_db
+from .renderers import orjson
+from .serializers import datetime_formatter
+from .signals import todos_changed
+
+# Columns of an export, in order. Imports read `text`, `completed` and `created_at`.
+EXPORT_FIELDS = ('id', 'text', 'completed', 'created_at')
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Spreadsheet apps run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+    _DecodeError = orjson.JSONDecodeError
+else:
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+    _loads = json.loads
+    _DecodeError = ValueError
+
+
+def export_queryset(user):
+    """The user's to-dos as `EXPORT_FIELDS` tuples, oldest first."""
+    return Todo.objects.for_user(user.pk).order_by('created_at', 'id').values_list(*EXPORT_FIELDS)
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+class TodoExportFormatter:
+    """
+    Turns export rows into NDJSON or CSV bytes, one chunk of rows at a time.
+
+    Used by the sync and async export views alike, which feed it rows from
+    `QuerySet.iterator()` / `aiterator()`. Memory use is bounded by the chunk
+    size, however many to-dos are exported.
+    """
+    def __init__(self, file_format):
+        self.file_format = file_format
+        self.format_datetime = datetime_formatter()
+        self.csv_writer = csv.writer(_Echo())
+
+    def header(self):
+        if self.file_format == 'csv':
+            return self.csv_writer.writerow(EXPORT_FIELDS).encode()
+        return b''
+
+    def format_rows(self, rows):
+        if self.file_format == 'csv':
+            return ''.join(self.csv_row(row) for row in rows).encode()
+        return b''.join(self.ndjson_row(row) for row in rows)
+
+    def ndjson_row(self, row):
+        pk, text, completed, created_at = row
+        return _dumps({
+            'id': pk,
+            'text': text,
+            'completed': completed,
+            'created_at': self.format_datetime(created_at),
+        }) + b'\n'
+
+    def csv_row(self, row):
+        pk, text, completed, created_at = row
+        if text.startswith(CSV_FORMULA_PREFIXES):
+            # Quote formula-like text so spreadsheets show it as is (undone on import)
+            text = "'" + text
+        return self.csv_writer.writerow([pk, text, 'true' if completed else 'false', self.format_datetime(created_at)])
+
+
+def iter_export(user, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields the user's to-dos as chunks of NDJSON or CSV bytes."""
+    formatter = TodoExportFormatter(file_format)
+    header = formatter.header()
+    if header:
+        yield header
+    chunk = []
+    for row in export_queryset(user).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield formatter.format_rows(chunk)
+            chunk = []
+    if chunk:
+        yield formatter.format_rows(chunk)
+
+
+async def aiter_export(user, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Async counterpart of `iter_export`, for `StreamingHttpResponse` under ASGI.
+    Each chunk is fetched and formatted in one `sync_to_async` call, so the
+    event loop only hands bytes on. (`aiterator()` cannot be used here: it
+    runs the `values_list()` query synchronously.)
+    """
+    formatter = TodoExportFormatter(file_format)
+    header = formatter.header()
+    if header:
+        yield header
+    rows = export_queryset(user).iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: formatter.format_rows(islice(rows, chunk_size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+
+class AuditExportFormatter:
+    """Turns `auth_app.audit.audit_events()` rows into NDJSON or CSV bytes, like `TodoExportFormatter`."""
+    def __init__(self, file_format):
+        self.file_format = file_format
+        self.format_datetime = datetime_formatter()
+        self.csv_writer = csv.writer(_Echo())
+
+    def header(self):
+        if self.file_format == 'csv':
+            return self.csv_writer.writerow(AUDIT_FIELDS).encode()
+        return b''
+
+    def format_rows(self, rows):
+        if self.file_format == 'csv':
+            return ''.join(self.csv_row(row) for row in rows).encode()
+        return b''.join(self.ndjson_row(row) for row in rows)
+
+    def ndjson_row(self, row):
+        pk, created_at, user_id, action, ip, data = row
+        return _dumps({
+            'id': pk,
+            'created_at': self.format_datetime(created_at),
+            'user_id': user_id,
+            'action': action,
+            'ip': ip,
+            'data': data,
+        }) + b'\n'
+
+    def csv_row(self, row):
+        pk, created_at, user_id, action, ip, data = row
+        details = _dumps(data).decode() if data is not None else ''
+        if details.startswith(CSV_FORMULA_PREFIXES):
+            details = "'" + details
+        return self.csv_writer.writerow([pk, self.format_datetime(created_at), user_id, action, ip or '', details])
+
+
+def iter_audit_export(events, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields `auth_app.audit.audit_events()` rows as chunks of NDJSON or CSV bytes. Rows are read
+    with a chunked iterator, so memory use stays flat however long the trail.
+    """
+    formatter = AuditExportFormatter(file_format)
+    header = formatter.header()
+    if header:
+        yield header
+    chunk = []
+    for row in events.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield formatter.format_rows(chunk)
+            chunk = []
+    if chunk:
+        yield formatter.format_rows(chunk)
+
+
+def parse_ndjson(lines):
+    """
+    Parses NDJSON lines lazily.
+    Yields:
+        tuple: `(line_number, record)`, where record is a dict or, for a line
+        that is not a JSON object, an error message.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = _loads(line)
+        except _DecodeError:
+            yield number, 'Invalid JSON'
+            continue
+        yield number, record if isinstance(record, dict) else 'Expected a JSON object'
+
+
+def parse_csv(lines, required='text'):
+    """
+    Parses CSV lines (bytes) with a header row lazily.
+    Args:
+        lines: Iterable of lines.
+        required: Column the header row must have.
+    Yields:
+        tuple: `(line_number, record)` like `parse_ndjson`.
+    """
+    text_lines = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(text_lines)
+    try:
+        if required not in (reader.fieldnames or ()):
+            yield 1, f'The header row must name a {required} column'
+            return
+        for record in reader:
+            text = record.get('text')
+            if text and text[0] == "'" and text[1:].startswith(CSV_FORMULA_PREFIXES):
+                record['text'] = text[1:]
+            yield reader.line_num, record
+    except csv.Error as exc:
+        yield reader.line_num, f'Invalid CSV: {exc}'
+    except UnicodeDecodeError:
+        yield reader.line_num + 1, 'Invalid UTF-8'
+
+
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+def parse_bool(value):
+    """Reads `completed` from JSON (true / false / 0 / 1) or CSV text; missing means False."""
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('true', '1', 'yes'):
+            return True
+        if lowered in ('false', '0', 'no', ''):
+            return False
+    raise ValueError('completed must be true or false')
+
+
+class TodoImporter:
+    """
+    Inserts parsed records as to-dos of one user, in `bulk_create` batches.
+
+    Each batch is committed in its own transaction, so memory and lock time stay
+    bounded however large the file is; a failure keeps the batches committed so
+    far. Invalid records are skipped and reported with their line numbers
+    (the first `MAX_REPORTED_ERRORS` of them).
+    Args:
+        user: Owner of the imported to-dos.
+        batch_size: Rows per `bulk_create` and transaction.
+        max_rows: Refuse records beyond this many, None for no limit.
+        progress: Optional callable receiving the result dict after each batch.
+    """
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE, max_rows=None, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.progress = progress
+        self.max_text_length = Todo._meta.get_field('text').max_length
+        self.result = {'imported': 0, 'skipped': 0, 'errors': [], 'truncated': False}
+        self.version = None
+
+    def run(self, records):
+        """
+        Imports `(line_number, record)` pairs from `parse_ndjson` / `parse_csv`.
+        Returns:
+            dict: Counts of imported and skipped rows, plus the first errors.
+        """
+        batch = []
+        try:
+            for number, record in records:
+                if self.max_rows is not None and self.result['imported'] + len(batch) >= self.max_rows:
+                    self.result['truncated'] = True
+                    break
+                try:
+                    batch.append(self.build(record))
+                except ValueError as exc:
+                    self.skip(number, str(exc))
+                    continue
+                if len(batch) >= self.batch_size:
+                    self.insert(batch)
+                    batch = []
+            if batch:
+                self.insert(batch)
+        finally:
+            if self.version is not None:
+                todos_changed.send(
+                    sender=Todo, user_id=self.user.pk, action='import', version=self.version,
+                    data={'imported': self.result['imported']},
+                )
+        return self.result
+
+    def build(self, record):
+        if isinstance(record, str):
+            raise ValueError(record)
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError('text is required')
+        if len(text) > self.max_text_length:
+            raise ValueError(f'text is longer than {self.max_text_length} characters')
+        created_at = record.get('created_at')
+        if created_at:
+            created_at = parse_datetime(created_at) if isinstance(created_at, str) else None
+            if created_at is None:
+                raise ValueError('created_at is not an ISO 8601 datetime')
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at, dt_timezone.utc)
+        else:
+            created_at = timezone.now()
+        return Todo(user=self.user, text=text, completed=parse_bool(record.get('completed')), created_at=created_at)
+
+    def insert(self, batch):
+        with transaction.atomic(using=user_todo_db(self.user.pk)):
+            Todo.objects.for_user(self.user.pk).bulk_create(batch)
+            self.version = record_changes(self.user.pk, upserted=[todo.pk for todo in batch])
+        self.result['imported'] += len(batch)
+        if self.progress is not None:
+            self.progress(self.result)
+
+    def skip(self, number, message):
+        self.result['skipped'] += 1
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append({'line': number, 'error': message})
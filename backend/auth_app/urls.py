@@ -1,5 +1,11 @@
+from django.conf import settings
 from django.urls import path
-from .views import register_user, login_user, logout_view, todo_list_create, toggle_todo, clear_completed, get_csrf_token, CustomTokenRefreshView
+from .views import register_user, login_user, logout_view, todo_list_create, toggle_todo, clear_completed, todo_batch, todo_search, todo_changes, export_todos, import_todos, provision_users, export_audit_log, get_csrf_token, CustomTokenRefreshView
+
+if settings.ASYNC_API:
+    # Served by app.asgi: async ORM views, password hashing in a process pool off the event loop
+    from .async_views import register_user, login_user, todo_list_create, toggle_todo, clear_completed, todo_search, todo_changes, export_todos
+    from .async_views import todo_event_stream
 
 urlpatterns = [
     path('csrf/', get_csrf_token, name='get_csrf_token'),
@@ -9,5 +15,16 @@ urlpatterns = [
     path('todos/', todo_list_create, name='todo_list_create'),
     path('todos/<int:todo_id>/toggle/', toggle_todo, name='toggle_todo'),
     path('todos/clear_completed/', clear_completed, name='clear_completed'),
+    path('todos/batch/', todo_batch, name='todo_batch'),
+    path('todos/search/', todo_search, name='todo_search'),
+    path('todos/changes/', todo_changes, name='todo_changes'),
+    path('todos/export/', export_todos, name='export_todos'),
+    path('todos/import/', import_todos, name='import_todos'),
+    path('users/import/', provision_users, name='provision_users'),
+    path('audit/', export_audit_log, name='export_audit_log'),
     path('logout/', logout_view, name='logout'),
 ]
+
+if settings.ASYNC_API:
+    # A stream holds its connection open, which only an event loop can afford
+    urlpatterns.append(path('todos/events/', todo_event_stream, name='todo_events'))
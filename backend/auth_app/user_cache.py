@@ -0,0 +1,121 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+
+# Fields deciding whether a user may authenticate: re-read every `security_ttl` seconds
+SECURITY_FIELDS = ('is_active', 'password')
+
+
+class UserCache:
+    """
+    A bounded, per-process cache of user rows keyed by primary key.
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted once `max_size` users are cached. Saving or deleting a user
+    invalidates its entry in this process (see `auth_app.signals`), but a
+    queryset `update()` or a write from another process sends no signal. So
+    the `SECURITY_FIELDS` of a cached user are only trusted for `security_ttl`
+    seconds: the next lookup re-reads them with one primary key query, and
+    reloads the user if they changed or drops it if it is gone. `security_ttl`
+    bounds how long a deactivated user, or one whose password changed, can
+    keep using a still-valid access token; 0 checks them on every lookup.
+
+    Callers get a shallow copy of the cached instance so that per-request
+    mutations never leak into other requests.
+    """
+    def __init__(self, max_size=1024, ttl=60, security_ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.security_ttl = security_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Returns the user with the given primary key, loading it on a miss.
+        Raises:
+            User.DoesNotExist: If no such user exists.
+        """
+        user, verified = self._lookup(user_id)
+        if user is not None and not verified:
+            user = self._verify(user_id, user, self._security_fields(user_id).first())
+        if user is None:
+            user = get_user_model().objects.get(pk=user_id)
+            self._store(user_id, user)
+        return copy.copy(user)
+
+    async def aget(self, user_id):
+        """Async counterpart of `get`, loading misses through the async ORM."""
+        user, verified = self._lookup(user_id)
+        if user is not None and not verified:
+            user = self._verify(user_id, user, await self._security_fields(user_id).afirst())
+        if user is None:
+            user = await get_user_model().objects.aget(pk=user_id)
+            self._store(user_id, user)
+        return copy.copy(user)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, user_id):
+        """Returns the cached user, None on a miss, and whether its security fields are still trusted."""
+        if self.max_size <= 0:
+            return None, False
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, False
+            user, expires_at, verify_at = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._entries[user_id]
+                return None, False
+            self._entries.move_to_end(user_id)
+            return user, verify_at > now
+
+    def _security_fields(self, user_id):
+        return get_user_model().objects.filter(pk=user_id).values_list(*SECURITY_FIELDS)
+
+    def _verify(self, user_id, user, fields):
+        """
+        Trusts a cached user for another `security_ttl` seconds if its
+        security fields still have the values read from the database, drops
+        it otherwise.
+        Returns:
+            The user, None when it has to be reloaded.
+        """
+        if fields is None or tuple(fields) != tuple(getattr(user, name) for name in SECURITY_FIELDS):
+            self.invalidate(user_id)
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] is user:
+                self._entries[user_id] = (user, entry[1], time.monotonic() + self.security_ttl)
+        return user
+
+    def _store(self, user_id, user):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._entries[user_id] = (user, now + self.ttl, now + self.security_ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, 'JWT_USER_CACHE_MAX_SIZE', 1024),
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 60),
+    security_ttl=getattr(settings, 'JWT_USER_CACHE_SECURITY_TTL', 5),
+)
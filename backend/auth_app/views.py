@@ -1,3 +1,4 @@
+from itertools import islice
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.response import Response
@@ -7,17 +8,38 @@ from django.contrib.auth import authenticate
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-from django.http import JsonResponse
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
 from .models import Todo
-from .serializers import TodoSerializer
+from .serializers import AuditLogQuerySerializer, TodoSerializer, TodoBatchSerializer, TodoChangesSerializer, TodoSearchSerializer, serialize_todo_rows
+from .renderers import FastJSONRenderer
+from .audit import audit_events, audit_log, client_ip
+from .batch import BatchConflict, apply_todo_batch
+from .purge import clear_completed_todos
+from .provisioning import PARSERS as USER_PARSERS, UserProvisioner, integrity_conflict, registration_conflict
+from .changes import ResyncRequired, changes_since, create_todo, toggle_todos
+from .transfer import FORMATS, PARSERS, TodoImporter, iter_audit_export, iter_export
+from .conditional import if_none_match, parse_if_match, todo_etag, todo_list_etag
+from .metrics import timed
+from .revocation import RevocableRefreshToken
+from .response_cache import todo_list_cache
+from .signals import todos_changed
+from .token_refresh import refresh_coalescer
+from .pagination import TodoKeysetPagination, TodoSearchPagination
+from .search import search_terms, search_todos
 from django_ratelimit.decorators import ratelimit
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.state import token_backend
 from rest_framework_simplejwt.views import TokenRefreshView
-from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 @ensure_csrf_cookie
 @api_view(['GET'])
@@ -61,11 +83,10 @@ def register_user(request):
     email = request.data.get('email')
     password = request.data.get('password')
 
-    if User.objects.filter(username=username).exists():
-        return Response({'error': 'Username already taken'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    if User.objects.filter(email=email).exists():
-        return Response({'error': 'Email already registered'}, status=status.HTTP_400_BAD_REQUEST)
+    # Username and email checked in one query
+    conflict = registration_conflict(username, email)
+    if conflict:
+        return Response({'error': conflict}, status=status.HTTP_400_BAD_REQUEST)
     
     # Validate password using Django's built-in validators
     try:
@@ -73,8 +94,14 @@ def register_user(request):
     except ValidationError as e:
         return Response({'error': e.messages}, status=status.HTTP_400_BAD_REQUEST)
 
-    user = User.objects.create_user(username=username, email=email, password=password)
-    user.save()
+    try:
+        # In a savepoint: the conflict is looked up after the error
+        with transaction.atomic():
+            user = User.objects.create_user(username=username, email=email, password=password)
+    except IntegrityError:
+        # Username or email registered by a concurrent request since the check
+        return Response({'error': integrity_conflict(username, email)}, status=status.HTTP_400_BAD_REQUEST)
+    audit_log.record('register', user.pk, client_ip(request))
     return Response({'message': 'User registered successfully'}, status=status.HTTP_201_CREATED)
 
 # Login User
@@ -96,9 +123,12 @@ def login_user(request):
     try:
         user = User.objects.get(email=email)
     except User.DoesNotExist:
+        audit_log.record('login_failed', ip=client_ip(request), data={'email': email})
         return JsonResponse({'error': 'Invalid username or password'}, status=401)
+    user_id = user.pk
     user = authenticate(username=user.username, password=password)
     if user:
+        audit_log.record('login', user.pk, client_ip(request))
         refresh = RefreshToken.for_user(user)
         response = JsonResponse({'message': 'Login successful'})
         response.set_cookie(
@@ -116,6 +146,7 @@ def login_user(request):
             samesite='Lax',
         )
         return response
+    audit_log.record('login_failed', user_id, client_ip(request), {'email': email})
     return JsonResponse({'error': 'Invalid username or password'}, status=401)
 
 @csrf_protect
@@ -130,38 +161,80 @@ def logout_view(request):
     """
     response = JsonResponse({'message': 'Logged out'})
 
+    user_id = request.user.pk  # None once the access token has expired
     refresh_token = request.COOKIES.get('refresh')
     if refresh_token:
         try:
-            token = RefreshToken(refresh_token)
+            token = RevocableRefreshToken(refresh_token)
+            user_id = token.get(jwt_settings.USER_ID_CLAIM, user_id)
             token.blacklist()  # Blacklist this refresh token
         except Exception as e:
             pass # Token may already be expired or invalid
+    audit_log.record('logout', user_id, client_ip(request))
 
     response.delete_cookie('access')
     response.delete_cookie('refresh')
     return response
 
 @api_view(['GET', 'POST'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
 @permission_classes([IsAuthenticated])
 def todo_list_create(request):
     """
     Handles retrieving and creating to-do items for the authenticated user.
+    The list is keyset-paginated newest first; pass the `next` link (or its
+    `cursor` parameter) back to fetch the following page.
+    Each page carries a strong ETag derived from the user's list version, so a
+    matching `If-None-Match` is answered with 304 without querying the to-dos.
+    Rendered JSON pages are cached per user and list version, next to the
+    version itself; a cache hit skips the queries, the serializer and the renderer. Misses read plain rows and
+    render them with orjson, producing the same bytes as `TodoSerializer`.
     Args:
         request: The HTTP request containing the to-do data.
     Returns:
-        Response: A response with the list of to-dos or the created to-do item.
+        Response: A response with a page of to-dos or the created to-do item.
     """
     if request.method == 'GET':
-        todos = Todo.objects.filter(user=request.user).order_by('-created_at')
-        serializer = TodoSerializer(todos, many=True)
-        return Response(serializer.data)
+        user_id = request.user.pk
+        paginator = TodoKeysetPagination()
+        list_version = todo_list_cache.get_version(user_id)
+        etag = todo_list_etag(user_id, list_version, paginator.get_page_key(request))
+        # Only JSON is cached, the browsable API is always rendered
+        cacheable = request.accepted_renderer.format == 'json'
+        page_url = request.build_absolute_uri()
+
+        if if_none_match(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            content = todo_list_cache.get_page(user_id, list_version, page_url) if cacheable else None
+            if content is not None:
+                response = HttpResponse(content, content_type=request.accepted_renderer.media_type)
+            else:
+                # The version of the database the rows come from, see TodoListCache
+                list_version = todo_list_cache.load_version(user_id, list_version)
+                etag = todo_list_etag(user_id, list_version, paginator.get_page_key(request))
+                # Plain rows instead of model instances, same JSON as TodoSerializer
+                rows = Todo.objects.for_user(user_id).values(*TodoSerializer.Meta.fields)
+                todos = paginator.paginate_queryset(rows, request)
+                with timed('serialization'):
+                    data = serialize_todo_rows(todos)
+                response = paginator.get_paginated_response(data)
+                if cacheable:
+                    response.add_post_render_callback(
+                        lambda rendered: todo_list_cache.set_page(user_id, list_version, page_url, rendered.content)
+                    )
+        response['ETag'] = etag
+        # Let browsers keep the page but always revalidate it
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     elif request.method == 'POST':
         serializer = TodoSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=201)
+            todo, version = create_todo(request.user.pk, **serializer.validated_data)
+            data = TodoSerializer(todo).data
+            todos_changed.send(sender=Todo, user_id=request.user.pk, action='create', version=version, data={'todo': data})
+            return Response(data, status=201)
         return Response(serializer.errors, status=400)
 
 @api_view(['PATCH'])
@@ -169,33 +242,287 @@ def todo_list_create(request):
 def toggle_todo(request, todo_id):
     """
     Toggles the completion status of a to-do item.
+    The row is flipped and its version bumped in a single conditional UPDATE.
+    Clients may send the ETag of the version they last saw in `If-Match`; if the
+    item has changed since, nothing is written and 412 is returned.
     Args:
         request: The HTTP request containing the toggle request.
         todo_id: The ID of the to-do item to be toggled.
     Returns:
         Response: A response with the updated to-do item or an error message.
     """
-    try:
-        todo = Todo.objects.get(id=todo_id, user=request.user)
-    except Todo.DoesNotExist:
+    todos = Todo.objects.for_user(request.user.pk).filter(id=todo_id)
+    expected_versions = parse_if_match(request)
+    if expected_versions is not None:
+        updated, version = toggle_todos(todos.filter(version__in=expected_versions), request.user.pk)
+    else:
+        updated, version = toggle_todos(todos, request.user.pk)
+
+    if not updated:
+        if expected_versions is not None and todos.exists():
+            return Response({'error': 'Todo has been modified'}, status=412)
         return Response({'error': 'Todo not found'}, status=404)
 
-    todo.completed = not todo.completed
-    todo.save()
-    return Response(TodoSerializer(todo).data)
+    todo = updated[0]
+    data = TodoSerializer(todo).data
+    todos_changed.send(sender=Todo, user_id=request.user.pk, action='toggle', version=version, data={'todo': data})
+    response = Response(data)
+    response['ETag'] = todo_etag(todo)
+    return response
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def clear_completed(request):
     """
-    Deletes all completed to-do items for the authenticated user.
+    Deletes all completed to-do items for the authenticated user, leaving
+    tombstones for the change feed.
+    Rows are deleted in short batched transactions. Past
+    `TODO_CLEAR_DEFER_THRESHOLD` items they are only hidden, and 202 is
+    returned; the `purge_deleted_todos` command deletes them later.
     Args:
         request: The HTTP request containing the delete request.
     Returns:
         Response: A response indicating the number of deleted to-do items.
     """
-    deleted, _ = Todo.objects.filter(user=request.user, completed=True).delete()
-    return Response({'deleted': deleted}, status=204)
+    deleted, deferred = clear_completed_todos(request.user.pk)
+    return Response({'deleted': deleted}, status=202 if deferred else 204)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def todo_batch(request):
+    """
+    Applies a list of create / update / toggle / delete operations in one request.
+    The whole batch is validated first and then applied in a single transaction.
+    Args:
+        request: The HTTP request containing `{"operations": [...]}`.
+    Returns:
+        Response: A response with one result per operation, in request order.
+    """
+    serializer = TodoBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    try:
+        results = apply_todo_batch(request.user, serializer.validated_data['operations'])
+    except BatchConflict:
+        return Response({'error': 'Todos changed during the batch, retry it'}, status=409)
+    return Response({'results': results})
+
+def todo_search_rows(user_id, params):
+    """
+    Builds the rows and the paginator of a to-do search, shared with the async view.
+    With `q`, matches come from the full-text index, most recently added first;
+    without it the filters apply to the list in its usual `created_at` order.
+    Args:
+        user_id: Owner of the to-dos.
+        params: Validated `TodoSearchSerializer` data.
+    Returns:
+        tuple: A `values()` queryset of the matching to-dos and its paginator.
+    """
+    terms = search_terms(params.get('q', ''))
+    if terms:
+        vendor = connections[router.db_for_read(Todo, user_id=user_id)].vendor
+        todos, key = search_todos(user_id, terms, vendor)
+        paginator = TodoSearchPagination(key)
+    else:
+        todos = Todo.objects.for_user(user_id)
+        paginator = TodoKeysetPagination()
+    if 'completed' in params:
+        todos = todos.filter(completed=params['completed'])
+    if 'created_after' in params:
+        todos = todos.filter(created_at__gte=params['created_after'])
+    if 'created_before' in params:
+        todos = todos.filter(created_at__lt=params['created_before'])
+    return todos.values(*TodoSerializer.Meta.fields), paginator
+
+@api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@permission_classes([IsAuthenticated])
+def todo_search(request):
+    """
+    Searches the to-do items of the authenticated user.
+    `q` matches words of the text by prefix through the full-text index (FTS5
+    on SQLite, a GIN tsvector index on PostgreSQL); `completed`,
+    `created_after` and `created_before` filter the results. Pages are
+    keyset-paginated like the list and carry an ETag of the list version.
+    Args:
+        request: The HTTP request containing the search parameters.
+    Returns:
+        Response: A page of matching to-dos, or the parameter errors.
+    """
+    serializer = TodoSearchSerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    user_id = request.user.pk
+    list_version = todo_list_cache.get_version(user_id)
+    etag = todo_list_etag(user_id, list_version, 'search?' + request.GET.urlencode())
+
+    if if_none_match(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        rows, paginator = todo_search_rows(user_id, serializer.validated_data)
+        todos = paginator.paginate_queryset(rows, request)
+        with timed('serialization'):
+            data = serialize_todo_rows(todos)
+        response = paginator.get_paginated_response(data)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@api_view(['GET'])
+@renderer_classes([FastJSONRenderer, BrowsableAPIRenderer])
+@permission_classes([IsAuthenticated])
+def todo_changes(request):
+    """
+    Returns what changed in the authenticated user's to-dos since a point of
+    the change sequence, for clients that keep a local copy.
+    `since` is the `seq` of the previous response (0, the default, for a full
+    sync). Upserts carry the to-do, deletions its id; while `has_more` is true,
+    ask again with the new `seq`. When the deletions after `since` were
+    compacted away, 410 tells the client to sync again from 0.
+    Args:
+        request: The HTTP request containing `since` and `limit`.
+    Returns:
+        Response: The changes and the next `seq`, the parameter errors, or 410.
+    """
+    serializer = TodoChangesSerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    try:
+        data = changes_since(request.user.pk, **serializer.validated_data)
+    except ResyncRequired:
+        return Response({'error': 'Changes since this seq are no longer available, sync again from 0'}, status=410)
+    response = Response(data)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+def export_file_format(request):
+    """Returns the export format requested with `?type=` (`ndjson` by default), or None if unknown."""
+    file_format = request.GET.get('type', 'ndjson')
+    return file_format if file_format in FORMATS else None
+
+def export_response(streaming_content, file_format, name='todos'):
+    response = StreamingHttpResponse(streaming_content, content_type=FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{file_format}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_todos(request):
+    """
+    Streams all to-do items of the authenticated user, oldest first, as NDJSON
+    (`?type=ndjson`, the default) or CSV (`?type=csv`).
+    Rows are read with a chunked iterator and written out chunk by chunk, so
+    memory use stays flat however many to-dos the user has.
+    Args:
+        request: The HTTP request containing the export request.
+    Returns:
+        StreamingHttpResponse: The export file, or a 400 response for an unknown type.
+    """
+    file_format = export_file_format(request)
+    if file_format is None:
+        return Response({'error': f'type must be one of {", ".join(FORMATS)}'}, status=400)
+    return export_response(iter_export(request.user, file_format), file_format)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_todos(request):
+    """
+    Imports to-do items from an NDJSON or CSV file, as exported by `export_todos`.
+    The file is sent either as the raw request body (`Content-Type:
+    application/x-ndjson` or `text/csv`) or as the `file` field of a multipart
+    form. It is parsed line by line and inserted in `bulk_create` batches, each
+    in its own transaction; invalid rows are skipped and reported.
+    Args:
+        request: The HTTP request containing the file.
+    Returns:
+        Response: Counts of imported and skipped rows, with the first errors.
+    """
+    lines, file_format = read_upload(request)
+    if lines is None:
+        return Response({'error': 'Missing file'}, status=400)
+    if file_format not in PARSERS:
+        return Response({'error': f'type must be one of {", ".join(PARSERS)}'}, status=400)
+
+    importer = TodoImporter(request.user, max_rows=settings.TODO_IMPORT_MAX_ROWS)
+    return Response(importer.run(PARSERS[file_format](lines)))
+
+def read_upload(request):
+    """
+    Finds the file of an NDJSON or CSV upload: the raw request body
+    (`Content-Type: application/x-ndjson` or `text/csv`) or the `file` field of
+    a multipart form. The `type` query parameter overrides the format.
+    Args:
+        request: The DRF request.
+    Returns:
+        tuple: The lines to parse (None without a file) and the format name.
+    """
+    django_request = request._request
+    if request.content_type.startswith('multipart/form-data'):
+        upload = django_request.FILES.get('file')
+        if upload is None:
+            return None, None
+        lines = upload
+        file_format = 'csv' if upload.name.lower().endswith('.csv') else 'ndjson'
+    else:
+        # Read the body as a stream, never as a whole
+        lines = django_request
+        file_format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+    return lines, request.GET.get('type', file_format)
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def provision_users(request):
+    """
+    Creates users in bulk from an NDJSON or CSV file (admin only), uploaded
+    like the file of `import_todos`. Each record has a `username`, an optional
+    `email` and either a `password`, checked by the password validators, or a
+    `password_hash`. Duplicates are checked in bulk, passwords are hashed in
+    the hashing process pool and users are inserted in batches; rejected
+    records are skipped and reported. Every password is hashed while the
+    request waits, so an upload may hold at most `USER_IMPORT_MAX_ROWS`
+    records; a larger file is refused as a whole, before anything is hashed,
+    and belongs to `manage.py provision_users`.
+    Args:
+        request: The HTTP request containing the file.
+    Returns:
+        Response: Counts of created and skipped users, with the first errors,
+        or 413 when the file holds too many records.
+    """
+    lines, file_format = read_upload(request)
+    if lines is None:
+        return Response({'error': 'Missing file'}, status=400)
+    if file_format not in USER_PARSERS:
+        return Response({'error': f'type must be one of {", ".join(USER_PARSERS)}'}, status=400)
+
+    max_rows = settings.USER_IMPORT_MAX_ROWS
+    records = list(islice(USER_PARSERS[file_format](lines), max_rows + 1))
+    if len(records) > max_rows:
+        return Response(
+            {'error': f'Uploads hold at most {max_rows} users, import larger files with manage.py provision_users'},
+            status=413,
+        )
+    return Response(UserProvisioner().run(records))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_audit_log(request):
+    """
+    Streams the audit trail (admin only), oldest entry first, as NDJSON
+    (`?type=ndjson`, the default) or CSV (`?type=csv`). `user`, `action`,
+    `since` and `until` narrow it down. Entries reach the database in batches,
+    up to `AUDIT_LOG_FLUSH_SECONDS` after the event.
+    Args:
+        request: The HTTP request containing the filters.
+    Returns:
+        StreamingHttpResponse: The entries, or the parameter errors.
+    """
+    serializer = AuditLogQuerySerializer(data=request.GET.dict())
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    params = dict(serializer.validated_data)
+    file_format = params.pop('type')
+    return export_response(iter_audit_export(audit_events(**params), file_format), file_format, name='audit')
 
 # Custom Token Refresh View to handle refresh token from cookies
 class CustomTokenRefreshView(TokenRefreshView):
@@ -216,6 +543,8 @@ class CustomTokenRefreshView(TokenRefreshView):
                 - If the refresh token is invalid or expired, a 401 Unauthorized response is returned.
                 - On success, a new access token is set in the cookies, and if token rotation is enabled,
                   a new refresh token is also set in the cookies.
+                - Concurrent refreshes of the same token (several tabs) get the same new tokens for
+                  `TOKEN_REFRESH_GRACE_SECONDS`, see `auth_app.token_refresh`.
                 - The `secure` attribute for cookies should be set to True in production for security.
     """
     def post(self, request, *args, **kwargs):
@@ -223,14 +552,27 @@ class CustomTokenRefreshView(TokenRefreshView):
         if refresh_token is None:
             return Response({'error': 'Refresh token not found in cookies'}, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = self.get_serializer(data={'refresh': refresh_token})
+        def rotate():
+            serializer = self.get_serializer(data={'refresh': refresh_token})
+            try:
+                serializer.is_valid(raise_exception=True)
+            except TokenError as e:
+                # Expired or blacklisted token, as in TokenViewBase
+                raise InvalidToken(e.args[0])
+            return serializer.validated_data
+
         try:
-            serializer.is_valid(raise_exception=True)
+            # Tabs refreshing the same token at once share one rotation
+            tokens = refresh_coalescer.refresh(refresh_token, rotate)
         except InvalidToken as e:
+            audit_log.record('refresh_failed', ip=client_ip(request))
             return Response({'error': 'Invalid or expired refresh token'}, status=status.HTTP_401_UNAUTHORIZED)
+        # The signature was checked by the rotation
+        user_id = token_backend.decode(refresh_token, verify=False).get(jwt_settings.USER_ID_CLAIM)
+        audit_log.record('refresh', user_id, client_ip(request))
 
-        access_token = serializer.validated_data['access']
-        new_refresh_token = serializer.validated_data.get("refresh")  # Only present if rotation is on
+        access_token = tokens['access']
+        new_refresh_token = tokens.get("refresh")  # Only present if rotation is on
         response = Response({'message': 'Access token refreshed'})
 
         # Set new access token
@@ -0,0 +1,125 @@
+"""
+Compares the default settings with the API-only profile (`API_ONLY`, see
+`app.settings`): worker cold start and per-request overhead.
+
+Each profile runs in fresh processes, since the settings decide the apps and
+the middleware at startup. Cold start is the time from `django.setup()` to the
+first response (apps, URLconf, middleware chain, views), taken as the median
+of `--starts` processes, along with the number of modules imported by then.
+Requests then go straight through the WSGI handler, without a network server
+or the test client: `/auth/csrf/` shows the fixed cost of the middleware chain
+around a trivial view, `/auth/todos/` a typical authenticated read.
+
+Usage (from the backend folder):
+    python -m benchmarks.api_profile --requests 5000 --starts 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import setup_django, summarize
+
+PROFILES = {'default': 'False', 'api_only': 'True'}
+
+
+def seed(todos):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+    from auth_app.models import Todo
+
+    user = User.objects.create_user('profile', 'profile@example.com')
+    Todo.objects.bulk_create(Todo(user=user, text=f'todo {n}') for n in range(todos))
+    return str(AccessToken.for_user(user))
+
+
+def time_requests(handler, path, cookie, requests):
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+    statuses = []
+
+    def start_response(status, headers):
+        statuses.append(status)
+
+    samples = []
+    for _ in range(requests):
+        environ = factory.get(path, HTTP_COOKIE=cookie).environ
+        began = time.perf_counter()
+        response = handler(environ, start_response)
+        b''.join(response)
+        response.close()
+        samples.append(time.perf_counter() - began)
+    assert all(status.startswith('200') for status in statuses), set(statuses)
+    return summarize(samples)
+
+
+def child(args):
+    began = time.perf_counter()
+    setup_django(args.db, migrate=False, API_ONLY=PROFILES[args.profile], RATELIMIT_ENABLE='False')
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    from django.test import RequestFactory
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    handler = get_wsgi_application()
+    environ = RequestFactory().get('/auth/csrf/').environ
+    handler(environ, lambda status, headers: None).close()
+    result = {
+        'profile': args.profile,
+        'startup_s': time.perf_counter() - began,
+        'modules': len(sys.modules),
+        'apps': len(settings.INSTALLED_APPS),
+        'middleware': len(settings.MIDDLEWARE),
+    }
+    if args.requests:
+        cookie = f'access={args.token}'
+        result['csrf'] = time_requests(handler, '/auth/csrf/', '', args.requests)
+        result['todos'] = time_requests(handler, '/auth/todos/', cookie, args.requests)
+    return result
+
+
+def run_child(profile, args, token, requests):
+    command = [
+        sys.executable, '-m', 'benchmarks.api_profile', '--profile', profile, '--db', args.db,
+        '--token', token, '--requests', str(requests),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--starts', type=int, default=5, help='processes started to time the cold start')
+    parser.add_argument('--todos', type=int, default=20, help='todos of the benchmark user')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--profile', choices=list(PROFILES), help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--token', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(child(args)))
+        return
+
+    args.db = setup_django()
+    token = seed(args.todos)
+    results = []
+    for profile in PROFILES:
+        starts = [run_child(profile, args, token, 0) for _ in range(args.starts)]
+        result = run_child(profile, args, token, args.requests)
+        result['startup_s'] = statistics.median(start['startup_s'] for start in starts)
+        results.append(result)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(args.db)
+
+
+if __name__ == '__main__':
+    main()
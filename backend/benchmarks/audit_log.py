@@ -0,0 +1,103 @@
+"""
+Measures what the audit trail (`auth_app.audit`) costs the requests it records.
+
+Three modes run the same to-do toggles through the full stack: without an
+audit log, with one audit insert per event in the request (what a
+synchronous audit trail would do), and with the write-behind log, which only
+queues the event. Each reports the request latency and the database
+statements per request; the write-behind run also reports how long the
+writer took to catch up and how many inserts it needed.
+
+Usage (from the backend folder):
+    python -m benchmarks.audit_log --requests 2000 --batch-size 500
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def run(mode, requests, batch_size):
+    from django.db import connection
+    from django.test import Client
+    from rest_framework_simplejwt.tokens import AccessToken
+    from django.contrib.auth.models import User
+    from auth_app import audit
+    from auth_app.models import AuditEvent, Todo
+
+    class CountingAuditLog(audit.AuditLog):
+        inserts = 0
+
+        def write(self, batch):
+            self.inserts += 1
+            super().write(batch)
+
+    log = {
+        'none': CountingAuditLog(enabled=False),
+        # Each event written by its request, in the request
+        'sync': CountingAuditLog(background=False, batch_size=1),
+        'write_behind': CountingAuditLog(batch_size=batch_size),
+    }[mode]
+    # The signal receiver looks the log up in the module at call time
+    audit.audit_log = log
+    from auth_app import signals
+    signals.audit_log = log
+
+    user = User.objects.create_user(f'audit-{mode}')
+    todo = Todo.objects.create(user=user, text='audited')
+    client = Client()
+    client.cookies['access'] = str(AccessToken.for_user(user))
+    AuditEvent.objects.all().delete()
+
+    samples = []
+    statements = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal statements
+        statements += 1
+        return execute(sql, params, many, context)
+
+    # Counts the statements of the request thread only, not of the audit writer thread
+    with connection.execute_wrapper(count):
+        for _ in range(requests):
+            began = time.perf_counter()
+            response = client.patch(f'/auth/todos/{todo.pk}/toggle/')
+            samples.append(time.perf_counter() - began)
+            assert response.status_code == 200, response.status_code
+    result = {
+        'mode': mode,
+        'latency': summarize(samples),
+        'queries_per_request': statements / requests,
+    }
+    if mode == 'write_behind':
+        began = time.perf_counter()
+        log.close()
+        result['catch_up_s'] = time.perf_counter() - began
+    result['audit_inserts'] = log.inserts
+    result['audit_rows'] = AuditEvent.objects.count()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django(RATELIMIT_ENABLE='False')
+    from django.conf import settings
+
+    settings.ALLOWED_HOSTS = ['testserver']
+    results = [run(mode, args.requests, args.batch_size) for mode in ('none', 'sync', 'write_behind')]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Measures clearing a large number of completed to-dos, and what it costs the
+other writers of the database meanwhile.
+
+Seeds `--completed` completed and `--open` open to-dos for one user, then clears
+the completed ones in three ways, re-seeding in between:
+
+- single: one `QuerySet.delete()` in one transaction (the former behaviour)
+- batched: `delete_completed_todos`, bounded DELETE ... RETURNING batches
+  with their tombstones, one short transaction each
+- deferred: `defer_clear_completed` (what the request waits for), then
+  `purge_deleted_todos` in the background
+
+While each clear runs, a second thread keeps creating to-dos for another user
+and records how long each insert takes: with SQLite's single writer lock, a long
+transaction shows up as a long stall of that thread.
+
+Usage (from the backend folder):
+    python -m benchmarks.clear_completed --completed 200000 --open 50000
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def seed(user, completed, open_count):
+    from django.db import transaction
+    from auth_app.models import Todo
+
+    batch = 10000
+    total = completed + open_count
+    for start in range(0, total, batch):
+        with transaction.atomic():
+            Todo.objects.bulk_create(
+                Todo(user=user, text=f'item {n}', completed=n % total < completed)
+                for n in range(start, min(total, start + batch))
+            )
+
+
+class Writer(threading.Thread):
+    """Creates to-dos for another user in a loop, timing every insert."""
+    def __init__(self, user):
+        super().__init__(daemon=True)
+        self.user = user
+        self.samples = []
+        self.stopping = threading.Event()
+
+    def run(self):
+        from django.db import connection
+        from auth_app.changes import create_todo
+
+        try:
+            while not self.stopping.is_set():
+                began = time.perf_counter()
+                create_todo(self.user.pk, text='concurrent')
+                self.samples.append(time.perf_counter() - began)
+                time.sleep(0.001)
+        finally:
+            connection.close()
+
+
+def run(mode, owner, other, args):
+    from auth_app.models import Todo
+    from auth_app.purge import defer_clear_completed, delete_completed_todos, purge_deleted_todos
+
+    seed(owner, args.completed, args.open)
+    writer = Writer(other)
+    writer.start()
+    time.sleep(0.2)
+    began = time.perf_counter()
+    if mode == 'single':
+        cleared, _ = Todo.objects.filter(user=owner, completed=True).delete()
+    elif mode == 'batched':
+        cleared, _ = delete_completed_todos(owner.pk, args.batch_size)
+    else:
+        cleared, _ = defer_clear_completed(owner.pk)
+    request = time.perf_counter() - began
+    purge = None
+    if mode == 'deferred':
+        began = time.perf_counter()
+        purge_deleted_todos(args.batch_size, pause=args.pause)
+        purge = time.perf_counter() - began
+    time.sleep(0.2)
+    writer.stopping.set()
+    writer.join()
+    Todo._base_manager.filter(user=owner).delete()
+    return {
+        'cleared': cleared,
+        'request_seconds': request,
+        'purge_seconds': purge,
+        'concurrent_insert': {**summarize(writer.samples), 'max_ms': max(writer.samples, default=0) * 1000},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--completed', type=int, default=100000)
+    parser.add_argument('--open', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--pause', type=float, default=0.02, help='seconds between purge batches')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django(DEBUG='False')
+    from django.contrib.auth.models import User
+
+    owner = User.objects.create_user('clearer', 'clearer@example.com')
+    other = User.objects.create_user('writer', 'writer@example.com')
+    results = {'completed': args.completed, 'open': args.open, 'batch_size': args.batch_size, 'modes': {}}
+    for mode in ('single', 'batched', 'deferred'):
+        results['modes'][mode] = run(mode, owner, other, args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
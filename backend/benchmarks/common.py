@@ -0,0 +1,61 @@
+"""
+Shared helpers for the benchmark scripts in this package.
+
+Benchmarks run against a throwaway SQLite database (never `db.sqlite3`) and are
+started from the `backend` folder, e.g. `python -m benchmarks.ratelimit_backend`.
+"""
+import os
+import statistics
+import tempfile
+
+
+def setup_django(db_path=None, migrate=True, database_url=None, **env):
+    """
+    Configures Django for a benchmark run and migrates a scratch database.
+    Args:
+        db_path: SQLite file to use, a new temporary file by default.
+        migrate: Whether to apply migrations (skip it in worker processes).
+        database_url: Use this database instead of SQLite, e.g. a throwaway
+            PostgreSQL database; the data written to it is left in place.
+        **env: Extra environment variables read by `app.settings`.
+    Returns:
+        str: The path of the SQLite database, None with `database_url`.
+    """
+    if database_url is None:
+        if db_path is None:
+            fd, db_path = tempfile.mkstemp(prefix='todo-bench-', suffix='.sqlite3')
+            os.close(fd)
+        database_url = f'sqlite:///{db_path}'
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key')
+    os.environ.setdefault('DEBUG', 'True')
+    os.environ.update(env)
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    if migrate:
+        call_command('migrate', verbosity=0)
+    return db_path
+
+
+def percentile(samples, pct):
+    """Returns the `pct` percentile (0-100) of a list of samples."""
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method='inclusive')[max(0, min(98, round(pct) - 1))]
+
+
+def summarize(samples):
+    """Summarizes latency samples given in seconds, in milliseconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
@@ -0,0 +1,289 @@
+"""
+Load-tests the API endpoints end to end and checks for performance regressions.
+
+Seeds the database with `--users` accounts of `--todos` todos each, then runs
+`--sessions` virtual users, `--concurrency` at a time. Every virtual user walks
+the whole client flow:
+
+    csrf -> register -> login -> refresh -> list -> create -> toggle
+         -> list -> clear_completed -> logout
+
+Registration creates a fresh account; the rest of the flow logs in as one of
+the seeded users, so list pages reflect the seeded scale. The report gives
+throughput, p50/p95/p99 latency and errors per endpoint, plus SQL queries per
+request when running in process.
+
+By default the flow runs in process, through Django's test client, against a
+throwaway SQLite database. With `--url` it drives a running local server over
+HTTP instead; pass its SQLite file with `--db` to seed it, and start the server
+with `RATELIMIT_ENABLE=False` so the limits do not reject the load.
+
+`--baseline` compares the run with a stored result and exits with status 1
+when an endpoint got slower (p95), issues more queries or the overall
+throughput dropped by more than `--threshold`.
+
+Usage (from the backend folder):
+    python -m benchmarks.load_test --users 100 --todos 200 --sessions 200 --concurrency 16 --output baseline.json
+    python -m benchmarks.load_test --baseline baseline.json --threshold 0.2
+    RATELIMIT_ENABLE=False python manage.py runserver --noreload  # in another shell
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --db db.sqlite3
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, summarize
+
+PASSWORD = 'Benchmark1!'
+
+
+def seed(users, todos_per_user):
+    """Creates `users` accounts (`loadseed<i>@example.com`) with `todos_per_user` todos each."""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from auth_app.models import Todo
+
+    User.objects.filter(username__startswith='loadseed').delete()
+    encoded = make_password(PASSWORD)
+    created = User.objects.bulk_create(
+        User(username=f'loadseed{i}', email=f'loadseed{i}@example.com', password=encoded) for i in range(users)
+    )
+    Todo.objects.bulk_create(
+        (Todo(user=user, text=f'todo {n}') for user in created for n in range(todos_per_user)),
+        batch_size=1000,
+    )
+
+
+class QueryCounter:
+    """`connection.execute_wrapper` counting the SQL statements run."""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessSession:
+    """A browser-like session calling the app through Django's test client."""
+    def __init__(self):
+        from django.test import Client
+        self.client = Client(enforce_csrf_checks=True, SERVER_NAME='localhost')
+
+    def csrf_token(self):
+        cookie = self.client.cookies.get('csrftoken')
+        return cookie.value if cookie else ''
+
+    def request(self, method, path, data=None):
+        """Returns `(status, body, seconds, queries)`."""
+        from django.db import connection
+
+        counter = QueryCounter()
+        body = json.dumps(data) if data is not None else ''
+        began = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.client.generic(
+                method, path, body, content_type='application/json',
+                headers={'X-CSRFToken': self.csrf_token()},
+            )
+        return response.status_code, response.content, time.perf_counter() - began, counter.count
+
+    def close(self):
+        from django.db import connection
+        connection.close()
+
+
+class HttpSession:
+    """A browser-like session calling a running server over HTTP."""
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method, path, data=None):
+        """Returns `(status, body, seconds, None)`; queries are not visible over HTTP."""
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(data).encode() if data is not None else None,
+            method=method,
+            headers={'Content-Type': 'application/json', 'X-CSRFToken': self.csrf_token()},
+        )
+        began = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            status, body = exc.code, exc.read()
+        return status, body, time.perf_counter() - began, None
+
+    def close(self):
+        pass
+
+
+def run_session(session, index, args, run_id):
+    """Walks the client flow once. Returns a list of `(endpoint, status, seconds, queries)`."""
+    samples = []
+    try:
+        walk_flow(session, index, args, run_id, samples)
+    finally:
+        session.close()
+    return samples
+
+
+def walk_flow(session, index, args, run_id, samples):
+    def call(endpoint, method, path, data=None):
+        status, body, seconds, queries = session.request(method, path, data)
+        samples.append((endpoint, status, seconds, queries))
+        return status, body
+
+    seeded = index % args.users
+    call('csrf', 'GET', '/auth/csrf/')
+    call('register', 'POST', '/auth/register/', {
+        'username': f'load-{run_id}-{index}',
+        'email': f'load-{run_id}-{index}@example.com',
+        'password': PASSWORD,
+    })
+    status, _ = call('login', 'POST', '/auth/login/', {'email': f'loadseed{seeded}@example.com', 'password': PASSWORD})
+    if status != 200:
+        return
+    call('refresh', 'POST', '/auth/refresh/')
+    call('todos_list', 'GET', '/auth/todos/')
+    created = []
+    for n in range(args.creates):
+        status, body = call('todos_create', 'POST', '/auth/todos/', {'text': f'load test {n}'})
+        if status == 201:
+            created.append(json.loads(body)['id'])
+    for todo_id in created:
+        call('todos_toggle', 'PATCH', f'/auth/todos/{todo_id}/toggle/')
+    call('todos_list', 'GET', '/auth/todos/')
+    call('todos_clear_completed', 'DELETE', '/auth/todos/clear_completed/')
+    call('logout', 'POST', '/auth/logout/')
+
+
+def report(samples, elapsed, args):
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+
+    endpoints = {}
+    for endpoint, rows in by_endpoint.items():
+        queries = [row[3] for row in rows if row[3] is not None]
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[1] >= 400),
+            'throughput_per_s': len(rows) / elapsed,
+            'latency': summarize([row[2] for row in rows]),
+            'queries_per_request': sum(queries) / len(queries) if queries else None,
+        }
+    return {
+        'config': {
+            'target': args.url or 'in-process',
+            'users': args.users,
+            'todos_per_user': args.todos,
+            'sessions': args.sessions,
+            'concurrency': args.concurrency,
+            'creates': args.creates,
+        },
+        'overall': {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[1] >= 400),
+            'throughput_per_s': len(samples) / elapsed,
+            'latency': summarize([sample[2] for sample in samples]),
+        },
+        'endpoints': endpoints,
+    }
+
+
+def find_regressions(result, baseline, threshold, tolerance_ms):
+    """
+    Compares a run with a baseline run.
+    Args:
+        threshold: Allowed relative slowdown, e.g. 0.2 for 20%.
+        tolerance_ms: Latency changes below this many milliseconds are noise.
+    Returns:
+        list: Human readable descriptions of the regressions found.
+    """
+    regressions = []
+    base_throughput = baseline['overall']['throughput_per_s']
+    if result['overall']['throughput_per_s'] < base_throughput * (1 - threshold):
+        regressions.append(
+            f"overall throughput {result['overall']['throughput_per_s']:.1f}/s < baseline {base_throughput:.1f}/s"
+        )
+    for endpoint, current in result['endpoints'].items():
+        base = baseline['endpoints'].get(endpoint)
+        if base is None:
+            continue
+        p95, base_p95 = current['latency']['p95_ms'], base['latency']['p95_ms']
+        if p95 > base_p95 * (1 + threshold) and p95 - base_p95 > tolerance_ms:
+            regressions.append(f'{endpoint}: p95 {p95:.2f} ms > baseline {base_p95:.2f} ms')
+        queries, base_queries = current['queries_per_request'], base['queries_per_request']
+        if queries is not None and base_queries is not None and queries > base_queries * (1 + threshold):
+            regressions.append(f'{endpoint}: {queries:.2f} queries/request > baseline {base_queries:.2f}')
+        if current['errors'] > base['errors']:
+            regressions.append(f"{endpoint}: {current['errors']} errors > baseline {base['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50, help='seeded users')
+    parser.add_argument('--todos', type=int, default=100, help='todos seeded per user')
+    parser.add_argument('--sessions', type=int, default=100, help='virtual users walking the flow')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--creates', type=int, default=5, help='todos created (and toggled) per session')
+    parser.add_argument('--url', help='base URL of a running server, instead of running in process')
+    parser.add_argument('--db', help="SQLite file to seed (the server's database with --url)")
+    parser.add_argument('--no-seed', action='store_true', help='reuse users seeded by a previous run')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative regression (default 0.2)')
+    parser.add_argument('--tolerance-ms', type=float, default=1.0, help='ignore latency changes below this')
+    args = parser.parse_args()
+    if args.url and not args.db and not args.no_seed:
+        parser.error('--url needs --db to seed the server database, or --no-seed')
+
+    db_path = setup_django(args.db, RATELIMIT_ENABLE='False')
+    if not args.no_seed:
+        seed(args.users, args.todos)
+
+    run_id = uuid.uuid4().hex[:8]
+    new_session = (lambda: HttpSession(args.url)) if args.url else InProcessSession
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        runs = list(pool.map(lambda index: run_session(new_session(), index, args, run_id), range(args.sessions)))
+    elapsed = time.perf_counter() - began
+    if args.db is None:
+        os.remove(db_path)
+
+    result = report([sample for samples in runs for sample in samples], elapsed, args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(result, baseline, args.threshold, args.tolerance_ms)
+        if regressions:
+            print('Performance regressions against %s:' % args.baseline, file=sys.stderr)
+            for regression in regressions:
+                print('  ' + regression, file=sys.stderr)
+            sys.exit(1)
+        print('No regressions against %s' % args.baseline, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
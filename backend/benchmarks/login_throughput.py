@@ -0,0 +1,146 @@
+"""
+Compares concurrent login throughput of the sync DRF view with the async view
+that verifies passwords in the hashing process pool.
+
+The sync view is driven from a thread pool, like a threaded WSGI server; the
+async view from a single event loop, like one ASGI worker. For the async run
+the benchmark also samples event loop lag: with hashing offloaded, other
+connections keep being served while logins are in flight.
+
+Usage (from the backend folder):
+    python -m benchmarks.login_throughput --users 50 --logins 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, summarize
+
+PASSWORD = 'Benchmark1!'
+
+
+def seed_users(count):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    encoded = make_password(PASSWORD)
+    User.objects.bulk_create(
+        User(username=f'bench{i}', email=f'bench{i}@example.com', password=encoded) for i in range(count)
+    )
+
+
+def login_request(factory, index, users):
+    body = json.dumps({'email': f'bench{index % users}@example.com', 'password': PASSWORD})
+    request = factory.post('/auth/login/', body, content_type='application/json')
+    request._dont_enforce_csrf_checks = True
+    return request
+
+
+def run_sync(logins, users, concurrency):
+    from django.db import connections
+    from django.test import RequestFactory
+    from auth_app.views import login_user
+
+    factory = RequestFactory()
+
+    def one(index):
+        began = time.perf_counter()
+        response = login_user(login_request(factory, index, users))
+        assert response.status_code == 200, response.status_code
+        connections.close_all()
+        return time.perf_counter() - began
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(one, range(logins)))
+    return samples, time.perf_counter() - began, None
+
+
+async def run_async(logins, users, concurrency):
+    from django.test import AsyncRequestFactory
+    from auth_app.async_views import login_user
+    from auth_app.hashing import hashing_pool
+
+    factory = AsyncRequestFactory()
+    semaphore = asyncio.Semaphore(concurrency)
+    lag = []
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lag.append(max(0.0, time.perf_counter() - expected))
+
+    async def one(index):
+        async with semaphore:
+            began = time.perf_counter()
+            response = await login_user(login_request(factory, index, users))
+            if response.status_code == 503:
+                # Shed by the pool's backpressure
+                return None
+            assert response.status_code == 200, response.status_code
+            return time.perf_counter() - began
+
+    # Start the pool processes outside of the measurement
+    await hashing_pool.make_password('warm-up')
+    monitor_task = asyncio.create_task(monitor())
+    began = time.perf_counter()
+    samples = await asyncio.gather(*(one(index) for index in range(logins)))
+    elapsed = time.perf_counter() - began
+    done.set()
+    await monitor_task
+    return list(samples), elapsed, lag
+
+
+def report(name, samples, elapsed, lag):
+    succeeded = [sample for sample in samples if sample is not None]
+    result = {
+        'view': name,
+        'throughput_per_s': len(succeeded) / elapsed,
+        'rejected': len(samples) - len(succeeded),
+        'latency': summarize(succeeded),
+    }
+    if lag is not None:
+        result['event_loop_lag'] = summarize(lag)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, help='hashing pool processes (PASSWORD_HASHING_WORKERS)')
+    parser.add_argument('--max-pending', type=int, help='hashing pool queue bound, defaults to --concurrency; lower values shed load with 503s')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    env = {}
+    if args.workers:
+        env['PASSWORD_HASHING_WORKERS'] = str(args.workers)
+    env['PASSWORD_HASHING_MAX_PENDING'] = str(args.max_pending or args.concurrency)
+    db_path = setup_django(**env)
+    from django.conf import settings
+    from rest_framework.throttling import SimpleRateThrottle
+    # Measure hashing, not the rate limits
+    settings.RATELIMIT_ENABLE = False
+    SimpleRateThrottle.THROTTLE_RATES = {'user': None, 'anon': None}
+    seed_users(args.users)
+
+    results = [
+        report('sync', *run_sync(args.logins, args.users, args.concurrency)),
+        report('async', *asyncio.run(run_async(args.logins, args.users, args.concurrency))),
+    ]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Compares creating users one registration at a time with bulk provisioning
+(`auth_app.provisioning.UserProvisioner`, as run by `manage.py provision_users`).
+
+The registration run posts every user to the sync `register_user` view, one
+after the other. The provisioning run feeds the same users as NDJSON to the
+provisioner: duplicates checked per batch, passwords hashed across the
+hashing process pool, users inserted with `bulk_create`. Both report users
+per second and database queries per user.
+
+Password hashing dominates both (PBKDF2 with Django's default iterations
+takes a good fraction of a second per password); `--hasher md5` swaps in a
+trivial hasher to show the database side alone.
+
+Usage (from the backend folder):
+    python -m benchmarks.provision_users --users 500 --workers 8
+"""
+import argparse
+import io
+import json
+import os
+import time
+
+from benchmarks.common import setup_django
+
+PASSWORD = 'Benchmark1!'
+
+
+def run_registration(users):
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from auth_app.views import register_user
+
+    factory = RequestFactory()
+    began = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        for index in range(users):
+            body = json.dumps({'username': f'reg{index}', 'email': f'reg{index}@example.com', 'password': PASSWORD})
+            request = factory.post('/auth/register/', body, content_type='application/json')
+            request._dont_enforce_csrf_checks = True
+            response = register_user(request)
+            assert response.status_code == 201, response.status_code
+    elapsed = time.perf_counter() - began
+    return {'mode': 'register_view', 'users_per_s': users / elapsed, 'queries_per_user': len(queries) / users}
+
+
+def run_provisioning(users, workers, batch_size):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from auth_app.hashing import PasswordHashingPool
+    from auth_app.provisioning import PARSERS, UserProvisioner
+
+    body = b''.join(
+        json.dumps({'username': f'bulk{index}', 'email': f'bulk{index}@example.com', 'password': PASSWORD}).encode() + b'\n'
+        for index in range(users)
+    )
+    pool = PasswordHashingPool(max_workers=workers)
+    pool.make_passwords(['warm-up'] * (workers or os.cpu_count() or 1))  # Start the processes outside of the measurement
+    began = time.perf_counter()
+    with CaptureQueriesContext(connection) as queries:
+        result = UserProvisioner(batch_size=batch_size, pool=pool).run(PARSERS['ndjson'](io.BytesIO(body)))
+    elapsed = time.perf_counter() - began
+    pool.shutdown()
+    assert result['created'] == users, result
+    return {
+        'mode': 'provisioning',
+        'workers': pool.max_workers,
+        'users_per_s': users / elapsed,
+        'queries_per_user': len(queries) / users,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--workers', type=int, help='hashing processes (default: CPU count)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--hasher', choices=('default', 'md5'), default='default')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from django.conf import settings
+    from rest_framework.throttling import SimpleRateThrottle
+
+    settings.RATELIMIT_ENABLE = False
+    SimpleRateThrottle.THROTTLE_RATES = {'user': None, 'anon': None}
+    if args.hasher == 'md5':
+        # Inherited by forked hashing processes
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+    results = [
+        run_registration(args.users),
+        run_provisioning(args.users, args.workers, args.batch_size),
+    ]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmarks the shared rate limiting counter under multi-process load.
+
+Every worker process hammers the same fixed-window counter, the way gunicorn
+workers share one client's login limit. The run reports the per-hit overhead
+and checks the final count: with a shared backend it equals the total number
+of hits, with locmem each process only sees its own share.
+
+Usage (from the backend folder):
+    python -m benchmarks.ratelimit_backend --processes 4 --hits 1000
+    python -m benchmarks.ratelimit_backend --cache django.core.cache.backends.locmem.LocMemCache
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from benchmarks.common import setup_django, summarize
+
+KEY = 'benchmark:login:127.0.0.1'
+
+
+def worker(db_path, cache_backend, hits, start, queue):
+    setup_django(db_path, migrate=False, RATELIMIT_CACHE_BACKEND=cache_backend)
+    from django.core.cache import caches
+    from auth_app.throttling import hit_counter
+
+    cache = caches['ratelimit']
+    # Start all processes together so that they actually contend
+    while time.time() < start:
+        time.sleep(0.001)
+    samples = []
+    count = 0
+    for _ in range(hits):
+        began = time.perf_counter()
+        count = hit_counter(cache, KEY, 300)
+        samples.append(time.perf_counter() - began)
+    queue.put((samples, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--hits', type=int, default=1000, help='hits per process')
+    parser.add_argument('--cache', default='auth_app.cache_backends.DatabaseCounterCache', help='cache backend to benchmark')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django(RATELIMIT_CACHE_BACKEND=args.cache)
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    start = time.time() + 2
+    processes = [
+        context.Process(target=worker, args=(db_path, args.cache, args.hits, start, queue))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    elapsed = time.time() - start
+    for process in processes:
+        process.join()
+
+    samples = [sample for worker_samples, _ in results for sample in worker_samples]
+    total = args.processes * args.hits
+    report = {
+        'cache': args.cache,
+        'processes': args.processes,
+        'hits': total,
+        'throughput_per_s': total / elapsed,
+        'latency': summarize(samples),
+        'final_count': max(count for _, count in results),
+        'lost_or_unshared_hits': total - max(count for _, count in results),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
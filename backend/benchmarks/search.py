@@ -0,0 +1,127 @@
+"""
+Compares indexed full-text search of to-dos with `icontains` scans.
+
+Seeds `--rows` to-dos spread over `--users` users, with words drawn from a
+Zipf-like vocabulary so that some words are in most to-dos and others in a
+handful. Then the first page of a range of searches (common word, rare word,
+two-letter prefix, two words, no match, word plus `completed` filter) is read
+for one user in two ways:
+
+- index: `todo_search_rows`, as served by `/auth/todos/search/` (FTS5 on SQLite)
+- icontains: `text__icontains` per word on the to-do list, the scan it replaces
+
+Usage (from the backend folder):
+    python -m benchmarks.search --rows 1000000 --users 10 --repeat 50
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+
+from benchmarks.common import setup_django, summarize
+
+VOCABULARY = 20000
+
+
+def seed(rows, users, seed_value=1):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from auth_app.models import Todo
+
+    rng = random.Random(seed_value)
+    words = [f'w{rank}' for rank in range(VOCABULARY)]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    owners = User.objects.bulk_create(User(username=f'searcher{i}', email=f'searcher{i}@example.com') for i in range(users))
+    batch = 10000
+    for start in range(0, rows, batch):
+        with transaction.atomic():
+            Todo.objects.bulk_create(
+                Todo(
+                    user=owners[n % users],
+                    text=' '.join(rng.choices(words, cum_weights=cum_weights, k=4)),
+                    completed=n % 3 == 0,
+                )
+                for n in range(start, min(rows, start + batch))
+            )
+    return owners[0]
+
+
+def index_page(user, params, request):
+    from auth_app.views import todo_search_rows
+
+    rows, paginator = todo_search_rows(user.pk, params)
+    return list(paginator.get_page_queryset(rows, request))
+
+
+def icontains_page(user, params, request):
+    from auth_app.models import Todo
+    from auth_app.pagination import TodoKeysetPagination
+    from auth_app.serializers import TodoSerializer
+
+    todos = Todo.objects.filter(user=user)
+    for word in params['q'].split():
+        todos = todos.filter(text__icontains=word)
+    if 'completed' in params:
+        todos = todos.filter(completed=params['completed'])
+    rows = todos.values(*TodoSerializer.Meta.fields)
+    return list(TodoKeysetPagination().get_page_queryset(rows, request))
+
+
+def measure(page, user, params, request, repeat):
+    samples = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        results = page(user, params, request)
+        samples.append(time.perf_counter() - began)
+    return {'results': len(results), **summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django(DEBUG='False')
+    from django.test import RequestFactory
+    from auth_app.views import todo_search_rows
+
+    began = time.perf_counter()
+    user = seed(args.rows, args.users)
+    seeded = time.perf_counter() - began
+
+    searches = {
+        'common_word': {'q': 'w0'},
+        'rare_word': {'q': 'w500'},
+        'prefix': {'q': 'w1'},
+        'two_words': {'q': 'w0 w25'},
+        'no_match': {'q': 'nothing'},
+        'word_and_completed': {'q': 'w3', 'completed': True},
+    }
+    rows, paginator = todo_search_rows(user.pk, searches['two_words'])
+    request = RequestFactory().get('/auth/todos/search/')
+    results = {
+        'rows': args.rows,
+        'users': args.users,
+        'seed_seconds': seeded,
+        'plan': paginator.get_page_queryset(rows, request).explain(),
+        'searches': {},
+    }
+    for name, params in searches.items():
+        results['searches'][name] = {
+            'index': measure(index_page, user, params, request, args.repeat),
+            'icontains': measure(icontains_page, user, params, request, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
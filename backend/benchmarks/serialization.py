@@ -0,0 +1,112 @@
+"""
+Compares the two ways of building a to-do list page body.
+
+- serializer: model instances -> `TodoSerializer(many=True)` -> `JSONRenderer`
+- rows: `values()` dicts -> `serialize_todo_rows` -> `FastJSONRenderer`
+
+Both read the same page from the database and must produce identical bytes;
+the benchmark checks that before timing. Query, serialization and rendering
+are timed separately.
+
+Usage (from the backend folder):
+    python -m benchmarks.serialization --rows 200 --repeat 200
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def seed(rows):
+    from django.contrib.auth.models import User
+    from auth_app.models import Todo
+
+    user = User.objects.create(username='bench', email='bench@example.com')
+    Todo.objects.bulk_create(
+        Todo(user=user, text=f'benchmark todo number {n} ✓', completed=n % 3 == 0) for n in range(rows)
+    )
+    return user
+
+
+def serializer_path(user, rows):
+    from rest_framework.renderers import JSONRenderer
+    from auth_app.models import Todo
+    from auth_app.serializers import TodoSerializer
+
+    began = time.perf_counter()
+    todos = list(Todo.objects.filter(user=user).order_by('-created_at', '-id')[:rows])
+    fetched = time.perf_counter()
+    data = TodoSerializer(todos, many=True).data
+    serialized = time.perf_counter()
+    body = JSONRenderer().render({'next': None, 'results': data})
+    rendered = time.perf_counter()
+    return body, (fetched - began, serialized - fetched, rendered - serialized)
+
+
+def rows_path(user, rows):
+    from auth_app.models import Todo
+    from auth_app.renderers import FastJSONRenderer
+    from auth_app.serializers import TodoSerializer, serialize_todo_rows
+
+    began = time.perf_counter()
+    todos = list(
+        Todo.objects.filter(user=user).order_by('-created_at', '-id').values(*TodoSerializer.Meta.fields)[:rows]
+    )
+    fetched = time.perf_counter()
+    data = serialize_todo_rows(todos)
+    serialized = time.perf_counter()
+    body = FastJSONRenderer().render({'next': None, 'results': data})
+    rendered = time.perf_counter()
+    return body, (fetched - began, serialized - fetched, rendered - serialized)
+
+
+def measure(path, user, rows, repeat):
+    phases = ([], [], [])
+    totals = []
+    for _ in range(repeat):
+        _, timings = path(user, rows)
+        for samples, seconds in zip(phases, timings):
+            samples.append(seconds)
+        totals.append(sum(timings))
+    return {
+        'total': summarize(totals),
+        'query': summarize(phases[0]),
+        'serialize': summarize(phases[1]),
+        'render': summarize(phases[2]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200, help='todos per page')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from auth_app.renderers import orjson
+    user = seed(args.rows)
+
+    expected, _ = serializer_path(user, args.rows)
+    actual, _ = rows_path(user, args.rows)
+    if expected != actual:
+        raise SystemExit('The two paths render different bytes')
+
+    results = {
+        'rows': args.rows,
+        'orjson': orjson is not None,
+        'serializer': measure(serializer_path, user, args.rows, args.repeat),
+        'rows_path': measure(rows_path, user, args.rows, args.repeat),
+    }
+    results['speedup'] = results['serializer']['total']['mean_ms'] / results['rows_path']['total']['mean_ms']
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Measures the refresh token blacklist at millions of rows: the blacklist query
+every refresh runs, the in-process revocation filter that replaces it
+(`auth_app.revocation`), refresh latency with and without the filter, and the
+batched compaction of expired tokens.
+
+The tables are seeded with `--tokens` outstanding tokens, all blacklisted (as
+rotation does), of which `--expired` (a fraction) have expired. Lookups use a
+mix of blacklisted and unknown token ids.
+
+Usage (from the backend folder):
+    python -m benchmarks.token_blacklist --tokens 5000000 --refreshes 500
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from benchmarks.common import setup_django, summarize
+
+SEED_BATCH = 50000
+
+
+def seed(count, expired_fraction, user_id):
+    from django.db import connection, transaction
+    from rest_framework_simplejwt.utils import aware_utcnow
+
+    now = aware_utcnow()
+    past, future = now - timedelta(days=1), now + timedelta(days=1)
+    expired = int(count * expired_fraction)
+    jtis = []
+    with connection.cursor() as cursor:
+        for start in range(0, count, SEED_BATCH):
+            size = min(SEED_BATCH, count - start)
+            batch = [uuid.uuid4().hex for _ in range(size)]
+            jtis.extend(batch)
+            with transaction.atomic():
+                # Expired tokens first, as they would be in issue order
+                cursor.executemany(
+                    'INSERT INTO token_blacklist_outstandingtoken (user_id, jti, token, created_at, expires_at) '
+                    'VALUES (%s, %s, %s, %s, %s)',
+                    [(user_id, jti, '-', now, past if start + n < expired else future) for n, jti in enumerate(batch)],
+                )
+                cursor.execute(
+                    'INSERT INTO token_blacklist_blacklistedtoken (token_id, blacklisted_at) '
+                    'SELECT id, %s FROM token_blacklist_outstandingtoken WHERE id > '
+                    '(SELECT COALESCE(MAX(token_id), 0) FROM token_blacklist_blacklistedtoken)',
+                    [now],
+                )
+    return jtis[expired:]
+
+
+def time_lookups(check, jtis, lookups):
+    samples = []
+    unknown = [uuid.uuid4().hex for _ in range(lookups // 2)]
+    probes = random.sample(jtis, min(len(jtis), lookups - len(unknown))) + unknown
+    random.shuffle(probes)
+    for jti in probes:
+        began = time.perf_counter()
+        check(jti)
+        samples.append(time.perf_counter() - began)
+    return summarize(samples)
+
+
+def time_refreshes(user, refreshes, use_filter):
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from auth_app.revocation import revocation_filter
+    from auth_app.views import CustomTokenRefreshView
+
+    revocation_filter.enabled = use_filter
+    view = CustomTokenRefreshView.as_view()
+    factory = RequestFactory()
+    token = str(RefreshToken.for_user(user))
+    samples = []
+    for _ in range(refreshes):
+        request = factory.post('/auth/refresh/')
+        request.COOKIES['refresh'] = token
+        began = time.perf_counter()
+        response = view(request)
+        samples.append(time.perf_counter() - began)
+        assert response.status_code == 200, response.status_code
+        token = response.cookies['refresh'].value
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=1000000)
+    parser.add_argument('--expired', type=float, default=0.5, help='fraction of the tokens already expired')
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--refreshes', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=1000, help='compaction batch size')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django(TOKEN_REFRESH_GRACE_SECONDS='0')
+    from django.contrib.auth.models import User
+    from rest_framework.throttling import SimpleRateThrottle
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+    from auth_app.revocation import compact_token_blacklist, revocation_filter
+
+    SimpleRateThrottle.THROTTLE_RATES = {'user': None, 'anon': None}
+    user = User.objects.create_user('blacklist', 'blacklist@example.com')
+    began = time.perf_counter()
+    live = seed(args.tokens, args.expired, user.pk)
+    result = {'tokens': args.tokens, 'unexpired': len(live), 'seed_s': time.perf_counter() - began}
+
+    result['db_lookup'] = time_lookups(
+        lambda jti: BlacklistedToken.objects.filter(token__jti=jti).exists(), live, args.lookups,
+    )
+    tracemalloc.start()
+    began = time.perf_counter()
+    revocation_filter.rebuild()
+    result['filter_build_s'] = time.perf_counter() - began
+    result['filter_build_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    result['filter_entries'] = len(revocation_filter)
+    result['filter_mb'] = revocation_filter._fingerprints.itemsize * len(revocation_filter._fingerprints) / 2 ** 20
+    result['filter_lookup'] = time_lookups(revocation_filter.might_be_revoked, live, args.lookups)
+
+    result['refresh_without_filter'] = time_refreshes(user, args.refreshes, False)
+    result['refresh_with_filter'] = time_refreshes(user, args.refreshes, True)
+
+    began = time.perf_counter()
+    deleted = compact_token_blacklist(args.batch_size)
+    elapsed = time.perf_counter() - began
+    result['compaction'] = {'deleted': deleted, 'seconds': elapsed, 'tokens_per_s': deleted / elapsed if elapsed else 0}
+    result['db_lookup_after_compaction'] = time_lookups(
+        lambda jti: BlacklistedToken.objects.filter(token__jti=jti).exists(), live, args.lookups,
+    )
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Measures refresh storms: several tabs of each user refreshing the same refresh
+token at the same moment, with and without refresh coalescing
+(`TOKEN_REFRESH_GRACE_SECONDS`).
+
+The refresh view is driven from threads, like a threaded WSGI server. The tabs
+of a user wait on a barrier and then refresh together. Without coalescing,
+rotation blacklists the token, so every tab but the first gets 401 (and, in the
+browser, a forced re-login); with it, they all get the pair of the first
+rotation. Besides throughput, latency and the 401 count, the benchmark reports
+the rows written to the outstanding and blacklisted token tables per refresh.
+`--tabs 1` measures the cost of coalescing on refreshes that do not collide.
+
+Usage (from the backend folder):
+    python -m benchmarks.token_refresh --users 100 --tabs 4 --concurrency 16
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, summarize
+
+
+def seed_tokens(count):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    users = User.objects.bulk_create(
+        User(username=f'refresh{i}', email=f'refresh{i}@example.com') for i in range(count)
+    )
+    return [str(RefreshToken.for_user(user)) for user in users]
+
+
+def token_rows():
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    return OutstandingToken.objects.count() + BlacklistedToken.objects.count()
+
+
+def run(name, users, tabs, concurrency, grace):
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from django.test import RequestFactory
+    from auth_app.token_refresh import refresh_coalescer
+    from auth_app.views import CustomTokenRefreshView
+
+    refresh_coalescer.grace = grace
+    refresh_coalescer.cache.clear()
+    view = CustomTokenRefreshView.as_view()
+    factory = RequestFactory()
+    tokens = seed_tokens(users)
+    rows_before = token_rows()
+
+    def tab(user, barrier, results):
+        request = factory.post('/auth/refresh/')
+        request.COOKIES['refresh'] = tokens[user]
+        barrier.wait()
+        began = time.perf_counter()
+        response = view(request)
+        elapsed = time.perf_counter() - began
+        connections.close_all()
+        assert response.status_code in (200, 401), response.status_code
+        cookie = response.cookies['refresh'].value if response.status_code == 200 else None
+        results.append((user, response.status_code, elapsed, cookie))
+
+    def storm(user):
+        # The tabs of a user are released together by the barrier
+        barrier = threading.Barrier(tabs)
+        results = []
+        threads = [threading.Thread(target=tab, args=(user, barrier, results)) for _ in range(tabs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max(1, concurrency // tabs)) as pool:
+        results = [result for results in pool.map(storm, range(users)) for result in results]
+    elapsed = time.perf_counter() - began
+
+    issued = {}
+    for user, status, _, cookie in results:
+        if status == 200:
+            issued.setdefault(user, set()).add(cookie)
+    rows = token_rows() - rows_before
+    User.objects.filter(username__startswith='refresh').delete()
+    return {
+        'mode': name,
+        'refreshes': len(results),
+        'throughput_per_s': len(results) / elapsed,
+        'unauthorized': sum(status == 401 for _, status, _, _ in results),
+        # Tabs of a user ending up with different refresh tokens would overwrite each other's cookie
+        'users_with_diverging_tokens': sum(len(cookies) > 1 for cookies in issued.values()),
+        'token_rows_per_refresh': rows / len(results),
+        'latency': summarize([sample for _, _, sample, _ in results]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tabs', type=int, default=4, help='concurrent refreshes of each token')
+    parser.add_argument('--concurrency', type=int, default=16, help='refreshes in flight, i.e. concurrency / tabs users at a time')
+    parser.add_argument('--grace', type=float, default=5, help='TOKEN_REFRESH_GRACE_SECONDS of the coalesced run')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from rest_framework.throttling import SimpleRateThrottle
+    # Measure the refreshes, not the throttles
+    SimpleRateThrottle.THROTTLE_RATES = {'user': None, 'anon': None}
+    results = [
+        run('uncoalesced', args.users, args.tabs, args.concurrency, 0),
+        run('coalesced', args.users, args.tabs, args.concurrency, args.grace),
+    ]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
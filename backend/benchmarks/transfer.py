@@ -0,0 +1,87 @@
+"""
+Checks that to-do export and import run in constant memory.
+
+Exports `--rows` to-dos to a temporary file through the streaming exporter,
+then imports that file for another user, and reports throughput and the peak
+Python memory (tracemalloc) of each step. Run it with growing `--rows`: the
+peaks should stay flat while the row count grows.
+
+Usage (from the backend folder):
+    python -m benchmarks.transfer --rows 100000 --type csv
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django
+
+
+def seed(rows):
+    from django.contrib.auth.models import User
+    from auth_app.models import Todo
+
+    user = User.objects.create(username='exporter', email='exporter@example.com')
+    batch = 10000
+    for start in range(0, rows, batch):
+        Todo.objects.bulk_create(
+            Todo(user=user, text=f'exported todo {n}', completed=n % 2 == 0) for n in range(start, min(rows, start + batch))
+        )
+    return user
+
+
+def measure(step):
+    tracemalloc.start()
+    began = time.perf_counter()
+    count = step()
+    elapsed = time.perf_counter() - began
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'rows': count, 'seconds': elapsed, 'rows_per_s': count / elapsed, 'peak_mib': peak / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--type', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    # DEBUG keeps a log of every query, which would grow with the row count
+    db_path = setup_django(DEBUG='False')
+    from django.contrib.auth.models import User
+    from auth_app.transfer import PARSERS, TodoImporter, iter_export
+
+    exporter = seed(args.rows)
+    importer_user = User.objects.create(username='importer', email='importer@example.com')
+    fd, path = tempfile.mkstemp(suffix=f'.{args.type}')
+
+    def export():
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter_export(exporter, args.type):
+                f.write(chunk)
+        return args.rows
+
+    def import_():
+        with open(path, 'rb') as f:
+            return TodoImporter(importer_user).run(PARSERS[args.type](f))['imported']
+
+    results = {
+        'type': args.type,
+        'file_mib': None,
+        'export': measure(export),
+    }
+    results['file_mib'] = os.path.getsize(path) / 2 ** 20
+    results['import'] = measure(import_)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    os.remove(path)
+    os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Compares the todo API served by the sync DRF views through the WSGI handler
+with the async views served through the ASGI handler (`app.asgi`).
+
+Each side runs in its own process, since `ASYNC_API` picks the views when the
+URLconf is imported. Requests go through the full handler and middleware stack
+in process, without a network server: the WSGI side is driven from a thread
+pool, like a threaded WSGI server, the ASGI side from a single event loop, like
+one ASGI worker. The workload mixes list reads (80%), creates (10%) and toggles
+(10%) spread over several users.
+
+Usage (from the backend folder):
+    python -m benchmarks.wsgi_vs_asgi --requests 2000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, summarize
+
+
+def seed(users, todos_per_user):
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from auth_app.models import Todo
+
+    created = User.objects.bulk_create(
+        User(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(users)
+    )
+    Todo.objects.bulk_create(
+        Todo(user=user, text=f'todo {n}') for user in created for n in range(todos_per_user)
+    )
+    tokens = [str(RefreshToken.for_user(user).access_token) for user in created]
+    todo_ids = {
+        user.pk: list(Todo.objects.filter(user=user).values_list('id', flat=True)[:10]) for user in created
+    }
+    return [(token, todo_ids[user.pk]) for user, token in zip(created, tokens)]
+
+
+def plan(index, accounts):
+    """Returns `(method, path, token)` of the `index`-th request of the workload."""
+    token, todo_ids = accounts[index % len(accounts)]
+    kind = index % 10
+    if kind == 8:
+        return 'post', '/auth/todos/', token
+    if kind == 9:
+        return 'patch', f'/auth/todos/{todo_ids[index % len(todo_ids)]}/toggle/', token
+    return 'get', '/auth/todos/', token
+
+
+def send(client, method, path, token):
+    client.cookies['access'] = token
+    if method == 'post':
+        return client.post(path, json.dumps({'text': 'benchmark'}), content_type='application/json')
+    return getattr(client, method)(path)
+
+
+def run_wsgi(requests, concurrency, accounts):
+    import threading
+    from django.db import connections
+    from django.test import Client
+
+    local = threading.local()
+
+    def one(index):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        began = time.perf_counter()
+        response = send(local.client, *plan(index, accounts))
+        assert response.status_code < 400, response.status_code
+        return time.perf_counter() - began
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+        pool.map(lambda _: connections.close_all(), range(concurrency))
+    return samples, time.perf_counter() - began
+
+
+async def run_asgi(requests, concurrency, accounts):
+    from django.test import AsyncClient
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            began = time.perf_counter()
+            response = await send(AsyncClient(), *plan(index, accounts))
+            assert response.status_code < 400, response.status_code
+            return time.perf_counter() - began
+
+    began = time.perf_counter()
+    samples = await asyncio.gather(*(one(index) for index in range(requests)))
+    return list(samples), time.perf_counter() - began
+
+
+def child(args):
+    mode = args.mode
+    db_path = setup_django(ASYNC_API=str(mode == 'asgi'))
+    from django.conf import settings
+    from rest_framework.throttling import SimpleRateThrottle
+    settings.ALLOWED_HOSTS = ['testserver']
+    # Measure request handling, not the throttles
+    SimpleRateThrottle.THROTTLE_RATES = {'user': None, 'anon': None}
+    accounts = seed(args.users, args.todos)
+
+    if mode == 'asgi':
+        samples, elapsed = asyncio.run(run_asgi(args.requests, args.concurrency, accounts))
+    else:
+        samples, elapsed = run_wsgi(args.requests, args.concurrency, accounts)
+    os.remove(db_path)
+    return {
+        'server': mode,
+        'throughput_per_s': len(samples) / elapsed,
+        'latency': summarize(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--todos', type=int, default=100, help='todos seeded per user')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(child(args)))
+        return
+
+    results = []
+    for mode in ('wsgi', 'asgi'):
+        command = [sys.executable, '-m', 'benchmarks.wsgi_vs_asgi', '--mode', mode] + sys.argv[1:]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
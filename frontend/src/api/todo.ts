@@ -16,11 +16,21 @@ const mapTodo = (todo: BackendTodo): Todo => ({
     createdAt: todo.created_at,
   });
 
-// Fetch all todos for the logged-in user
-export const fetchTodos = async (): Promise<Todo[]> => {
-  const response = await API.get('/auth/todos/');
-  //console.log(response.data);
-  return response.data.map(mapTodo);
+interface TodoPage {
+  next: string | null;
+  results: BackendTodo[];
+}
+
+export interface TodoPageResult {
+  todos: Todo[];
+  next: string | null;
+}
+
+// Fetch one page of todos for the logged-in user, newest first.
+// Pass the `next` cursor of the previous page to load the following one.
+export const fetchTodos = async (url: string = '/auth/todos/'): Promise<TodoPageResult> => {
+  const response: { data: TodoPage } = await API.get(url);
+  return { todos: response.data.results.map(mapTodo), next: response.data.next };
 };
 
 // Create a new todo
@@ -13,6 +13,7 @@
  * - Uses `useTodoStore` for state management of todos.
  * - Utilizes `react-hook-form` for form handling and validation.
  * - Snackbar is used for user feedback on actions.
+ * - Loads the first page of todos on mount; a "Load more" button fetches the next page on demand.
  * - Responsive design is implemented for logout button and typography.
  *
  * @dependencies
@@ -71,7 +72,10 @@ const Dashboard = () => {
     setFilter,
     filter,
     fetchTodosFromAPI,
+    loadMoreTodos,
+    next,
     loading,
+    loadingMore,
     error,
   } = useTodoStore();
 
@@ -291,6 +295,21 @@ const Dashboard = () => {
               ))}
             </List>
 
+            {/* Load more */}
+            {next && (
+              <Box sx={{ textAlign: "center", mt: 2 }}>
+                <Button
+                  variant="text"
+                  size="small"
+                  sx={{ color: "#aaa" }}
+                  onClick={loadMoreTodos}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? <CircularProgress size={16} color="inherit" /> : "Load more"}
+                </Button>
+              </Box>
+            )}
+
             {filteredTodos.length === 0 && !loading && !error && (
               <Typography sx={{ color: "#aaa", textAlign: "center", mt: 2 }}>
                 Your todo list is empty — start by adding a task!
@@ -5,11 +5,14 @@
  * The store includes the following state properties:
  * - `todos`: An array of to-do items.
  * - `filter`: A string representing the current filter for displaying to-dos (e.g., "all", "completed", "active").
+ * - `next`: The cursor of the next page of to-dos, or null once the last page is loaded.
  * - `loading`: A boolean indicating whether an asynchronous operation is in progress.
+ * - `loadingMore`: A boolean indicating whether a further page is being loaded.
  * - `error`: A string or null representing the error message from the last failed operation.
  * 
  * The store also provides the following actions:
- * - `fetchTodosFromAPI`: Fetches to-dos from an API and updates the store.
+ * - `fetchTodosFromAPI`: Fetches the first page of to-dos from the API and replaces the list.
+ * - `loadMoreTodos`: Fetches the next page of to-dos and appends it to the list.
  * - `addTodo`: Adds a new to-do item to the store.
  * - `toggleTodo`: Toggles the completion status of a to-do item.
  * - `clearCompleted`: Removes all completed to-dos from the store.
@@ -40,26 +43,32 @@ type Filter = "all" | "active" | "completed";
 interface TodoState {
   todos: Todo[];
   filter: Filter;
+  next: string | null;
   loading: boolean;
+  loadingMore: boolean;
   error: string | null;
   fetchTodosFromAPI: () => Promise<void>;
+  loadMoreTodos: () => Promise<void>;
   addTodo: (text: string) => Promise<void>;
   toggleTodo: (id: number) => Promise<void>;
   clearCompleted: () => Promise<void>;
   setFilter: (filter: Filter) => void;
 }
 
-export const useTodoStore = create<TodoState>((set) => ({
+export const useTodoStore = create<TodoState>((set, get) => ({
   todos: [],
   filter: "all",
+  next: null,
   loading: false,
+  loadingMore: false,
   error: null,
 
   fetchTodosFromAPI: async () => {
     set({ loading: true, error: null });
     try {
-      const todos = await fetchTodos();
-      set({ todos: todos.sort((a, b) => new Date(b.createdAt).getTime() - new Date(a.createdAt).getTime()), loading: false });
+      // Pages come newest first, so they are appended as they are.
+      const { todos, next } = await fetchTodos();
+      set({ todos, next, loading: false });
 
     } catch (err: unknown) {
       const errorMessage = err instanceof Error ? err.message : "Failed to fetch todos";
@@ -67,6 +76,27 @@ export const useTodoStore = create<TodoState>((set) => ({
     }
   },
 
+  loadMoreTodos: async () => {
+    const { next, loadingMore } = get();
+    if (!next || loadingMore) return;
+    set({ loadingMore: true, error: null });
+    try {
+      const page = await fetchTodos(next);
+      set((state) => {
+        // A to-do added since the first page may shift the later pages by one.
+        const known = new Set(state.todos.map((todo) => todo.id));
+        return {
+          todos: [...state.todos, ...page.todos.filter((todo) => !known.has(todo.id))],
+          next: page.next,
+          loadingMore: false,
+        };
+      });
+    } catch (err: unknown) {
+      const errorMessage = err instanceof Error ? err.message : "Failed to load more todos";
+      set({ error: errorMessage, loadingMore: false });
+    }
+  },
+
   addTodo: async (text: string) => {
     try {
       const newTodo = await createTodo(text);